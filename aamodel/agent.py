@@ -25,7 +25,6 @@ class agent:
                                     # opportunity
     succeeded: bool                 # `True` iff this agent was allocated an
                                     # opportunity AND succeeded
-    success_prob: float             # Success probability for this agent
 
 
     # TODO: set default values of parameters
@@ -46,8 +45,6 @@ class agent:
         self.p_A = p_A
         self.p_D = p_D
 
-        self.success_prob = self.a * self.sigma + \
-                            int(self.is_privileged()) * self.tau
         assert 0 <= self.success_prob <= 1
 
         self.maybe_given = False
@@ -55,6 +52,13 @@ class agent:
         self.succeeded = False
 
 
+    # Success probability for this agent. It is computed from the current
+    # ability and privilege, which change from generation to generation.
+    @property
+    def success_prob(self) -> float:
+        return self.a * self.sigma + int(self.is_privileged()) * self.tau
+
+
     # Returns true iff this agent is privileged.
     def is_privileged(self) -> bool:
         return self.c == privilege.PRIVILEGED
@@ -66,12 +70,20 @@ class agent:
     def maybe_give_opportunity(self, theta_0: float, theta_1: float) -> bool:
         threshold = theta_1 if self.is_privileged() else theta_0
 
+        # See if the agent exceeds the threshold (i.e. gets the opportunity)
+        return self.allocate_opportunity(self.success_prob >= threshold)
+
+
+    # Gives an opportunity to this agent iff `given` is `True`, regardless of
+    # thresholds (used when the allocation is decided for the whole
+    # generation at once). Returns `True` if the opportunity is given and the
+    # agent succeeds, `False` otherwise.
+    def allocate_opportunity(self, given: bool) -> bool:
         # Mark that this agent was considered for an opportunity
         self.maybe_given = True
 
-        # See if the agent exceeds the threshold (i.e. gets the opportunity)
-        # and succeeds
-        self.given = self.success_prob >= threshold
+        # See if the agent gets the opportunity and succeeds
+        self.given = bool(given)
         self.succeeded = self.given and random() <= self.success_prob
         
         # If succeeded, moves up to privileged group, otherwise stays the same
@@ -0,0 +1,220 @@
+import numpy as np
+
+
+class policy_analysis:
+    """
+    Analyzes the long-run behaviour of the system under the optimal policies
+    found by `mdp_solver.run`, without simulation.
+
+    Under the optimal policies, every state has a single successor state, so
+    the dynamics are a map on the states. We answer questions about all
+    starting states at once with binary lifting ("pointer jumping"): we store
+    the state reached after `2^k` generations from every state, for
+    `k = 0, 1, ...`, and combine these jumps to follow any number of
+    generations `T` in `O(log T)` steps. Everything is vectorized over the
+    states, so each question takes `O(N log T)` work.
+
+    Attributes
+    ----------
+    solver : mdp_solver
+        The solver, after calling `run`. It can't be `stochastic`.
+    phi_0 : numpy.ndarray
+        A float array of shape `(N + 1,)` with all states, `phi_0[i] = i / N`.
+    successors : numpy.ndarray
+        An integer array of shape `(N + 1,)`. The entry `successors[i]` is the
+        state that state `i` transitions to under its optimal policy. With
+        interpolation, a transition is split between two states, and we take
+        the one with the larger weight.
+    jumps : List[numpy.ndarray]
+        The entry `jumps[k]` is an integer array of shape `(N + 1,)` with the
+        state reached after `2^k` generations from every state. It is extended
+        as needed.
+    """
+
+
+    def __init__(self, solver):
+        # With random transitions, a state has no single successor
+        if solver.stochastic:
+            raise ValueError("policy_analysis needs deterministic "
+                             "transitions, but the solver is stochastic")
+        self.solver = solver
+        self.phi_0 = np.arange(solver.N + 1) / solver.N
+
+        # Follow the optimal policies through the transitions of the solver,
+        # as in its tables `S` and `W` (an `analytic` solver has none)
+        policies = np.rint(solver.theta_0 * solver.discretization /
+                           solver.sigma).astype(int)
+        thetas = np.minimum(policies * solver.sigma / solver.discretization,
+                            solver.sigma)
+        scaled = solver._phi_0_new(self.phi_0, thetas) * solver.N
+        if solver.interpolate:
+            self.successors = np.minimum(scaled.astype(int), solver.N - 1)
+            weights = np.clip(scaled - self.successors, 0, 1)
+            self.successors += (weights >= 0.5).astype(int)
+        else:
+            self.successors = scaled.astype(int)
+        self.jumps = [self.successors]
+
+
+    # Makes sure that jumps of `2^k` generations are available.
+    def _extend(self, k):
+        while len(self.jumps) <= k:
+            self.jumps.append(self.jumps[-1][self.jumps[-1]])
+
+
+    # Returns the smallest `k` such that `2^k >= T`.
+    @staticmethod
+    def _levels(T):
+        return max(int(T - 1).bit_length(), 0)
+
+
+    def advance(self, T):
+        """
+        Returns an integer array of shape `(N + 1,)` with the state reached
+        after `T` generations from every state.
+        """
+        states = np.arange(self.solver.N + 1)
+        for k in range(int(T).bit_length()):
+            if (T >> k) & 1:
+                self._extend(k)
+                states = self.jumps[k][states]
+        return states
+
+
+    def limits(self):
+        """
+        Finds where every starting state ends up in the long run. Since there
+        are finitely many states, every trajectory eventually enters a cycle
+        (a fixed point being a cycle of length 1).
+
+        Returns
+        -------
+        representative, length : numpy.ndarray
+            Integer arrays of shape `(N + 1,)`. For every starting state,
+            `representative` is the smallest state of the cycle that it ends up
+            in, and `length` is the length of that cycle. States with
+            `length == 1` converge to the fixed point `representative`.
+        """
+        N = self.solver.N
+        # After at least `N + 1` generations, every trajectory is in its cycle
+        K = self._levels(N + 1)
+        self._extend(K)
+        in_cycle = self.jumps[K]
+
+        # The smallest state on each cycle: the minimum over `2^K >= N + 1`
+        # generations starting on the cycle covers the whole cycle.
+        smallest = np.arange(N + 1)
+        for k in range(K):
+            smallest = np.minimum(smallest, smallest[self.jumps[k]])
+        representative = smallest[in_cycle]
+
+        # The states that lie on cycles are exactly the states reached after
+        # `N + 1` or more generations.
+        on_cycle = np.zeros(N + 1, dtype = bool)
+        on_cycle[in_cycle] = True
+        lengths = np.bincount(smallest[on_cycle], minlength = N + 1)
+        return representative, lengths[representative]
+
+
+    def fixed_points(self):
+        """
+        Returns a sorted integer array with the states that are fixed points of
+        the dynamics, i.e. that stay the same under their optimal policy.
+        """
+        return np.flatnonzero(self.successors == np.arange(self.solver.N + 1))
+
+
+    def time_to_reach(self, threshold, T = None):
+        """
+        Finds the number of generations it takes every starting state to reach
+        `phi_0 <= threshold`, i.e. for the unprivileged fraction of the
+        population to drop to `threshold`.
+
+        Parameters
+        ----------
+        threshold : float
+            The target `phi_0`.
+        T : int (optional)
+            The largest number of generations to consider. By default, we use
+            `N + 1`, after which the state is periodic, so a state that is not
+            reached by then is never reached.
+
+        Returns
+        -------
+        times : numpy.ndarray
+            An integer array of shape `(N + 1,)`. The entry `times[i]` is the
+            first generation in which the trajectory from state `i` has
+            `phi_0 <= threshold` (0 if state `i` already does), or -1 if that
+            does not happen within `T` generations.
+        """
+        if T is None:
+            T = self.solver.N + 1
+        K = self._levels(T + 1)
+        self._extend(K)
+
+        # `reached[k][i]` tells whether the target is reached within the
+        # first `2^k` states (generations 0 to `2^k - 1`) starting from `i`
+        reached = [self.phi_0 <= threshold]
+        for k in range(K):
+            reached.append(reached[k] | reached[k][self.jumps[k]])
+
+        # Jump as far as possible without reaching the target
+        states = np.arange(self.solver.N + 1)
+        times = np.zeros(self.solver.N + 1, dtype = int)
+        for k in range(K, -1, -1):
+            jump = ~reached[k][states]
+            states = np.where(jump, self.jumps[k][states], states)
+            times += jump * (1 << k)
+
+        # If the target is never reached, we have jumped past all generations
+        return np.where(reached[0][states] & (times <= T), times, -1)
+
+
+    def discounted_sum(self, values, T, gamma = None):
+        """
+        Computes the discounted sum of `values` along the trajectory of every
+        starting state over `T` generations, i.e.
+        `sum(gamma^t * values[state_t] for t in range(T))`.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            A float array of shape `(N + 1,)` with a value for every state.
+        T : int
+            The number of generations.
+        gamma : float (optional)
+            The discount factor. By default, we use the one of the solver.
+
+        Returns
+        -------
+        sums : numpy.ndarray
+            A float array of shape `(N + 1,)`.
+        """
+        if gamma is None:
+            gamma = self.solver.gamma
+        # `sums[k][i]` is the discounted sum over `2^k` generations from `i`
+        sums = [np.asarray(values, dtype = float)]
+        for k in range(int(T).bit_length() - 1):
+            self._extend(k)
+            sums.append(sums[k] + gamma ** (1 << k) * sums[k][self.jumps[k]])
+
+        states = np.arange(self.solver.N + 1)
+        total = np.zeros(self.solver.N + 1, dtype = float)
+        discount = 1.0
+        for k in range(int(T).bit_length()):
+            if (T >> k) & 1:
+                self._extend(k)
+                total += discount * sums[k][states]
+                discount *= gamma ** (1 << k)
+                states = self.jumps[k][states]
+        return total
+
+
+    def discounted_mobility(self, T, gamma = None):
+        """
+        Computes the discounted upward mobility from every starting state over
+        `T` generations: the discounted sum of the drops in the unprivileged
+        fraction `phi_0` from each generation to the next.
+        """
+        drops = self.phi_0 - self.phi_0[self.successors]
+        return self.discounted_sum(drops, T, gamma)
@@ -0,0 +1,276 @@
+import argparse
+import bisect
+import json
+import numpy as np
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from aamodel.experiments.runner import solve
+from aamodel.experiments.spec import check_point, load_spec, normalize_point, \
+                                     DISTRIBUTION_KEYS, SOLVER_KEYS
+
+# Version of the atlas format, stored in the index
+ATLAS_VERSION = 1
+
+# Policies are in [0, 1] (they are at most `sigma`), and are stored as
+# `uint16` multiples of `1 / THETA_SCALE`. `INVALID` marks grid points whose
+# parameters are invalid (e.g. `sigma + tau > 1`).
+THETA_SCALE = 65534
+INVALID = 65535
+
+
+def _grid_axes(table):
+    """
+    Returns the axes of a grid solve `table`, as a list of `(key, values)`
+    for the entries that are lists.
+    """
+    dist = table.get("dist")
+    if dist not in DISTRIBUTION_KEYS:
+        raise ValueError("unknown distribution {!r}".format(dist))
+    keys = {**DISTRIBUTION_KEYS[dist], **SOLVER_KEYS}
+    axes = []
+    for key, values in table.items():
+        if not isinstance(values, list):
+            continue
+        if keys.get(key, (None,))[0] is not float:
+            raise ValueError("{!r} can't be an axis, only real model "
+                             "parameters can".format(key))
+        values = [float(value) for value in values]
+        if len(values) == 0 or np.any(np.diff(values) <= 0):
+            raise ValueError("the values of {!r} have to be increasing"
+                             .format(key))
+        axes.append((key, values))
+    if not axes:
+        raise ValueError("no axes (parameters with a list of values)")
+    return axes
+
+
+def build_atlas(directory, table, n_workers = None, verbose = True):
+    """
+    Solves a grid of parameters and stores the optimal policies and state
+    values of all grid points as an atlas, which `policy_atlas` answers
+    queries for in between grid points from.
+
+    The atlas is a directory with two `.npy` arrays of shape
+    `(*grid_shape, N + 1)`, which are memory-mapped when the atlas is loaded:
+    `theta_0.npy` with the policies quantized to `uint16` (see
+    `THETA_SCALE`), and `V.npy` with the state values as `float32`. The JSON
+    index `atlas.json` describes the axes and the fixed parameters, and is
+    written last, so an interrupted build leaves no usable atlas behind.
+    Grid points with invalid parameters (see `experiments.spec.check_point`)
+    are not solved, and stored as missing (`NaN` when queried).
+
+    Parameters
+    ----------
+    directory : str
+        The directory of the atlas. It is created if it doesn't exist.
+    table : Dict[str, Any]
+        A grid solve, as in an experiment spec (see
+        `experiments.spec.load_spec`). The axes of the atlas are the real
+        model parameters (e.g. `sigma`, `tau`, `alpha`, `gamma`, `sd`) that
+        are given a list of increasing values, in the order of the table.
+    n_workers : int or None (optional)
+        The number of worker processes. `None` uses all cores, while 1 solves
+        everything in the current process.
+    verbose : bool (optional)
+        Whether to print progress.
+
+    Returns
+    -------
+    index_path : str
+        The path of the JSON index.
+    """
+    axes = _grid_axes(table)
+    names = [key for key, _ in axes]
+    shape = tuple(len(values) for _, values in axes)
+    indices = list(np.ndindex(*shape))
+    points = [normalize_point({**table,
+                               **{key: values[i]
+                                  for (key, values), i in zip(axes, index)}})
+              for index in indices]
+    N = points[0]["N"]
+    fixed = {key: value for key, value in points[0].items()
+             if key not in names}
+
+    tasks = []
+    for index, point in zip(indices, points):
+        try:
+            check_point(point)
+            tasks.append((index, point))
+        except ValueError:
+            pass
+
+    os.makedirs(directory, exist_ok = True)
+    index_path = os.path.join(directory, "atlas.json")
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    theta_0 = np.lib.format.open_memmap(
+                  os.path.join(directory, "theta_0.npy"), mode = "w+",
+                  dtype = np.uint16, shape = shape + (N + 1,))
+    V = np.lib.format.open_memmap(
+            os.path.join(directory, "V.npy"), mode = "w+",
+            dtype = np.float32, shape = shape + (N + 1,))
+    theta_0[...] = INVALID
+    V[...] = np.nan
+
+    if verbose:
+        print("{} grid points, {} valid".format(len(points), len(tasks)))
+    start = time.perf_counter()
+    solves = [point for _, point in tasks]
+    if n_workers == 1:
+        results = map(solve, solves)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers = n_workers)
+        chunksize = max(len(solves) // (4 * (n_workers or os.cpu_count())),
+                        1)
+        results = pool.map(solve, solves, chunksize = chunksize)
+    try:
+        for k, ((index, _), result) in enumerate(zip(tasks, results)):
+            theta_0[index] = np.rint(result["theta_0"] * THETA_SCALE)
+            V[index] = result["V"]
+            if verbose and (k + 1) % 100 == 0:
+                print("  solved {} / {}".format(k + 1, len(tasks)))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    theta_0.flush()
+    V.flush()
+    del theta_0, V
+    if verbose:
+        print("Solved in {:.1f} s".format(time.perf_counter() - start))
+
+    index = dict(version = ATLAS_VERSION,
+                 axes = [[key, values] for key, values in axes],
+                 fixed = fixed,
+                 N = N,
+                 theta_scale = THETA_SCALE,
+                 invalid = INVALID)
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, indent = 1)
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+class policy_atlas:
+    """
+    A precomputed atlas of optimal policies and state values (see
+    `build_atlas`). `query` interpolates them multilinearly between the grid
+    points, reading only the `2 ** n_axes` neighboring grid points from the
+    memory-mapped arrays.
+
+    Attributes
+    ----------
+    axes : List[Tuple[str, List[float]]]
+        The parameters of the grid and their values.
+    fixed : Dict[str, Any]
+        The parameters that are the same for all grid points.
+    N : int
+        The number of agents of the solves.
+    states : numpy.ndarray
+        The states (`phi_0`), of shape `(N + 1,)`.
+    """
+
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, "atlas.json")) as f:
+            index = json.load(f)
+        if index["version"] != ATLAS_VERSION:
+            raise ValueError("unsupported atlas version {}"
+                             .format(index["version"]))
+        self.axes = [(key, values) for key, values in index["axes"]]
+        self.fixed = index["fixed"]
+        self.N = index["N"]
+        self.states = np.arange(self.N + 1) / self.N
+        self._invalid = index["invalid"]
+        self._scale = 1 / index["theta_scale"]
+        self._theta_0 = np.load(os.path.join(directory, "theta_0.npy"),
+                                mmap_mode = "r")
+        self._V = np.load(os.path.join(directory, "V.npy"), mmap_mode = "r")
+
+
+    # Returns the slices of the neighboring grid points of `params` and the
+    # interpolation weights of the upper neighbors (`None` for axes where
+    # `params` is on a grid point).
+    def _locate(self, params):
+        unknown = set(params) - {key for key, _ in self.axes}
+        if unknown:
+            raise ValueError("unknown axes {}".format(sorted(unknown)))
+        slices = []
+        weights = []
+        for key, values in self.axes:
+            if key not in params:
+                if len(values) > 1:
+                    raise ValueError("missing {!r}".format(key))
+                x = values[0]
+            else:
+                x = float(params[key])
+            if not values[0] <= x <= values[-1]:
+                raise ValueError("{} = {} is outside of [{}, {}]".format(
+                                 key, x, values[0], values[-1]))
+            i = bisect.bisect_right(values, x) - 1
+            if values[i] == x:
+                slices.append(slice(i, i + 1))
+                weights.append(None)
+            else:
+                slices.append(slice(i, i + 2))
+                weights.append((x - values[i]) / (values[i + 1] - values[i]))
+        return tuple(slices), weights
+
+
+    @staticmethod
+    def _interpolate(block, weights):
+        for w in weights:
+            if w is None:
+                block = block[0]
+            else:
+                block = block[0] + w * (block[1] - block[0])
+        return block
+
+
+    def query(self, **params):
+        """
+        Returns the optimal policies and state values for the parameters
+        `params` (one value for every axis of the atlas; axes with a single
+        value can be left out), interpolated multilinearly between the grid
+        points. Raises `ValueError` for parameters outside of the grid.
+
+        If any of the neighboring grid points has invalid parameters, the
+        result is `NaN`.
+
+        Returns
+        -------
+        theta_0, V : numpy.ndarray
+            Float arrays of shape `(N + 1,)`, against `states`.
+        """
+        slices, weights = self._locate(params)
+        theta_0 = self._theta_0[slices].astype(float)
+        theta_0[theta_0 == self._invalid] = np.nan
+        theta_0 = self._interpolate(theta_0, weights) * self._scale
+        V = self._interpolate(self._V[slices].astype(float), weights)
+        return theta_0, V
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog = "python -m aamodel.atlas",
+        description = "Solves the grid of a solve from an experiment spec "
+                      "and stores it as a policy atlas.")
+    parser.add_argument("spec", help = "experiment spec file")
+    parser.add_argument("solve", help = "name of the grid solve in the spec")
+    parser.add_argument("--out", default = "atlas",
+                        help = "atlas directory (default: atlas)")
+    parser.add_argument("-j", "--jobs", type = int, default = None,
+                        help = "number of worker processes (default: all "
+                               "cores)")
+    args = parser.parse_args()
+
+    spec = load_spec(args.spec)
+    table = {**spec["defaults"], **spec["solves"][args.solve]}
+    print(build_atlas(args.out, table, n_workers = args.jobs))
+
+
+if __name__ == "__main__":
+    main()
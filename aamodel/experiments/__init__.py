@@ -0,0 +1,8 @@
+# Declarative experiments. An experiment is a TOML or JSON spec with solves and
+# plots (see `spec.load_spec`). Run them with
+# `python -m aamodel.experiments SPEC [SPEC ...]`.
+from aamodel.experiments.cache import result_cache
+from aamodel.experiments.runner import plan, render_plots, run_experiments, \
+                                       run_solves, solve
+from aamodel.experiments.spec import check_point, expand_solve, \
+                                     load_spec, normalize_point
@@ -0,0 +1,49 @@
+import argparse
+
+from aamodel.experiments.cache import result_cache
+from aamodel.experiments.runner import plan, run_experiments
+from aamodel.experiments.spec import load_spec
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog = "python -m aamodel.experiments",
+        description = "Runs experiment specs: solves what is not cached yet, "
+                      "then renders the plots that are missing or out of "
+                      "date.")
+    parser.add_argument("specs", nargs = "+", metavar = "SPEC",
+                        help = "experiment spec files (.toml or .json)")
+    parser.add_argument("--data", default = "data",
+                        help = "result cache directory (default: data)")
+    parser.add_argument("--plots", default = "plots",
+                        help = "plot directory (default: plots)")
+    parser.add_argument("-j", "--jobs", type = int, default = None,
+                        help = "number of worker processes (default: all "
+                               "cores)")
+    parser.add_argument("--no-tex", action = "store_true",
+                        help = "render text without LaTeX")
+    parser.add_argument("--force", action = "store_true",
+                        help = "re-render all plots")
+    parser.add_argument("--dry-run", action = "store_true",
+                        help = "only print the planned solves")
+    args = parser.parse_args()
+
+    specs = [load_spec(path) for path in args.specs]
+    if args.dry_run:
+        cache = result_cache(args.data)
+        for key, point in plan(specs).items():
+            print("{} {:6} {}".format(key,
+                                      "cached" if point in cache else "new",
+                                      point))
+        return
+
+    run_experiments(specs,
+                    data = args.data,
+                    plots = args.plots,
+                    n_workers = args.jobs,
+                    usetex = not args.no_tex,
+                    force = args.force)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import numpy as np
+import os
+
+
+# Part of every cache key. Bump it when a change to the solver changes its
+# results, so that old results are not reused.
+CACHE_VERSION = 2
+
+# Options of `mdp_solver.run` that only change how the result is computed, not
+# the result itself (up to `epsilon`), so they are left out of the keys
+KEYLESS_KEYS = ("monotone", "backend")
+
+
+class result_cache:
+    """
+    A directory of solver results, keyed by a hash of the solve.
+
+    Every result is stored in `<directory>/<key>.npz`, with the arrays
+    `states`, `theta_0`, `theta_1` and `V`, and the solve itself (as JSON in
+    `point`). Results are written to a temporary file first and then renamed,
+    so that concurrent writers and interrupted runs never leave partial
+    results behind.
+
+    Attributes
+    ----------
+    directory : str
+        The directory of the cache. It is created if it doesn't exist.
+    """
+
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok = True)
+
+
+    @staticmethod
+    def key(point):
+        """
+        Returns the key of `point`, a hash of its normalized entries (see
+        `spec.expand_solve`), except for `KEYLESS_KEYS`, and of
+        `CACHE_VERSION`. Solves that only differ in `KEYLESS_KEYS` share
+        their result.
+        """
+        point = {key: value for key, value in point.items()
+                 if key not in KEYLESS_KEYS}
+        text = json.dumps({"version": CACHE_VERSION, "point": point},
+                          sort_keys = True)
+        return hashlib.sha256(text.encode()).hexdigest()[:20]
+
+
+    def path(self, point):
+        return os.path.join(self.directory, self.key(point) + ".npz")
+
+
+    def __contains__(self, point):
+        return os.path.exists(self.path(point))
+
+
+    def load(self, point):
+        """
+        Returns the result of `point` as a dictionary of arrays, or `None` if
+        it is not in the cache.
+        """
+        try:
+            with np.load(self.path(point)) as data:
+                return {name: data[name]
+                        for name in ("states", "theta_0", "theta_1", "V")}
+        except FileNotFoundError:
+            return None
+
+
+    def store(self, point, result):
+        """
+        Stores `result`, a dictionary with the arrays `states`, `theta_0`,
+        `theta_1` and `V`, as the result of `point`.
+        """
+        path = self.path(point)
+        temp = "{}.{}.tmp".format(path, os.getpid())
+        with open(temp, "wb") as f:
+            np.savez(f, point = json.dumps(point, sort_keys = True), **result)
+        os.replace(temp, path)
@@ -0,0 +1,311 @@
+import hashlib
+import json
+import numpy as np
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from aamodel.experiments.cache import result_cache
+from aamodel.experiments.spec import expand_solve, RUN_KEYS, SOLVER_KEYS
+from aamodel.normal_distribution import normal_distribution
+from aamodel.solver import mdp_solver
+from aamodel.uniform_distribution import uniform_distribution
+
+
+def build_solver(point):
+    """
+    Returns the `mdp_solver` for `point` (see `spec.expand_solve`).
+    """
+    if point["dist"] == "uniform":
+        dist = uniform_distribution(point["a"], point["b"])
+    else:
+        dist = normal_distribution(point["mu"], point["sd"])
+    return mdp_solver(dist = dist,
+                      **{key: point[key] for key in SOLVER_KEYS})
+
+
+def solve(point):
+    """
+    Solves `point`, and returns the result as a dictionary with the arrays
+    `states`, `theta_0`, `theta_1` and `V`.
+    """
+    solver = build_solver(point)
+    states, theta_0, theta_1 = solver.run(
+        verbose = False, **{key: point[key] for key in RUN_KEYS})
+    return dict(states = states, theta_0 = theta_0, theta_1 = theta_1,
+                V = solver.V)
+
+
+def plan(specs):
+    """
+    Returns the unique solves that `specs` need, as a dictionary from cache
+    key to point. Solves shared between (or within) specs appear only once.
+    """
+    points = {}
+    for spec in specs:
+        for name in spec["solves"]:
+            for point in expand_solve(spec, name):
+                points[result_cache.key(point)] = point
+    return points
+
+
+def run_solves(points, cache, n_workers = None, verbose = True):
+    """
+    Makes sure that the results of all `points` (as returned by `plan`) are in
+    `cache`, solving the missing ones in parallel in a process pool. Every
+    result is stored as soon as it is done, so an interrupted run keeps its
+    finished solves.
+
+    Parameters
+    ----------
+    points : Dict[str, Dict[str, Any]]
+    cache : result_cache
+    n_workers : int or None (optional)
+        The number of worker processes. `None` uses all cores, while 1 solves
+        everything in the current process.
+    verbose : bool (optional)
+        Whether to print progress.
+
+    Returns
+    -------
+    n_solved : int
+        The number of solves that were not cached.
+    """
+    missing = [point for point in points.values() if point not in cache]
+    if verbose:
+        print("{} unique solves, {} cached, {} to run".format(
+              len(points), len(points) - len(missing), len(missing)))
+    if not missing:
+        return 0
+
+    start = time.perf_counter()
+    if n_workers == 1:
+        for point in missing:
+            cache.store(point, solve(point))
+            if verbose:
+                print("  solved {}".format(cache.key(point)))
+    else:
+        with ProcessPoolExecutor(max_workers = n_workers) as pool:
+            futures = {pool.submit(solve, point): point for point in missing}
+            for future in as_completed(futures):
+                cache.store(futures[future], future.result())
+                if verbose:
+                    print("  solved {}".format(cache.key(futures[future])))
+    if verbose:
+        print("Solved in {:.1f} s".format(time.perf_counter() - start))
+    return len(missing)
+
+
+# Returns the quantity `y` of a result, against `phi_0`.
+def _quantity(result, y, point):
+    if y == "policy_diff":
+        return np.minimum(result["theta_1"] - result["theta_0"],
+                          point["sigma"] - result["theta_0"])
+    return result[y]
+
+
+# Returns the plots of `spec`, as a list of `(plot, lines)`, where `plot` is
+# the plot table with `name` and `title` formatted, and `lines` is a list of
+# `(label, point)`.
+def _expand_plots(spec):
+    expanded = []
+    for plot in spec["plots"]:
+        each = plot.get("each")
+        for fixed in (expand_solve(spec, each) if each else [{}]):
+            lines = []
+            for series in plot.get("series", []):
+                if series["solve"] == each:
+                    series_points = [fixed]
+                else:
+                    series_points = expand_solve(spec, series["solve"])
+                for point in series_points:
+                    label = series.get("label", series["solve"])
+                    lines.append((label.format(**point), point))
+            formatted = dict(plot,
+                             name = plot["name"].format(**fixed),
+                             title = plot.get("title", "").format(**fixed))
+            expanded.append((formatted, lines))
+    return expanded
+
+
+# Returns the figure to draw for every plot of `spec`, as a dictionary with the
+# output `path`, the `fingerprint` of the figure and the `figure` itself
+# (texts and lines, with their data), which is all a worker needs to draw it.
+def _figures(spec, cache, directory, usetex, extension):
+    figures = []
+    for plot, lines in _expand_plots(spec):
+        figure = dict(title = plot["title"],
+                      xlabel = plot.get("xlabel", r"$\phi_0$"),
+                      ylabel = plot.get("ylabel", plot["y"]),
+                      legend = plot.get("legend", "upper right"),
+                      usetex = usetex,
+                      lines = [])
+        for label, point in lines:
+            result = cache.load(point)
+            y = _quantity(result, plot["y"], point)
+            figure["lines"].append((label, result["states"][1:], y[1:]))
+
+        # The fingerprint covers everything that ends up in the figure
+        h = hashlib.sha256(json.dumps(
+                {key: value for key, value in figure.items()
+                 if key != "lines"}, sort_keys = True).encode())
+        for label, x, y in figure["lines"]:
+            h.update(label.encode())
+            h.update(np.ascontiguousarray(x, dtype = float).tobytes())
+            h.update(np.ascontiguousarray(y, dtype = float).tobytes())
+
+        path = os.path.join(directory, "{}_{}.{}".format(
+                                       spec["name"], plot["name"], extension))
+        figures.append(dict(path = path,
+                            fingerprint = h.hexdigest(),
+                            figure = figure))
+    return figures
+
+
+# Draws `figure` into `path`. Runs in the worker processes of `render_plots`,
+# or in the calling process with one worker, so it draws on its own Agg canvas
+# instead of going through `pyplot`, which would change the global backend.
+def _draw(path, figure):
+    import matplotlib
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    rc = {"figure.figsize": (5, 5)}
+    if figure["usetex"]:
+        rc.update({"text.usetex": True,
+                   "font.family": "serif",
+                   "font.serif": ["Computer Modern"]})
+    with matplotlib.rc_context(rc):
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        ax = fig.subplots()
+        for label, x, y in figure["lines"]:
+            ax.plot(x, y, label = label)
+        ax.set_title(figure["title"])
+        ax.set_xlabel(figure["xlabel"])
+        ax.set_ylabel(figure["ylabel"])
+        ax.legend(loc = figure["legend"])
+        # Write to a temporary file first, so that an interrupted run never
+        # leaves a partial plot behind
+        root, extension = os.path.splitext(path)
+        temp = "{}.{}.tmp{}".format(root, os.getpid(), extension)
+        fig.savefig(temp)
+    os.replace(temp, path)
+    return path
+
+
+def _load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _store_manifest(path, manifest):
+    temp = "{}.{}.tmp".format(path, os.getpid())
+    with open(temp, "w") as f:
+        json.dump(manifest, f, indent = 1, sort_keys = True)
+    os.replace(temp, path)
+
+
+def render_plots(specs,
+                 cache,
+                 directory = "plots",
+                 usetex = True,
+                 force = False,
+                 extension = "pdf",
+                 n_workers = None,
+                 verbose = True):
+    """
+    Renders the plots of `specs` from the results in `cache` into
+    `<directory>/<spec name>_<plot name>.<extension>`. This requires
+    `matplotlib`.
+
+    Every plot has a fingerprint: a hash of its data (the plotted arrays) and
+    its style (title, labels, legend, `usetex`). The fingerprints of the
+    rendered plots are kept in `<directory>/manifest.json`, and only plots
+    that are missing or whose fingerprint changed are rendered again (all of
+    them, with `force`). The stale plots are rendered in parallel in a process
+    pool, since rendering (especially with LaTeX) is slow and single-threaded.
+
+    Parameters
+    ----------
+    specs : List[Dict[str, Any]]
+        The experiment specs (see `spec.load_spec`).
+    cache : result_cache
+        The result cache, with the results of all solves of `specs`.
+    directory, usetex, force, extension
+        See above.
+    n_workers : int or None (optional)
+        The number of worker processes. `None` uses all cores, while 1 renders
+        everything in the current process.
+    verbose : bool (optional)
+        Whether to print progress.
+
+    Returns
+    -------
+    paths : List[str]
+        The paths of the rendered plots.
+    """
+    os.makedirs(directory, exist_ok = True)
+    manifest_path = os.path.join(directory, "manifest.json")
+    manifest = _load_manifest(manifest_path)
+
+    stale = []
+    for spec in specs:
+        for figure in _figures(spec, cache, directory, usetex, extension):
+            name = os.path.basename(figure["path"])
+            if force or not os.path.exists(figure["path"]) or \
+               manifest.get(name) != figure["fingerprint"]:
+                stale.append(figure)
+    if verbose:
+        print("{} plots to render".format(len(stale)))
+
+    # Record every plot as soon as it is rendered, so that an interrupted run
+    # keeps the finished ones
+    def done(figure):
+        manifest[os.path.basename(figure["path"])] = figure["fingerprint"]
+        _store_manifest(manifest_path, manifest)
+        if verbose:
+            print("  plotted {}".format(figure["path"]))
+
+    if n_workers == 1:
+        for figure in stale:
+            _draw(figure["path"], figure["figure"])
+            done(figure)
+    elif stale:
+        with ProcessPoolExecutor(max_workers = n_workers) as pool:
+            futures = {pool.submit(_draw, figure["path"], figure["figure"]):
+                       figure for figure in stale}
+            for future in as_completed(futures):
+                future.result()
+                done(futures[future])
+    return [figure["path"] for figure in stale]
+
+
+def run_experiments(specs,
+                    data = "data",
+                    plots = "plots",
+                    n_workers = None,
+                    usetex = True,
+                    force = False,
+                    verbose = True):
+    """
+    Runs the experiments `specs` (as returned by `spec.load_spec`): plans the
+    unique solves of all specs, runs the ones that are not in the result cache
+    in `data`, and renders the stale plots into `plots` (see `render_plots`).
+
+    Returns
+    -------
+    paths : List[str]
+        The paths of the rendered plots.
+    """
+    cache = result_cache(data)
+    run_solves(plan(specs), cache, n_workers = n_workers, verbose = verbose)
+    return render_plots(specs, cache,
+                        directory = plots,
+                        usetex = usetex,
+                        force = force,
+                        n_workers = n_workers,
+                        verbose = verbose)
@@ -0,0 +1,157 @@
+import itertools
+import json
+import os
+import tomllib
+
+
+# The keys of a solve, with their types and defaults (`None` means required).
+# A solve is a flat table: the distribution, its parameters, the parameters of
+# `mdp_solver`, and the options of `mdp_solver.run`.
+DISTRIBUTION_KEYS = {
+    "uniform": {"a": (float, 0.0), "b": (float, 1.0)},
+    "normal": {"mu": (float, 0.5), "sd": (float, None)},
+}
+SOLVER_KEYS = {
+    "sigma": (float, None),
+    "tau": (float, None),
+    "p_A": (float, None),
+    "p_D": (float, None),
+    "N": (int, None),
+    "gamma": (float, None),
+    "alpha": (float, None),
+    "discretization": (int, 2000),
+    "interpolate": (bool, False),
+}
+RUN_KEYS = {
+    "epsilon": (float, 1e-4),
+    "monotone": (bool, False),
+    "backend": (str, "numpy"),
+}
+
+# The quantities that can be plotted against `phi_0`
+PLOT_QUANTITIES = ("theta_0", "theta_1", "policy_diff", "V")
+
+
+def load_spec(path):
+    """
+    Loads an experiment spec from a TOML (`.toml`) or JSON (`.json`) file.
+
+    A spec has the following entries.
+
+    name : str (optional)
+        Prefix of the plot files. Defaults to the file name without extension.
+    defaults : table (optional)
+        Keys shared by all solves of the spec.
+    solves : table
+        Named solves. Each solve is a flat table with `dist` (`"uniform"` or
+        `"normal"`), the distribution parameters (`a`, `b` or `mu`, `sd`), the
+        `mdp_solver` parameters (`sigma`, `tau`, `p_A`, `p_D`, `N`, `gamma`,
+        `alpha`, `discretization`, `interpolate`) and the `run` options
+        (`epsilon`, `monotone`, `backend`). Any key can be given a list of
+        values instead, in which case the solve stands for the grid of all
+        combinations.
+    plots : array of tables
+        Each plot has a `name`, the quantity `y` to plot against `phi_0` (one
+        of `PLOT_QUANTITIES`), a list of `series` (tables with a `solve` and a
+        `label`), and optionally `title`, `xlabel`, `ylabel` and `legend` (the
+        legend location). A series of a grid solve has one line per grid
+        point. With `each = "<solve>"`, there is a plot per grid point of that
+        solve instead. The name, title and labels are formatted with the grid
+        point (`str.format`, e.g. `"sd = {sd}"`), so literal braces have to be
+        doubled.
+
+    Returns
+    -------
+    spec : Dict[str, Any]
+        The spec, validated (including every grid point, see `check_point`),
+        with `name` filled in.
+    """
+    with open(path, "rb") as f:
+        if path.endswith(".json"):
+            spec = json.load(f)
+        else:
+            spec = tomllib.load(f)
+    spec.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    spec.setdefault("defaults", {})
+    spec.setdefault("plots", [])
+    if not spec.get("solves"):
+        raise ValueError("{}: no solves".format(path))
+
+    for plot in spec["plots"]:
+        if plot.get("y") not in PLOT_QUANTITIES:
+            raise ValueError("{}: plot {!r} has to plot one of {}".format(
+                             path, plot.get("name"), PLOT_QUANTITIES))
+        solves = [series["solve"] for series in plot.get("series", [])]
+        if "each" in plot:
+            solves.append(plot["each"])
+        for solve in solves:
+            if solve not in spec["solves"]:
+                raise ValueError("{}: plot {!r} uses unknown solve {!r}"
+                                 .format(path, plot.get("name"), solve))
+
+    # Expanding the grids checks all solves, and every point is checked
+    # against the ranges of `mdp_solver` before any of them is solved
+    for name in spec["solves"]:
+        try:
+            for point in expand_solve(spec, name):
+                check_point(point)
+        except ValueError as e:
+            raise ValueError("{}: solve {!r}: {}".format(path, name, e))
+    return spec
+
+
+def normalize_point(table):
+    """
+    Returns a complete, normalized solve (a "point") from a table of scalars
+    (see `load_spec`): every key present, with its canonical type, so that
+    equal solves have equal points regardless of how they were written (e.g.
+    `0` vs `0.0`). Raises `ValueError` for invalid tables.
+    """
+    dist = table.get("dist")
+    if dist not in DISTRIBUTION_KEYS:
+        raise ValueError("unknown distribution {!r}".format(dist))
+    keys = {**DISTRIBUTION_KEYS[dist], **SOLVER_KEYS, **RUN_KEYS}
+    unknown = set(table) - set(keys) - {"dist"}
+    if unknown:
+        raise ValueError("unknown keys {}".format(sorted(unknown)))
+
+    point = {"dist": dist}
+    for key, (kind, default) in keys.items():
+        value = table.get(key, default)
+        if value is None:
+            raise ValueError("missing {!r}".format(key))
+        point[key] = kind(value)
+    return point
+
+
+def check_point(point):
+    """
+    Raises `ValueError` if the parameters of a normalized solve `point` are
+    outside the ranges that `mdp_solver` accepts, or if it has no policy to
+    choose (`alpha` of 0 or 1).
+    """
+    for key in ("sigma", "tau", "p_A", "p_D"):
+        if not 0 <= point[key] <= 1:
+            raise ValueError("{} has to be in [0, 1]".format(key))
+    if point["sigma"] + point["tau"] > 1:
+        raise ValueError("sigma + tau has to be at most 1")
+    if not (0 < point["gamma"] < 1 and 0 < point["alpha"] < 1):
+        raise ValueError("gamma and alpha have to be in (0, 1)")
+    if point["dist"] == "normal" and point["sd"] <= 0:
+        raise ValueError("sd has to be positive")
+    if point["N"] < 1 or point["discretization"] < 1:
+        raise ValueError("N and discretization have to be positive")
+
+
+def expand_solve(spec, name):
+    """
+    Returns the list of points of solve `name` of `spec`: one point for a
+    plain solve, and one point per combination of values for a grid solve.
+    Points are complete dictionaries of all solve keys (see `load_spec`).
+    """
+    table = {**spec["defaults"], **spec["solves"][name]}
+    grid = [key for key, value in table.items() if isinstance(value, list)]
+    points = []
+    for values in itertools.product(*(table[key] for key in grid)):
+        points.append(normalize_point({**table, **dict(zip(grid, values))}))
+    return points
@@ -0,0 +1,189 @@
+import argparse
+import functools
+import json
+import numpy as np
+import os
+
+from aamodel.experiments.cache import result_cache
+from aamodel.experiments.runner import solve
+from aamodel.experiments.spec import expand_solve, load_spec
+from aamodel.population import population, normal_abilities, \
+                               uniform_abilities, GIVEN, SUCCEEDED
+
+# Flags of the agents in the exported snapshots (one byte per agent)
+PRIVILEGED = 4                      # The agent is privileged at the start of
+                                    # the generation
+# `GIVEN` and `SUCCEEDED` (from `population`) tell what happened to the agent
+# during the generation.
+
+# Version of the export format, stored in the index
+EXPORT_VERSION = 1
+
+
+def abilities_for(point):
+    """
+    Returns the ability sampler (see `population`) for the distribution of a
+    solve `point` (see `experiments.spec.expand_solve`).
+    """
+    if point["dist"] == "normal":
+        return functools.partial(normal_abilities, point["mu"], point["sd"])
+    return uniform_abilities
+
+
+def simulate(states, theta_0, theta_1, sigma, tau, p_A, p_D, n_agents, T,
+             n_privileged = None, a_dist = uniform_abilities, seed = None):
+    """
+    Simulates `n_agents` agents for `T` generations under the policies of a
+    solved `mdp_solver`, using the vectorized `population`. In every
+    generation, the thresholds are those of the solver state closest to the
+    current `phi_0`.
+
+    Parameters
+    ----------
+    states, theta_0, theta_1 : numpy.ndarray
+        The states and the optimal policies, as returned by `mdp_solver.run`.
+    sigma, tau, p_A, p_D
+        The model parameters (see `mdp_solver`).
+    n_agents : int
+        The number of agents.
+    T : int
+        The number of generations.
+    n_privileged : int (optional)
+        The number of privileged agents in the first generation. By default,
+        half of the agents are privileged.
+    a_dist : Callable[[numpy.random.Generator, int], numpy.ndarray] (optional)
+        The sampler for abilities (see `population`).
+    seed : int (optional)
+        The seed of the simulation.
+
+    Returns
+    -------
+    snapshots : numpy.ndarray
+        A `uint8` array of shape `(T + 1, n_agents)` with the flags of every
+        agent in every generation (`PRIVILEGED`, `GIVEN` and `SUCCEEDED`). The
+        last row is the population after `T` generations, so it only has
+        `PRIVILEGED` flags.
+    generations : List[Dict[str, float]]
+        For every row of `snapshots`, the `phi_0` at the start of the
+        generation and, except for the last row, the thresholds used and the
+        number of successes.
+    """
+    if n_privileged is None:
+        n_privileged = n_agents // 2
+    p = population(a_dist = a_dist,
+                   sigma = sigma,
+                   tau = tau,
+                   n_privileged = n_privileged,
+                   p_A = p_A,
+                   p_D = p_D,
+                   N = n_agents,
+                   seed = seed)
+    N = len(states) - 1
+
+    snapshots = np.zeros((T + 1, n_agents), dtype = np.uint8)
+    generations = []
+    for t in range(T):
+        i = int(round(p.phi_0 * N))
+        generation = dict(phi_0 = p.phi_0,
+                          theta_0 = float(theta_0[i]),
+                          theta_1 = float(theta_1[i]))
+        snapshots[t] = p.privileged * PRIVILEGED
+        status = np.zeros(n_agents, dtype = np.uint8)
+        generation["n_successes"] = p.step(generation["theta_0"],
+                                           generation["theta_1"],
+                                           status = status)
+        snapshots[t] |= status
+        generations.append(generation)
+    snapshots[T] = p.privileged * PRIVILEGED
+    generations.append(dict(phi_0 = p.phi_0))
+    return snapshots, generations
+
+
+def export_simulation(directory, snapshots, generations, params = None,
+                      name = "simulation"):
+    """
+    Writes a simulation (as returned by `simulate`) for the visualization:
+    the snapshots as a raw binary file `<name>.bin` (generation after
+    generation, one byte per agent), and a small JSON index `<name>.json`
+    with the layout of the binary file, the flags, the parameters `params`
+    and the statistics of every generation.
+
+    Returns
+    -------
+    index_path : str
+        The path of the JSON index.
+    """
+    os.makedirs(directory, exist_ok = True)
+    T, n_agents = snapshots.shape
+    data_path = os.path.join(directory, name + ".bin")
+    index_path = os.path.join(directory, name + ".json")
+
+    # JSON can't represent infinite thresholds (nobody in the group is given
+    # an opportunity), so we store them as `null`
+    generations = [{key: (None if np.isinf(value) else value)
+                    for key, value in generation.items()}
+                   for generation in generations]
+    index = dict(version = EXPORT_VERSION,
+                 data = name + ".bin",
+                 dtype = "uint8",
+                 n_agents = n_agents,
+                 n_generations = T,
+                 flags = dict(given = GIVEN,
+                              succeeded = SUCCEEDED,
+                              privileged = PRIVILEGED),
+                 params = params or {},
+                 generations = generations)
+
+    np.ascontiguousarray(snapshots, dtype = np.uint8).tofile(data_path)
+    with open(index_path, "w") as f:
+        json.dump(index, f, indent = 1)
+    return index_path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog = "python -m aamodel.export",
+        description = "Simulates agents under the optimal policies of a solve "
+                      "from an experiment spec, and exports the trajectory "
+                      "for the visualization.")
+    parser.add_argument("spec", help = "experiment spec file")
+    parser.add_argument("solve", help = "name of the solve in the spec "
+                                        "(the first grid point is used)")
+    parser.add_argument("--agents", type = int, default = 2000,
+                        help = "number of agents (default: 2000)")
+    parser.add_argument("--generations", type = int, default = 50,
+                        help = "number of generations (default: 50)")
+    parser.add_argument("--privileged", type = int, default = None,
+                        help = "initial number of privileged agents "
+                               "(default: half)")
+    parser.add_argument("--seed", type = int, default = None)
+    parser.add_argument("--data", default = "data",
+                        help = "result cache directory (default: data)")
+    parser.add_argument("--out", default = "visualization/data",
+                        help = "output directory (default: "
+                               "visualization/data)")
+    args = parser.parse_args()
+
+    point = expand_solve(load_spec(args.spec), args.solve)[0]
+    cache = result_cache(args.data)
+    if point not in cache:
+        cache.store(point, solve(point))
+    result = cache.load(point)
+
+    snapshots, generations = simulate(result["states"],
+                                      result["theta_0"],
+                                      result["theta_1"],
+                                      point["sigma"],
+                                      point["tau"],
+                                      point["p_A"],
+                                      point["p_D"],
+                                      args.agents,
+                                      args.generations,
+                                      n_privileged = args.privileged,
+                                      a_dist = abilities_for(point),
+                                      seed = args.seed)
+    print(export_simulation(args.out, snapshots, generations, point))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
+import numpy as np
 from aamodel.agent import agent, privilege
+from aamodel.population import budget_allocation
 from typing import List, Callable, Tuple
 from random import random, randint
 
@@ -65,19 +67,33 @@ class generation:
     # Allocates opportunities to agents in accordance with the provided
     # thresholds `theta_0` and `theta_1`. Evolves this generation into the next
     # generation.
+    # If `budget` is given, exactly `budget` opportunities are allocated
+    # instead, by success probability, with thresholds as tie-breaks (see
+    # `budget_allocation`). Use `budget = round(alpha * N)` to match the
+    # allocation that the solver assumes.
     # Returns the number of successes in this generation (can be used by the
     # caller to get the payoff).
-    def step(self, theta_0: float, theta_1: float) -> int:
+    def step(self, theta_0: float, theta_1: float, budget: int = None) -> int:
         n_successes = 0
         old_phi_0 = self.phi_0
 
+        if budget is not None:
+            success_prob = np.array([a.success_prob for a in self.agents])
+            threshold = np.array([theta_1 if a.is_privileged() else theta_0
+                                  for a in self.agents])
+            given = budget_allocation(success_prob, threshold, budget)
+
         # Reset the number of privileged agents and count them again
         # (will also reset `phi_0`)
         self.n_privileged = 0
 
         # Update statistics by iterating through old agents
-        for a in self.agents:
-            n_successes += int(a.step(theta_0, theta_1, old_phi_0))
+        for i, a in enumerate(self.agents):
+            if budget is None:
+                n_successes += int(a.step(theta_0, theta_1, old_phi_0))
+            else:
+                n_successes += int(a.allocate_opportunity(given[i]))
+                a.produce_offspring(old_phi_0)
             self.n_privileged += int(a.is_privileged())
 
         return n_successes
@@ -0,0 +1,60 @@
+"""
+Compiled kernels for `mdp_solver`. These require `numba`, which is an optional
+dependency: if it is not installed, `available` is `False` and the solver uses
+its NumPy implementation instead.
+"""
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+available = numba is not None
+
+
+if available:
+    @numba.njit(parallel = True, cache = True)
+    def bellman_update(R, S, W, offset, lower, upper, V, gamma, V_new, best):
+        """
+        Performs a value iteration update from the state values `V`. For every
+        state, this fuses the gather of the next-state values, the discounting,
+        the addition of immediate rewards and the maximization into a single
+        pass over the allowed policies only. States are processed in parallel.
+
+        Parameters
+        ----------
+        R, S, offset, lower, upper, gamma
+            The tables and attributes of `mdp_solver`.
+        W : numpy.ndarray
+            The interpolation weights of `mdp_solver`, or an empty array of
+            shape `(0, 0)` when not interpolating.
+        V : numpy.ndarray
+            A float array of shape `(N + 1,)` with the current state values.
+        V_new : numpy.ndarray
+            A float array of shape `(N + 1,)`, where the new state values are
+            stored.
+        best : numpy.ndarray
+            An integer array of shape `(N + 1,)`, where the columns of the best
+            policies are stored (the first one in case of ties, as with
+            `argmax`).
+        """
+        interpolate = W.shape[0] > 0
+        for i in numba.prange(R.shape[0]):
+            lo = lower[i] - offset[i]
+            hi = upper[i] - offset[i]
+            best_value = -np.inf
+            best_col = lo
+            for j in range(lo, hi + 1):
+                s = S[i, j]
+                next_value = V[s]
+                if interpolate:
+                    next_value += W[i, j] * (V[s + 1] - V[s])
+                value = R[i, j] + gamma * next_value
+                if value > best_value:
+                    best_value = value
+                    best_col = j
+            V_new[i] = best_value
+            best[i] = best_col
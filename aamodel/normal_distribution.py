@@ -1,6 +1,5 @@
 import numpy as np
-from math import isclose
-from scipy.stats import norm
+from math import isclose, pi, sqrt
 
 class normal_distribution:
     """
@@ -26,47 +25,62 @@ class normal_distribution:
         self.sd = sd
 
 
+    # `scipy.special` is imported when first needed, so that importing this
+    # module (and the solver) does not pay for importing SciPy.
     def CDF(self, x):
-        return norm.cdf(x, loc = self.mu, scale = self.sd)
+        from scipy.special import ndtr
+        return ndtr((np.asarray(x) - self.mu) / self.sd)
 
 
     # NB: `CDF_inv` stands for "CDF inverse".
     def CDF_inv(self, x):
-        return norm.ppf(x, loc = self.mu, scale = self.sd)
+        from scipy.special import ndtri
+        return ndtri(x) * self.sd + self.mu
 
 
     def PDF(self, x):
-        return norm.pdf(x, loc = self.mu, scale = self.sd)
+        z = (np.asarray(x) - self.mu) / self.sd
+        return np.exp(-z ** 2 / 2) / sqrt(2 * pi) / self.sd
 
 
     def allowed_actions(self, phi_0, sigma, alpha):
-        # Special case: `phi_0 == 0`, avoid division by 0.
+        phi_0 = np.asarray(phi_0, dtype = float)
+        # Cap [`lower`, `upper`] to [0, `sigma`].
+        # Special care needs to be taken not to pass anything outside [0, 1]
+        # to `CDF_inv`, so we clip the arguments and then replace the results
+        # where they were outside.
+        # Suppress warnings if we divide by 0.
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            lower_arg = 1.0 - alpha / phi_0
+            upper_arg = (1.0 - alpha) / phi_0
+            lower = np.maximum(sigma * self.CDF_inv(np.clip(lower_arg, 0, 1)),
+                               0)
+            upper = np.minimum(sigma * self.CDF_inv(np.clip(upper_arg, 0, 1)),
+                               sigma)
+        lower = np.where(lower_arg < 0, 0, lower)
+        upper = np.where(upper_arg > 1, sigma, upper)
+        # Special case: `phi_0 == 0`, fix division by 0 above.
         # Any action is allowed in this case (it won't have any effect anyway,
         # because there is no unprivileged population).
-        if isclose(phi_0, 0.0):
-            lower = 0
-            upper = sigma
-        else:
-            # Cap [`lower`, `upper`] to [0, `sigma`].
-            # Special care needs to be taken not to pass anything outside [0, 1]
-            # to `CDF_inv`.
-            if 1.0 - alpha / phi_0 < 0:
-                lower = 0
-            else:
-                lower = max(sigma * self.CDF_inv(1.0 - alpha / phi_0), 0)
-            if (1.0 - alpha) / phi_0 > 1:
-                upper = sigma
-            else:
-                upper = min(sigma * self.CDF_inv((1.0 - alpha) / phi_0), sigma)
-        assert 0 <= lower <= upper <= sigma
+        lower = np.where(phi_0 == 0, 0, lower)
+        upper = np.where(phi_0 == 0, sigma, upper)
+        assert np.all(0 <= lower) and np.all(lower <= upper) and \
+               np.all(upper <= sigma)
+        if phi_0.ndim == 0:
+            return float(lower), float(upper)
         return lower, upper
 
 
     def theta_1_from_theta_0(self, theta_0, phi_0, sigma, tau, alpha):
+        return self._theta_1_from_cdf(self.CDF(theta_0 / sigma), phi_0, sigma,
+                                      tau, alpha)
+
+
+    # `theta_1_from_theta_0`, given `CDF(theta_0 / sigma)`
+    def _theta_1_from_cdf(self, cdf, phi_0, sigma, tau, alpha):
         # Suppress warnings if we divide by 0.
         with np.errstate(divide = 'ignore', invalid = 'ignore'):
-            cdf_inv_arg = (1.0 - alpha - phi_0 * self.CDF(theta_0 / sigma)) / \
-                          (1.0 - phi_0)
+            cdf_inv_arg = (1.0 - alpha - phi_0 * cdf) / (1.0 - phi_0)
         # This is a little hacky.
         # Even though we take all precautions to ensure that the the argument to
         # the inverse CDF is always well-defined, it can still happen that this
@@ -89,19 +103,32 @@ class normal_distribution:
 
 
     def get_payoff(self, theta_0, phi_0, sigma, tau, alpha):
+        return self.evaluate(theta_0, phi_0, sigma, tau, alpha)[0]
+
+
+    # `theta_1`, the payoffs of both groups and `phi_0_post` share the CDF and
+    # PDF of `theta_0 / sigma` and of the privileged argument, so they are
+    # computed once here. The results are the same as from the separate
+    # methods.
+    def evaluate(self, theta_0, phi_0, sigma, tau, alpha):
         assert np.all(sigma >= theta_0)
 
-        theta_1 = self.theta_1_from_theta_0(theta_0, phi_0, sigma, tau, alpha)
+        arg = theta_0 / sigma
+        cdf = self.CDF(arg)
+        pdf = self.PDF(arg)
+        theta_1 = self._theta_1_from_cdf(cdf, phi_0, sigma, tau, alpha)
+
         # Compute possible payoffs for privileged population. The reason we say
         # "possible" is because these payoffs won't work when
         # `tau + sigma < theta_1`. This is why we suppress warnings.
         with np.errstate(divide = 'ignore', invalid = 'ignore'):
             # It's a long expression...
             # If someone knows how to break it up more nicely, be my guest
-            arg = (theta_1 - tau) / sigma
-            possible_priv_payoffs = (1.0 - phi_0) * (1.0 - self.CDF(arg)) * \
+            priv_arg = (theta_1 - tau) / sigma
+            priv_cdf = self.CDF(priv_arg)
+            possible_priv_payoffs = (1.0 - phi_0) * (1.0 - priv_cdf) * \
                                     (sigma * (self.mu + (self.sd ** 2) * \
-                                    self.PDF(arg) / (1.0 - self.CDF(arg))) + \
+                                    self.PDF(priv_arg) / (1.0 - priv_cdf)) + \
                                     tau)
         
         # Everywhere where `tau + sigma < theta_1`, replace payoff with 0
@@ -109,14 +136,15 @@ class normal_distribution:
         priv_payoffs = np.where(tau + sigma < theta_1, 0, possible_priv_payoffs)
         priv_payoffs = np.where(np.isnan(priv_payoffs), 0, priv_payoffs)
 
-        # Compute payoffs for unprivileged population
-        arg = theta_0 / sigma
-        unpriv_payoffs = phi_0 * sigma * (self.mu * (1 - self.CDF(arg)) + \
-                         (self.sd ** 2) * self.PDF(arg))
+        # Compute payoffs for unprivileged population. The same fraction of
+        # the unprivileged population succeeds and becomes privileged.
+        successes = phi_0 * sigma * (self.mu * (1 - cdf) + \
+                                     (self.sd ** 2) * pdf)
+        unpriv_payoffs = successes
 
         payoffs = unpriv_payoffs + priv_payoffs
         assert np.all(0 <= payoffs) and np.all(payoffs <= alpha)
-        return payoffs
+        return payoffs, phi_0 - successes, theta_1
  
 
     def phi_0_post(self, theta_0, phi_0, sigma):
@@ -0,0 +1,226 @@
+import argparse
+import json
+import math
+import struct
+import sys
+from array import array
+
+# This module only uses the standard library, so that services that only look
+# up policies can load a policy table without NumPy, SciPy or the solver (the
+# file can also be copied on its own). Only `main` imports the rest of
+# `aamodel`.
+
+# Layout of a policy table file (little-endian):
+#   header       magic, version, N, length of the parameters
+#   parameters   JSON, UTF-8
+#   ranges       `lo` and `hi` of `theta_0`, then of `theta_1` (float64)
+#   thresholds   `theta_0`, then `theta_1`, `N + 1` codes each (uint16)
+MAGIC = b"AAPOLICY"
+POLICY_TABLE_VERSION = 1
+_HEADER = struct.Struct("<8sHII")
+_RANGES = struct.Struct("<4d")
+
+# Finite thresholds are stored as `uint16` codes in `[0, MAX_CODE]`, spread
+# evenly over the range of the finite thresholds of the policy. Infinite
+# thresholds (nobody in the group is given an opportunity, or everyone is)
+# have their own codes.
+MAX_CODE = 65533
+NEG_INF = 65534
+POS_INF = 65535
+
+
+# Returns the `lo` and `hi` of the finite `values`, and their codes
+def _quantize(values):
+    finite = [v for v in values if math.isfinite(v)]
+    lo, hi = (min(finite), max(finite)) if finite else (0.0, 0.0)
+    scale = MAX_CODE / (hi - lo) if hi > lo else 0.0
+    codes = array("H")
+    for v in values:
+        if math.isnan(v):
+            raise ValueError("thresholds can't be NaN")
+        if v == math.inf:
+            codes.append(POS_INF)
+        elif v == -math.inf:
+            codes.append(NEG_INF)
+        else:
+            codes.append(round((v - lo) * scale))
+    return lo, hi, codes
+
+
+def write_policy_table(path, theta_0, theta_1, params = None):
+    """
+    Writes the optimal policies of a solve (as returned by `mdp_solver.run`)
+    as a compact policy table, which `policy_table` loads without the solver.
+
+    The thresholds are quantized to 16 bits over their range, so the error of
+    a finite threshold is at most `(hi - lo) / (2 * MAX_CODE)`, where `lo` and
+    `hi` are the smallest and largest finite thresholds of the group.
+    Infinite thresholds are stored exactly. For `N = 1000`, the file is about
+    4 kB plus the parameters.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file.
+    theta_0, theta_1 : Sequence[float]
+        The thresholds of both groups for the states `i / N`, `i = 0, ..., N`.
+    params : Dict[str, Any] (optional)
+        The parameters of the solve, stored with the policies (they have to
+        be JSON-serializable).
+    """
+    theta_0 = [float(x) for x in theta_0]
+    theta_1 = [float(x) for x in theta_1]
+    if len(theta_0) != len(theta_1) or len(theta_0) < 2:
+        raise ValueError("theta_0 and theta_1 have to be of the same length "
+                         "N + 1, for N >= 1")
+    lo_0, hi_0, codes_0 = _quantize(theta_0)
+    lo_1, hi_1, codes_1 = _quantize(theta_1)
+    if sys.byteorder == "big":
+        codes_0.byteswap()
+        codes_1.byteswap()
+    encoded = json.dumps(params or {}, sort_keys = True).encode()
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, POLICY_TABLE_VERSION, len(theta_0) - 1,
+                             len(encoded)))
+        f.write(encoded)
+        f.write(_RANGES.pack(lo_0, hi_0, lo_1, hi_1))
+        f.write(codes_0.tobytes())
+        f.write(codes_1.tobytes())
+
+
+class policy_table:
+    """
+    The optimal policies of a solve, as written by `write_policy_table`.
+    Loading only reads the header and the codes of the thresholds, which are
+    decoded when they are looked up, so a table loads in microseconds and
+    `lookup` returns the thresholds of a state in constant time.
+
+    Attributes
+    ----------
+    N : int
+        The number of agents of the solve. The policies are given for the
+        states `i / N`, `i = 0, ..., N`.
+    params : Dict[str, Any]
+        The parameters of the solve.
+    theta_0, theta_1 : List[float]
+        The (dequantized) thresholds of both groups for every state, decoded
+        on access.
+    """
+
+
+    def __init__(self, data):
+        """
+        Loads a policy table from the contents `data` of a file (see `load`).
+        """
+        magic, version, N, length = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("not a policy table")
+        if version != POLICY_TABLE_VERSION:
+            raise ValueError("unsupported policy table version {}"
+                             .format(version))
+        offset = _HEADER.size
+        self.N = N
+        self.params = json.loads(bytes(data[offset:offset + length]))
+        offset += length
+        lo_0, hi_0, lo_1, hi_1 = _RANGES.unpack_from(data, offset)
+        offset += _RANGES.size
+        self._codes = array("H")
+        self._codes.frombytes(data[offset:offset + 4 * (N + 1)])
+        if len(self._codes) != 2 * (N + 1):
+            raise ValueError("truncated policy table")
+        if sys.byteorder == "big":
+            self._codes.byteswap()
+        # The thresholds of group `g` are the codes from `g * (N + 1)`, and
+        # are `lo + code * step`
+        self._lo = (lo_0, lo_1)
+        self._step = ((hi_0 - lo_0) / MAX_CODE, (hi_1 - lo_1) / MAX_CODE)
+
+
+    # Returns the threshold of group `g` for state `i`
+    def _threshold(self, g, i):
+        code = self._codes[g * (self.N + 1) + i]
+        if code == POS_INF:
+            return math.inf
+        if code == NEG_INF:
+            return -math.inf
+        return self._lo[g] + code * self._step[g]
+
+
+    @property
+    def theta_0(self):
+        return [self._threshold(0, i) for i in range(self.N + 1)]
+
+
+    @property
+    def theta_1(self):
+        return [self._threshold(1, i) for i in range(self.N + 1)]
+
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads the policy table in the file `path`.
+        """
+        with open(path, "rb") as f:
+            return cls(f.read())
+
+
+    def lookup(self, phi_0, interpolate = False):
+        """
+        Returns the thresholds `(theta_0, theta_1)` for the state `phi_0` (in
+        [0, 1]).
+
+        By default, these are the thresholds of the nearest state, which is
+        how the simulations apply the policies (see `export.simulate`). With
+        `interpolate`, the thresholds are interpolated linearly between the
+        two neighboring states. An infinite threshold isn't interpolated: the
+        threshold of the nearest of the two states is used instead.
+        """
+        if not 0 <= phi_0 <= 1:
+            raise ValueError("phi_0 = {} is outside of [0, 1]".format(phi_0))
+        x = phi_0 * self.N
+        if not interpolate:
+            i = int(round(x))
+            return self._threshold(0, i), self._threshold(1, i)
+        i = min(int(x), self.N - 1)
+        w = x - i
+        return self._interpolate(0, i, w), self._interpolate(1, i, w)
+
+
+    # Returns the threshold of group `g` at `w` between states `i` and `i + 1`
+    def _interpolate(self, g, i, w):
+        low, high = self._threshold(g, i), self._threshold(g, i + 1)
+        if math.isinf(low) or math.isinf(high):
+            return low if w < 0.5 else high
+        return low + w * (high - low)
+
+
+def main():
+    from aamodel.experiments.cache import result_cache
+    from aamodel.experiments.runner import solve
+    from aamodel.experiments.spec import expand_solve, load_spec
+
+    parser = argparse.ArgumentParser(
+        prog = "python -m aamodel.policy_table",
+        description = "Writes the optimal policies of a solve from an "
+                      "experiment spec as a compact policy table.")
+    parser.add_argument("spec", help = "experiment spec file")
+    parser.add_argument("solve", help = "name of the solve in the spec "
+                                        "(the first grid point is used)")
+    parser.add_argument("--data", default = "data",
+                        help = "result cache directory (default: data)")
+    parser.add_argument("--out", default = "policy.bin",
+                        help = "output file (default: policy.bin)")
+    args = parser.parse_args()
+
+    point = expand_solve(load_spec(args.spec), args.solve)[0]
+    cache = result_cache(args.data)
+    if point not in cache:
+        cache.store(point, solve(point))
+    result = cache.load(point)
+    write_policy_table(args.out, result["theta_0"], result["theta_1"], point)
+    print(args.out)
+
+
+if __name__ == "__main__":
+    main()
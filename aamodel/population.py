@@ -0,0 +1,360 @@
+import numpy as np
+import os
+from multiprocessing import Pipe, Process, shared_memory
+from random import randint
+from typing import Callable, Tuple
+
+# Number of agents that are stepped at once. Stepping a shard in chunks keeps
+# the temporary arrays small, no matter how large the population is.
+CHUNK = 1 << 20
+
+# Flags reported by `step_agents` for every agent
+GIVEN = 1                           # The agent was given an opportunity
+SUCCEEDED = 2                       # The agent succeeded
+
+
+# Draws `size` abilities from the [0, 1] uniform distribution, using the
+# random generator `rng`. Samplers passed as `a_dist` to `population` and
+# `sharded_population` have this signature. For `sharded_population`, they
+# have to be picklable (e.g. defined at module level, not lambdas).
+def uniform_abilities(rng: np.random.Generator, size: int) -> np.ndarray:
+    return rng.random(size)
+
+
+# Draws `size` abilities from the normal distribution with mean `mu` and
+# standard deviation `sd`, clipped to [0, 1] so that success probabilities stay
+# valid. Use `functools.partial(normal_abilities, mu, sd)` as `a_dist`.
+def normal_abilities(mu: float,
+                     sd: float,
+                     rng: np.random.Generator,
+                     size: int) -> np.ndarray:
+    return np.clip(rng.normal(mu, sd, size), 0, 1)
+
+
+# Returns the indices of the `k` largest entries of `success_prob`, breaking
+# ties by the larger `margin`. Runs in linear time (no sorting).
+def _top_k(success_prob: np.ndarray, margin: np.ndarray, k: int) -> np.ndarray:
+    n = len(success_prob)
+    if k <= 0:
+        return np.zeros(0, dtype = int)
+    if k >= n:
+        return np.arange(n)
+    cutoff = np.partition(success_prob, n - k)[n - k]
+    top = np.flatnonzero(success_prob > cutoff)
+    ties = np.flatnonzero(success_prob == cutoff)
+    n_left = k - len(top)
+    if n_left < len(ties):
+        ties = ties[np.argpartition(-margin[ties], n_left - 1)[:n_left]]
+    return np.concatenate((top, ties))
+
+
+# Allocates exactly `budget` opportunities (or to everyone, if there are fewer
+# agents) to the agents with the highest success probabilities. Equal success
+# probabilities are broken by the margin over the threshold, so thresholds only
+# matter between agents that are equally likely to succeed. Returns a boolean
+# array that is `True` for the agents that get opportunities.
+def budget_allocation(success_prob: np.ndarray,
+                      threshold: np.ndarray,
+                      budget: int) -> np.ndarray:
+    chosen = _top_k(success_prob, success_prob - threshold, budget)
+    given = np.zeros(len(success_prob), dtype = bool)
+    given[chosen] = True
+    return given
+
+
+# Evolves the agents with abilities `a` and privileges `privileged` (views into
+# the population arrays) in place, exactly like `agent.step` does for a single
+# agent, with `phi_0` the unprivileged fraction of the whole population.
+# If `budget` is given, exactly `budget` opportunities are allocated instead
+# (see `budget_allocation`). If `status` is given (an integer array like `a`),
+# it is filled with `GIVEN` and `SUCCEEDED` flags for every agent.
+# Returns the number of successes and the number of privileged agents in the
+# next generation.
+def step_agents(a: np.ndarray,
+                privileged: np.ndarray,
+                theta_0: float,
+                theta_1: float,
+                phi_0: float,
+                sigma: float,
+                tau: float,
+                p_A: float,
+                p_D: float,
+                a_dist: Callable[[np.random.Generator, int], np.ndarray],
+                rng: np.random.Generator,
+                budget: int = None,
+                status: np.ndarray = None) -> Tuple[int, int]:
+    # The budget is shared by all agents, so it is allocated before stepping
+    # in chunks
+    if budget is not None:
+        budget_given = budget_allocation(a * sigma + privileged * tau,
+                                         np.where(privileged, theta_1, theta_0),
+                                         budget)
+
+    n_successes = 0
+    n_privileged = 0
+    for start in range(0, len(a), CHUNK):
+        stop = min(start + CHUNK, len(a))
+        c = privileged[start:stop]
+        n = stop - start
+
+        # Allocate opportunities by threshold (or budget), and see who
+        # succeeds
+        success_prob = a[start:stop] * sigma + c * tau
+        if budget is None:
+            given = success_prob >= np.where(c, theta_1, theta_0)
+        else:
+            given = budget_given[start:stop]
+        succeeded = given & (rng.random(n) <= success_prob)
+        n_successes += int(np.count_nonzero(succeeded))
+        if status is not None:
+            status[start:stop] = given * GIVEN | succeeded * SUCCEEDED
+        c |= succeeded
+
+        # Assign offspring privilege. Privileged agents become unprivileged
+        # with probability `p_A * phi_0`, and unprivileged agents become
+        # privileged with probability `p_D * (1 - phi_0)`.
+        moves = rng.random(n) < np.where(c, p_A * phi_0, p_D * (1 - phi_0))
+        c ^= moves
+        n_privileged += int(np.count_nonzero(c))
+
+        # Redraw abilities
+        a[start:stop] = a_dist(rng, n)
+
+    return n_successes, n_privileged
+
+
+class population:
+    # The vectorized counterpart of `generation`: instead of a list of `agent`
+    # objects, the agents are stored in arrays, and the whole population is
+    # stepped with array operations.
+
+    # These are provided at construction time
+    a_dist: Callable[[np.random.Generator, int], np.ndarray]
+                                    # Sampler for abilities
+    sigma: float                    # Ability multiplier
+    tau: float                      # Privilege multiplier
+    n_privileged: int               # Number of privileged agents in this
+                                    # generation (used to find `phi_0`)
+    p_A: float                      # Probability of movement for privileged
+                                    # agents
+    p_D: float                      # Probability of movement for unprivileged
+                                    # agents
+    N: int                          # Number of agents in this generation
+
+    # These are derived during initialization
+    rng: np.random.Generator        # Random generator for all draws
+    a: np.ndarray                   # Abilities of all agents
+    privileged: np.ndarray          # `True` for privileged agents
+
+
+    def __init__(self,
+                 a_dist: Callable[[np.random.Generator, int], np.ndarray],
+                 sigma: float,
+                 tau: float,
+                 n_privileged: int,
+                 p_A: float,
+                 p_D: float,
+                 N: int,
+                 seed = None):
+        self.a_dist = a_dist
+        self.sigma = sigma
+        self.tau = tau
+        if n_privileged is None:
+            self.n_privileged = randint(0, N)
+        else:
+            self.n_privileged = n_privileged
+        self.p_A = p_A
+        self.p_D = p_D
+        self.N = N
+
+        self.rng = np.random.default_rng(seed)
+        self.a = a_dist(self.rng, N)
+        self.privileged = np.arange(N) < self.n_privileged
+
+
+    @property
+    def phi_0(self):
+        return 1 - self.n_privileged / self.N
+
+
+    # Evolves the population according to the model, like `generation.step`
+    # (including the `budget` mode). If `status` is given, it is filled with
+    # the `GIVEN` and `SUCCEEDED` flags of every agent in this generation.
+    # Returns the number of successes in this generation.
+    def step(self,
+             theta_0: float,
+             theta_1: float,
+             budget: int = None,
+             status: np.ndarray = None) -> int:
+        n_successes, self.n_privileged = \
+            step_agents(self.a, self.privileged, theta_0, theta_1, self.phi_0,
+                        self.sigma, self.tau, self.p_A, self.p_D, self.a_dist,
+                        self.rng, budget, status)
+        return n_successes
+
+
+# Steps the shard `[start, stop)` of a `sharded_population` in a worker
+# process. The worker attaches to the shared population arrays, sets up its
+# shard, and then steps it every time it receives thresholds and `phi_0`
+# through `conn`, replying with its number of successes and privileged agents.
+# It stops when it receives `None`.
+def _shard_worker(conn, a_name, privileged_name, N, start, stop,
+                  n_privileged, params, seed):
+    a_shm = shared_memory.SharedMemory(name = a_name)
+    privileged_shm = shared_memory.SharedMemory(name = privileged_name)
+    a = privileged = None
+    try:
+        a = np.ndarray((N,), dtype = float, buffer = a_shm.buf)[start:stop]
+        privileged = np.ndarray((N,), dtype = bool,
+                                buffer = privileged_shm.buf)[start:stop]
+        rng = np.random.default_rng(seed)
+        a[:] = params["a_dist"](rng, stop - start)
+        privileged[:] = np.arange(start, stop) < n_privileged
+        conn.send(None)
+
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+            theta_0, theta_1, phi_0 = message
+            conn.send(step_agents(a, privileged, theta_0, theta_1, phi_0,
+                                  rng = rng, **params))
+    finally:
+        del a, privileged
+        a_shm.close()
+        privileged_shm.close()
+        conn.close()
+
+
+class sharded_population:
+    # A `population` for very large numbers of agents, stepped in parallel.
+    # The agent arrays live in shared memory and are split into disjoint
+    # shards, each owned by a worker process with its own random stream. In
+    # every step, the workers only send back their numbers of successes and
+    # privileged agents, which add up to the `phi_0` of the next generation.
+    #
+    # Call `close` (or use a `with` block) to stop the workers and free the
+    # shared memory.
+
+    # These are provided at construction time
+    a_dist: Callable[[np.random.Generator, int], np.ndarray]
+                                    # Sampler for abilities (picklable)
+    sigma: float                    # Ability multiplier
+    tau: float                      # Privilege multiplier
+    n_privileged: int               # Number of privileged agents in this
+                                    # generation (used to find `phi_0`)
+    p_A: float                      # Probability of movement for privileged
+                                    # agents
+    p_D: float                      # Probability of movement for unprivileged
+                                    # agents
+    N: int                          # Number of agents in this generation
+    n_shards: int                   # Number of shards (and worker processes)
+
+    # These are derived during initialization
+    a: np.ndarray                   # Abilities of all agents (shared)
+    privileged: np.ndarray          # `True` for privileged agents (shared)
+
+
+    def __init__(self,
+                 a_dist: Callable[[np.random.Generator, int], np.ndarray],
+                 sigma: float,
+                 tau: float,
+                 n_privileged: int,
+                 p_A: float,
+                 p_D: float,
+                 N: int,
+                 n_shards: int = None,
+                 seed = None):
+        self.a_dist = a_dist
+        self.sigma = sigma
+        self.tau = tau
+        if n_privileged is None:
+            self.n_privileged = randint(0, N)
+        else:
+            self.n_privileged = n_privileged
+        self.p_A = p_A
+        self.p_D = p_D
+        self.N = N
+        if n_shards is None:
+            n_shards = os.cpu_count()
+        self.n_shards = max(min(n_shards, N), 1)
+
+        # Shared memory blocks can't be empty
+        self._a_shm = shared_memory.SharedMemory(
+                          create = True, size = max(N * 8, 1))
+        self._privileged_shm = shared_memory.SharedMemory(
+                                   create = True, size = max(N, 1))
+        self.a = np.ndarray((N,), dtype = float, buffer = self._a_shm.buf)
+        self.privileged = np.ndarray((N,), dtype = bool,
+                                     buffer = self._privileged_shm.buf)
+
+        # Independent random streams for the shards
+        seeds = np.random.SeedSequence(seed).spawn(self.n_shards)
+        bounds = np.linspace(0, N, self.n_shards + 1).astype(int)
+        params = dict(sigma = sigma,
+                      tau = tau,
+                      p_A = p_A,
+                      p_D = p_D,
+                      a_dist = a_dist)
+        self._conns = []
+        self._workers = []
+        for i in range(self.n_shards):
+            conn, worker_conn = Pipe()
+            worker = Process(target = _shard_worker,
+                             args = (worker_conn, self._a_shm.name,
+                                     self._privileged_shm.name, N,
+                                     bounds[i], bounds[i + 1],
+                                     self.n_privileged, params, seeds[i]),
+                             daemon = True)
+            worker.start()
+            worker_conn.close()
+            self._conns.append(conn)
+            self._workers.append(worker)
+
+        # Wait for the workers to set up their shards
+        for conn in self._conns:
+            conn.recv()
+
+
+    @property
+    def phi_0(self):
+        return 1 - self.n_privileged / self.N
+
+
+    # Evolves the population according to the model, like `generation.step`.
+    # Returns the number of successes in this generation.
+    def step(self, theta_0: float, theta_1: float) -> int:
+        message = (theta_0, theta_1, self.phi_0)
+        for conn in self._conns:
+            conn.send(message)
+        results = [conn.recv() for conn in self._conns]
+        self.n_privileged = sum(n for _, n in results)
+        return sum(n for n, _ in results)
+
+
+    # Stops the workers and frees the shared memory. The population can't be
+    # used afterwards.
+    def close(self) -> None:
+        if self._workers is None:
+            return
+        for conn, worker in zip(self._conns, self._workers):
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            worker.join()
+            conn.close()
+        self._workers = None
+        del self.a, self.privileged
+        self._a_shm.close()
+        self._a_shm.unlink()
+        self._privileged_shm.close()
+        self._privileged_shm.unlink()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,253 @@
+import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from aamodel.solver import mdp_solver
+
+
+# Parameters that we can compute sensitivities for. `sd` is the standard
+# deviation of `normal_distribution`, so it is only available for distributions
+# that have it.
+PARAMETERS = ("sigma", "tau", "alpha", "p_A", "p_D", "sd")
+
+
+# The base solver and `run` arguments of the current process (set by
+# `_init_worker`). Worker processes get them once, when they start, instead of
+# with every task.
+_base = None
+_run_kwargs = None
+
+
+def _init_worker(base, run_kwargs):
+    global _base, _run_kwargs
+    _base = base
+    _run_kwargs = run_kwargs
+
+
+def _get_value(base, parameter):
+    if parameter == "sd":
+        return base.dist.sd
+    return getattr(base, parameter)
+
+
+def _is_valid(base, parameter, value):
+    if parameter == "sd":
+        return value > 0
+    if parameter == "alpha":
+        # With no opportunities (or opportunities for everyone), there is no
+        # policy to choose.
+        return 0 < value < 1
+    sigma = value if parameter == "sigma" else base.sigma
+    tau = value if parameter == "tau" else base.tau
+    return 0 < sigma and 0 <= tau and sigma + tau <= 1 and 0 <= value <= 1
+
+
+# Builds a solver for the base parameters with `parameter` changed to `value`.
+def _perturbed_solver(base, parameter, value):
+    if parameter in ("p_A", "p_D"):
+        # Rewards and allowed policies don't depend on redistribution, so we
+        # can reuse the tables of the base solver.
+        return base.with_redistribution(
+                   p_A = value if parameter == "p_A" else base.p_A,
+                   p_D = value if parameter == "p_D" else base.p_D)
+
+    # Keep all options of the base solver (e.g. `stochastic`), so that both
+    # sides of a difference are solved for the same model
+    params = dict(sigma = base.sigma,
+                  tau = base.tau,
+                  p_A = base.p_A,
+                  p_D = base.p_D,
+                  N = base.N,
+                  gamma = base.gamma,
+                  alpha = base.alpha,
+                  **base.options)
+    if base.table_dir is not None:
+        # The tables of the base solver are in `table_dir`
+        params["table_dir"] = os.path.join(base.table_dir,
+                                           "{}={!r}".format(parameter, value))
+    dist = base.dist
+    if parameter == "sd":
+        dist = type(dist)(dist.mu, value)
+    else:
+        params[parameter] = value
+    return mdp_solver(dist = dist, **params)
+
+
+# Solves the perturbed problem, warm-started from the base solution (unless
+# the `run` arguments give initial values `V`).
+def _solve(task):
+    parameter, value = task
+    solver = _perturbed_solver(_base, parameter, value)
+    solver.run(verbose = False, **{"V": _base.V, **_run_kwargs})
+    return solver.V, solver.theta_0
+
+
+def sensitivity(solver,
+                parameters = PARAMETERS,
+                step = 0.01,
+                n_workers = None,
+                **run_kwargs):
+    """
+    Computes how the optimal policies and the state values change with the
+    model parameters, using finite differences.
+
+    The base problem is solved first. Then, for every parameter, we solve the
+    problems with the parameter moved by `step` in both directions (or in
+    one direction, if the other one would make the parameters invalid), and
+    take the (central) difference quotient. The solves are warm-started from
+    the base solution and run in parallel in a process pool. For `p_A` and
+    `p_D`, the perturbed solvers share the reward tables of the base solver
+    (see `mdp_solver.with_redistribution`).
+
+    NB: Policies are discretized, so `step` has to be large compared to
+    `sigma / discretization` for the policy sensitivities to be meaningful.
+
+    Parameters
+    ----------
+    solver : mdp_solver
+        The solver for the base parameters.
+    parameters : Sequence[str] (optional)
+        The parameters to compute the sensitivities for (any of `PARAMETERS`).
+        `sd` is skipped for distributions without a standard deviation.
+    step : float or Dict[str, float] (optional)
+        The finite difference step, either for all parameters or for each
+        parameter separately.
+    n_workers : int or None (optional)
+        The number of worker processes. `None` uses all cores, while 1 solves
+        everything in the current process.
+    run_kwargs
+        Passed on to `mdp_solver.run` (e.g. `monotone` or `backend`). Initial
+        values `V` replace the base solution as the warm start.
+
+    Returns
+    -------
+    sensitivities : Dict[str, Dict[str, Any]]
+        For every parameter, a dictionary with the following entries.
+        `value`, `low`, `high` : the base value of the parameter and the
+        values of the two solves that the difference is taken over.
+        `theta_0`, `V` : float arrays of shape `(N + 1,)` with the derivatives
+        of the optimal policies and the state values.
+        `theta_0_low`, `theta_0_high`, `V_low`, `V_high` : the optimal
+        policies and state values of the two solves.
+    """
+    solver.run(verbose = False, **run_kwargs)
+    if not isinstance(step, dict):
+        step = {parameter: step for parameter in parameters}
+    parameters = [p for p in parameters
+                  if p != "sd" or hasattr(solver.dist, "sd")]
+    assert all(p in PARAMETERS for p in parameters), "Unknown parameter"
+
+    # Plan the solves. A side that would be invalid is replaced by the base
+    # point, which we have already solved.
+    bounds = {}
+    tasks = []
+    for parameter in parameters:
+        value = _get_value(solver, parameter)
+        low = value - step[parameter]
+        high = value + step[parameter]
+        low = low if _is_valid(solver, parameter, low) else value
+        high = high if _is_valid(solver, parameter, high) else value
+        assert low < high, \
+               "Cannot vary {} in either direction".format(parameter)
+        bounds[parameter] = (value, low, high)
+        tasks += [(parameter, x) for x in (low, high) if x != value]
+
+    if n_workers == 1:
+        _init_worker(solver, run_kwargs)
+        results = list(map(_solve, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers = n_workers,
+                                 initializer = _init_worker,
+                                 initargs = (solver, run_kwargs)) as pool:
+            results = list(pool.map(_solve, tasks))
+    solved = dict(zip(tasks, results))
+    solved.update({(parameter, value): (solver.V, solver.theta_0)
+                   for parameter, (value, _, _) in bounds.items()})
+
+    sensitivities = {}
+    for parameter, (value, low, high) in bounds.items():
+        V_low, theta_0_low = solved[(parameter, low)]
+        V_high, theta_0_high = solved[(parameter, high)]
+        sensitivities[parameter] = dict(
+            value = value,
+            low = low,
+            high = high,
+            theta_0 = (theta_0_high - theta_0_low) / (high - low),
+            V = (V_high - V_low) / (high - low),
+            theta_0_low = theta_0_low,
+            theta_0_high = theta_0_high,
+            V_low = V_low,
+            V_high = V_high)
+    return sensitivities
+
+
+def tornado_report(solver,
+                   parameters = PARAMETERS,
+                   step = 0.05,
+                   n_workers = None,
+                   path = None,
+                   **run_kwargs):
+    """
+    Computes a tornado-style sensitivity report: for every parameter, how much
+    the average state value and the average optimal policy (over all states
+    with `phi_0 > 0`) swing when the parameter moves by `step` in either
+    direction. The rows are sorted by the swing of the average state value,
+    largest first, and printed as a table.
+
+    Parameters
+    ----------
+    solver, parameters, step, n_workers, run_kwargs
+        See `sensitivity`.
+    path : str (optional)
+        If given, the tornado chart is also plotted to `path`. This requires
+        `matplotlib`.
+
+    Returns
+    -------
+    rows : List[Dict[str, Any]]
+        One row per parameter, with the entries `parameter`, `value`, `low`,
+        `high`, `V_low`, `V_high`, `theta_0_low` and `theta_0_high` (the
+        averages at the two ends), and the full `sensitivity` result.
+    """
+    sensitivities = sensitivity(solver,
+                                parameters = parameters,
+                                step = step,
+                                n_workers = n_workers,
+                                **run_kwargs)
+    rows = []
+    for parameter, result in sensitivities.items():
+        rows.append(dict(parameter = parameter,
+                         value = result["value"],
+                         low = result["low"],
+                         high = result["high"],
+                         V_low = np.mean(result["V_low"][1:]),
+                         V_high = np.mean(result["V_high"][1:]),
+                         theta_0_low = np.mean(result["theta_0_low"][1:]),
+                         theta_0_high = np.mean(result["theta_0_high"][1:]),
+                         sensitivity = result))
+    rows.sort(key = lambda row: abs(row["V_high"] - row["V_low"]),
+              reverse = True)
+
+    print("{:>9} {:>8} {:>8} {:>8} {:>9} {:>9} {:>9} {:>9}".format(
+          "parameter", "value", "low", "high", "V low", "V high",
+          "theta low", "theta hi"))
+    for row in rows:
+        print("{:>9} {:8.4f} {:8.4f} {:8.4f} {:9.5f} {:9.5f} {:9.5f} "
+              "{:9.5f}".format(row["parameter"], row["value"], row["low"],
+                               row["high"], row["V_low"], row["V_high"],
+                               row["theta_0_low"], row["theta_0_high"]))
+
+    if path is not None:
+        import matplotlib.pyplot as plt
+        base = np.mean(solver.V[1:])
+        labels = [row["parameter"] for row in rows][::-1]
+        lows = [row["V_low"] - base for row in rows][::-1]
+        highs = [row["V_high"] - base for row in rows][::-1]
+        plt.barh(labels, lows, left = base, label = "low")
+        plt.barh(labels, highs, left = base, label = "high")
+        plt.axvline(base, color = "black")
+        plt.xlabel("Average state value")
+        plt.legend(loc = "lower right")
+        plt.savefig(path)
+        plt.close()
+    return rows
@@ -0,0 +1,325 @@
+import argparse
+import functools
+import hashlib
+import json
+import numpy as np
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from aamodel.experiments.cache import result_cache
+from aamodel.experiments.runner import solve
+from aamodel.experiments.spec import check_point, normalize_point
+from aamodel.export import abilities_for, simulate, EXPORT_VERSION, PRIVILEGED
+from aamodel.population import GIVEN, SUCCEEDED
+
+# Largest problems and simulations that the service accepts, so that a single
+# request can't take the machine down
+MAX_TABLE_SIZE = 2001 * 2001        # (N + 1) * (discretization + 1)
+MAX_SNAPSHOT_SIZE = 10 ** 8         # agents * (generations + 1)
+
+
+# Checks a normalized solve `point`, and that it is small enough.
+def _check_point(point):
+    check_point(point)
+    if (point["N"] + 1) * (point["discretization"] + 1) > MAX_TABLE_SIZE:
+        raise ValueError("N and discretization can have at most {} table "
+                         "entries".format(MAX_TABLE_SIZE))
+
+
+# Runs a simulation in a worker process. Returns the snapshots as bytes and
+# the statistics of the generations.
+def _simulate(point, result, n_agents, T, n_privileged, seed):
+    snapshots, generations = simulate(result["states"],
+                                      result["theta_0"],
+                                      result["theta_1"],
+                                      point["sigma"],
+                                      point["tau"],
+                                      point["p_A"],
+                                      point["p_D"],
+                                      n_agents,
+                                      T,
+                                      n_privileged = n_privileged,
+                                      a_dist = abilities_for(point),
+                                      seed = seed)
+    return snapshots.tobytes(), generations
+
+
+# Returns a list for JSON, with non-finite entries (e.g. infinite `theta_1`)
+# as `None`.
+def _to_json(array):
+    return [float(x) if np.isfinite(x) else None for x in array]
+
+
+class solver_service:
+    """
+    Answers policy and simulation requests for the interactive visualization.
+
+    Solves go through a `result_cache`, so configurations that were explored
+    before are answered from disk. Missing solves and all simulations run in a
+    process pool, and concurrent identical requests are coalesced: they wait
+    for the same job instead of starting their own. Simulations are kept in
+    memory (the most recent `max_simulations`), for the page to fetch their
+    snapshots.
+
+    Attributes
+    ----------
+    cache : result_cache
+    pool : concurrent.futures.ProcessPoolExecutor
+    n_solves, n_simulations : int
+        The number of solves and simulations that were actually run.
+    """
+
+
+    def __init__(self, cache, n_workers = None, max_simulations = 32):
+        self.cache = cache
+        self.pool = ProcessPoolExecutor(max_workers = n_workers)
+        self.max_simulations = max_simulations
+        self.n_solves = 0
+        self.n_simulations = 0
+        # Callbacks of finished jobs may run while we hold the lock
+        self._lock = threading.RLock()
+        self._running = {}
+        self._simulations = OrderedDict()
+
+
+    # Returns the future of the job `key`, submitting `fn(*args)` to the pool
+    # unless the same job is already running. `done(result)` runs once, when
+    # the job finishes successfully.
+    def _coalesce(self, key, done, fn, *args):
+        with self._lock:
+            future = self._running.get(key)
+            if future is not None:
+                return future
+            future = self.pool.submit(fn, *args)
+            self._running[key] = future
+
+        def finish(future):
+            if future.exception() is None:
+                done(future.result())
+            with self._lock:
+                self._running.pop(key, None)
+        future.add_done_callback(finish)
+        return future
+
+
+    def _policy(self, table):
+        point = normalize_point(table)
+        _check_point(point)
+        key = result_cache.key(point)
+        # Cached results are read without the lock, so that reads don't wait
+        # for each other
+        result = self.cache.load(point)
+        if result is not None:
+            return key, point, result
+        with self._lock:
+            # A solve that finished since we looked stored its result before
+            # it left `_running`
+            stored = key not in self._running and point in self.cache
+            if not stored:
+                self.n_solves += key not in self._running
+                future = self._coalesce(
+                             key,
+                             functools.partial(self.cache.store, point),
+                             solve, point)
+        result = self.cache.load(point) if stored else future.result()
+        return key, point, result
+
+
+    def policy(self, table):
+        """
+        Returns the optimal policies for a solve `table` (see
+        `experiments.spec.load_spec`), as a JSON-friendly dictionary with the
+        cache `key`, the normalized `point`, and the lists `states`,
+        `theta_0`, `theta_1` and `V`.
+        """
+        key, point, result = self._policy(table)
+        return dict(key = key,
+                    point = point,
+                    **{name: _to_json(result[name])
+                       for name in ("states", "theta_0", "theta_1", "V")})
+
+
+    def simulate(self, table, agents = 2000, generations = 50,
+                 privileged = None, seed = 0):
+        """
+        Simulates `agents` agents for `generations` generations under the
+        optimal policies of a solve `table`. `privileged` is the fraction of
+        the agents that are privileged in the first generation (half by
+        default), and `seed` the integer seed of the simulation. Returns the
+        index of the simulation, in the format of `export.export_simulation`,
+        where `data` is the URL of the snapshots (see `snapshots`).
+        """
+        for name, value in (("agents", agents), ("generations", generations),
+                            ("seed", seed)):
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise ValueError("{} has to be an integer".format(name))
+        if agents < 1 or generations < 0 or \
+           agents * (generations + 1) > MAX_SNAPSHOT_SIZE:
+            raise ValueError("agents has to be positive and generations "
+                             "non-negative, with at most {} snapshot entries"
+                             .format(MAX_SNAPSHOT_SIZE))
+        n_privileged = None
+        if privileged is not None:
+            privileged = float(privileged)
+            if not 0 <= privileged <= 1:
+                raise ValueError("privileged has to be a fraction in [0, 1]")
+            n_privileged = round(privileged * agents)
+        key, point, result = self._policy(table)
+        request = json.dumps([key, agents, generations, privileged, seed])
+        sim_key = hashlib.sha256(request.encode()).hexdigest()[:20]
+
+        with self._lock:
+            simulation = self._simulations.get(sim_key)
+            if simulation is None:
+                self.n_simulations += sim_key not in self._running
+                future = self._coalesce(
+                             sim_key,
+                             functools.partial(self._remember, sim_key),
+                             _simulate, point, result, agents, generations,
+                             n_privileged, seed)
+        if simulation is None:
+            simulation = future.result()
+
+        _, stats = simulation
+        return dict(version = EXPORT_VERSION,
+                    data = "api/results/{}.bin".format(sim_key),
+                    dtype = "uint8",
+                    n_agents = agents,
+                    n_generations = generations + 1,
+                    flags = dict(given = GIVEN,
+                                 succeeded = SUCCEEDED,
+                                 privileged = PRIVILEGED),
+                    params = point,
+                    generations = [{k: (None if np.isinf(v) else v)
+                                    for k, v in g.items()} for g in stats])
+
+
+    def _remember(self, sim_key, simulation):
+        with self._lock:
+            self._simulations[sim_key] = simulation
+            self._simulations.move_to_end(sim_key)
+            while len(self._simulations) > self.max_simulations:
+                self._simulations.popitem(last = False)
+
+
+    def snapshots(self, sim_key):
+        """
+        Returns the snapshots of simulation `sim_key` as bytes, or `None` if
+        it is unknown (or was evicted).
+        """
+        with self._lock:
+            simulation = self._simulations.get(sim_key)
+        return None if simulation is None else simulation[0]
+
+
+    def close(self):
+        self.pool.shutdown()
+
+
+class _handler(SimpleHTTPRequestHandler):
+    # Serves the API under `/api/` and the visualization files everywhere
+    # else. `service` is set by `make_server`.
+    service = None
+    quiet = False
+
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def _send_json(self, status, obj):
+        self._send(status, json.dumps(obj).encode(), "application/json")
+
+
+    def do_POST(self):
+        endpoints = {"/api/policy": lambda r: self.service.policy(r),
+                     "/api/simulate": lambda r: self.service.simulate(
+                         r.get("params", {}),
+                         **{k: r[k] for k in ("agents", "generations",
+                                              "privileged", "seed")
+                            if k in r})}
+        if self.path not in endpoints:
+            self._send_json(404, {"error": "unknown endpoint"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            response = endpoints[self.path](request)
+        except (ValueError, TypeError, KeyError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {"error": repr(e)})
+            return
+        self._send_json(200, response)
+
+
+    def do_GET(self):
+        prefix = "/api/results/"
+        if self.path.startswith(prefix) and self.path.endswith(".bin"):
+            data = self.service.snapshots(self.path[len(prefix):-4])
+            if data is None:
+                self._send_json(404, {"error": "unknown simulation"})
+            else:
+                self._send(200, data, "application/octet-stream")
+            return
+        super().do_GET()
+
+
+    def log_message(self, *args):
+        if not self.quiet:
+            super().log_message(*args)
+
+
+def make_server(service, host = "127.0.0.1", port = 8000,
+                directory = "visualization", quiet = False):
+    """
+    Returns a `ThreadingHTTPServer` for `service` (call `serve_forever` on it),
+    that also serves the visualization files from `directory`.
+    """
+    handler = type("handler", (_handler,), dict(service = service,
+                                                 quiet = quiet))
+    return ThreadingHTTPServer(
+               (host, port),
+               functools.partial(handler, directory = directory))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog = "python -m aamodel.server",
+        description = "Serves the visualization together with a local solver "
+                      "service.")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8000)
+    parser.add_argument("--data", default = "data",
+                        help = "result cache directory (default: data)")
+    parser.add_argument("--directory", default = "visualization",
+                        help = "directory of the visualization (default: "
+                               "visualization)")
+    parser.add_argument("-j", "--jobs", type = int, default = None,
+                        help = "number of worker processes (default: all "
+                               "cores)")
+    args = parser.parse_args()
+
+    service = solver_service(result_cache(args.data), n_workers = args.jobs)
+    server = make_server(service, args.host, args.port,
+                         directory = os.path.abspath(args.directory))
+    print("Serving on http://{}:{}/".format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
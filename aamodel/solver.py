@@ -1,4 +1,92 @@
+import copy
+import hashlib
+import json
 import numpy as np
+import os
+import tempfile
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Rough peak memory of the temporaries of table construction, in bytes per
+# allowed state-policy pair (see `memory_budget` of `mdp_solver`)
+BYTES_PER_PAIR = 256
+
+
+class _checkpoint:
+    """
+    Saves the progress of value iteration in `mdp_solver.run` (the state
+    values, the number of iterations and the residual history) to the file
+    `path` every `iterations` iterations and every `seconds` seconds,
+    whichever comes first (`None` disables either). Every save writes a
+    temporary file next to `path` and replaces `path` with it, so `path`
+    always holds a complete checkpoint, even if the process is killed while
+    saving. `key` identifies the problem, so that a checkpoint is never
+    resumed by a different one.
+    """
+
+
+    def __init__(self, path, key, iterations = None, seconds = None):
+        self.path = path
+        self.key = key
+        self.iterations = iterations
+        self.seconds = seconds
+        self.saved_at = time.monotonic()
+        self.saved_iteration = 0
+
+
+    def load(self):
+        """
+        Returns the state values and the residual history (one residual per
+        iteration) of the checkpoint, or `None` if there is none yet. Raises
+        `ValueError` if the checkpoint is of a different problem.
+        """
+        if not os.path.exists(self.path):
+            return None
+        with np.load(self.path) as checkpoint:
+            if str(checkpoint["key"]) != self.key:
+                raise ValueError("the checkpoint {} is of a different problem"
+                                 .format(self.path))
+            residuals = checkpoint["residuals"].tolist()
+            self.saved_iteration = len(residuals)
+            return checkpoint["V"], residuals
+
+
+    def update(self, residuals, values):
+        """
+        Saves a checkpoint if one is due after the last iteration.
+        `residuals` is the residual history, and `values` returns the current
+        state values (it is only called when saving).
+        """
+        due = self.iterations is not None and \
+              len(residuals) - self.saved_iteration >= self.iterations
+        due |= self.seconds is not None and \
+               time.monotonic() - self.saved_at >= self.seconds
+        if due:
+            self.save(residuals, values())
+
+
+    def save(self, residuals, V):
+        # The temporary file has a unique name, so that concurrent saves to
+        # the same `path` don't write to the same file
+        directory, name = os.path.split(self.path)
+        f = tempfile.NamedTemporaryFile(dir = directory or ".",
+                                        prefix = name + ".",
+                                        suffix = ".tmp", delete = False)
+        try:
+            with f:
+                np.savez(f, V = V,
+                         residuals = np.asarray(residuals, dtype = float),
+                         key = self.key)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(f.name, self.path)
+        except BaseException:
+            os.unlink(f.name)
+            raise
+        self.saved_at = time.monotonic()
+        self.saved_iteration = len(residuals)
 
 
 class mdp_solver:
@@ -22,7 +110,10 @@ class mdp_solver:
         Every distribution has to implement the following methods:
         `allowed_actions`, `theta_1_from_theta_0`, `get_payoff`, and
         `phi_0_post`. For descriptions of these methods, see
-        `uniform_distribution`.
+        `uniform_distribution`. A distribution can also implement
+        `evaluate`, which returns the payoffs, `phi_0_post` and `theta_1` at
+        once, sharing the special function evaluations between them. The
+        tables are then built with it.
     sigma : float
         The ability multiplier. Always has to be in [0, 1].
     tau : float
@@ -48,26 +139,103 @@ class mdp_solver:
         discretized by dividing [0, 1] into `discretization` pieces, but by
         dividing [0, `sigma`] into `discretization` pieces. This is because
         the largest possible policy is `sigma`.
+    action_bounds : Tuple[numpy.ndarray, numpy.ndarray] or None
+        Optional integer arrays `(lower, upper)` of shape `(N + 1,)`. If given,
+        the allowed policies of state `i` are narrowed to
+        [`lower[i]`, `upper[i]`]. This is used to refine a solution found on a
+        coarser grid (see `solve_multigrid`).
+    width : int
+        The number of policies stored for each state. Without `action_bounds`,
+        this is `discretization + 1`. With `action_bounds`, we only store the
+        narrowed ranges, which makes the tables (and every iteration of `run`)
+        much smaller.
+    offset : numpy.ndarray
+        An integer array of shape `(N + 1,)`. Column `j` of the tables below
+        stores policy `offset[i] + j` of state `i`. Without `action_bounds`,
+        all offsets are 0.
+    lower, upper : numpy.ndarray
+        Integer arrays of shape `(N + 1,)`. The allowed policies of state `i`
+        are [`lower[i]`, `upper[i]`].
     Q : numpy.ndarray
-        A float array of shape `(N + 1, discretization + 1)`. Here, we store
+        A float array of shape `(N + 1, width)`. Here, we store
         infinite-horizon rewards for state-policy pairs during the learning
         process. The entry `Q[i, j]` gives the infinite-horizon reward for
         taking policy `j` in state `i`.
     R : numpy.ndarray
-        A float array of shape `(N + 1, discretization + 1)`. This array stores
+        A float array of shape `(N + 1, width)`. This array stores
         immediate rewards for state-policy pairs. The entry `Q[i, j]` gives the
         immediate undiscounted reward for taking policy `j` in state `i`.
     S : numpy.ndarray
-        An integer array of shape `(N + 1, discretization + 1)`. This array
+        An integer array of shape `(N + 1, width)`. This array
         stores the transition states for state-policy pairs. The entry `Q[i, j]`
         gives the state to which the system transitions when taking policy `j`
         in state `i`. The states are stored as integers in [0, N].
     mask : numpy.ndarray
-        A boolean array of shape `(N + 1, discretization + 1)`. An entry
+        A boolean array of shape `(N + 1, width)`. An entry
         `Q[i, j]` is `True` iff policy `j` is allowed to be taken from state
         `i`. A policy would not be allowed when it would lead to the total
         amount of allocated opportunities being strictly less or more than
         `alpha`.
+    interpolate : bool
+        If `False` (the default), the next state of a state-policy pair is
+        found by rounding the continuous `phi_0` down to the grid. If `True`,
+        the transition is split linearly between the two neighbouring grid
+        states instead. Rounding down biases the dynamics, so it takes a very
+        fine grid (large `N`) to get smooth policies, while interpolation gives
+        comparable accuracy on much coarser grids.
+    W : numpy.ndarray or None
+        A float array of shape `(N + 1, width)`, only used when
+        `interpolate` is `True` (otherwise `None`). The entry `W[i, j]` gives
+        the weight of the upper neighbouring state `S[i, j] + 1` when taking
+        policy `j` in state `i`. The lower neighbour `S[i, j]` gets the weight
+        `1 - W[i, j]`. With interpolation, `S` is always in [0, N - 1].
+    analytic : bool
+        If `True`, the tables `Q`, `R`, `S`, `W` and `mask` are not built (they
+        are `None`). Instead, for every state and every next state it can
+        reach, we find the best policy leading there in closed form once (see
+        `_build_regions`), and value iteration only chooses between these.
+        This takes about `N * min(N, discretization)` memory and work per
+        iteration instead of `N * discretization`. The state values are the
+        same as with the tables, and so are the policies, except where two
+        policies tie up to rounding errors. It requires rounding down (`interpolate = False`) and a
+        distribution that implements `payoff_maximizer` (currently
+        `uniform_distribution`).
+    stochastic : bool
+        If `True`, transitions are random, as in a population of `N` agents:
+        the number of unprivileged agents that succeed and the redistribution
+        of privilege are binomial (see `_build_kernel`), instead of being
+        their mean-field expectations. The values of the next states are then
+        expectations under the sparse transition matrix `P`. This captures
+        the fluctuations of small populations, and reduces to the mean-field
+        model as `N` grows. `S` (and `W`) still hold the mean-field
+        transitions. The memory and work per iteration grow with the number
+        of allowed state-policy pairs times the width of the bands, which is
+        about `sqrt(N)`.
+    tolerance : float
+        Only with `stochastic`. The probability in the tails of every
+        transition that is cut off.
+    P, P_pairs : scipy.sparse.csr_matrix or None, Tuple[numpy.ndarray, ...]
+        Only with `stochastic` (otherwise `None`). Row `r` holds the
+        probabilities of the next states of the allowed state-policy pair
+        `(P_pairs[0][r], P_pairs[1][r])`.
+    region_offsets, region_states, region_policies, region_rewards
+        Only with `analytic`. The regions of state `i` are
+        `region_offsets[i]` up to (excluding) `region_offsets[i + 1]`. Region
+        `r` leads to state `region_states[r]`, and its best policy
+        `region_policies[r]` has the payoff `region_rewards[r]`.
+    V : numpy.ndarray
+        A float array of shape `(N + 1,)` with the optimal infinite-horizon
+        reward of each state. This attribute should be retrieved only after
+        calling `run`.
+    options : Dict[str, Any]
+        The constructor arguments other than the distribution and the model
+        parameters (`discretization`, `interpolate`, `action_bounds`,
+        `analytic`, `stochastic`, `tolerance`, `memory_budget` and
+        `table_dir`), for building solvers of related problems with the same
+        options.
+    residuals : List[float]
+        The largest update of every iteration of the last `run` (including
+        the iterations before it was resumed from a checkpoint).
     theta_0 : numpy.ndarray
         A float array of shape `(N + 1,)`. This array stores the optimal
         policies for each state. An entry `theta_0[i]` gives the optimal
@@ -90,7 +258,14 @@ class mdp_solver:
                  N,
                  gamma,
                  alpha,
-                 discretization = 2000):
+                 discretization = 2000,
+                 interpolate = False,
+                 action_bounds = None,
+                 analytic = False,
+                 stochastic = False,
+                 tolerance = 1e-6,
+                 memory_budget = 2 ** 28,
+                 table_dir = None):
         assert callable(getattr(dist, "allowed_actions", None)) and \
                callable(getattr(dist, "theta_1_from_theta_0", None)) and \
                callable(getattr(dist, "get_payoff", None)) and \
@@ -128,52 +303,615 @@ class mdp_solver:
         assert isinstance(discretization, int) and discretization > 0, \
                "The discretization has to be a positive integer"
         self.discretization = discretization
+        self.interpolate = interpolate
+        assert not (stochastic and analytic), \
+               "The analytic solver only supports mean-field transitions"
+        assert 0 < tolerance < 1, "The tolerance has to be in (0, 1)"
+        self.stochastic = stochastic
+        self.tolerance = tolerance
+        self.P = None
+        assert memory_budget > 0, "The memory budget has to be positive"
+        self.memory_budget = memory_budget
+        self.table_dir = table_dir
+        if table_dir is not None:
+            os.makedirs(table_dir, exist_ok = True)
 
-        self.Q = np.zeros((N + 1, self.discretization + 1),
-                          dtype = float)
-        self.R = np.zeros((self.N + 1, self.discretization + 1),
+        # Find the range of allowed policies for every state
+        lowers, uppers = dist.allowed_actions(
+            phi_0 = np.arange(self.N + 1) / self.N,
+            sigma = self.sigma,
+            alpha = self.alpha)
+        # Discretize allowed actions
+        lowers = (lowers * self.discretization / self.sigma).astype(int)
+        uppers = (uppers * self.discretization / self.sigma).astype(int)
+
+        self.action_bounds = action_bounds
+        if action_bounds is not None:
+            lower_b, upper_b = action_bounds
+            assert len(lower_b) == self.N + 1 and len(upper_b) == self.N + 1, \
+                   "Action bounds have to be given for every state"
+            # Narrow the allowed ranges to the bounds. If a bound does not
+            # overlap with the allowed range of its state, we keep the allowed
+            # policy that is closest to the bound instead.
+            narrowed_lowers = np.clip(lower_b, lowers, uppers)
+            narrowed_uppers = np.clip(upper_b, lowers, uppers)
+            lowers = np.minimum(narrowed_lowers, narrowed_uppers)
+            uppers = np.maximum(narrowed_lowers, narrowed_uppers)
+            self.width = int(np.max(uppers - lowers)) + 1
+            self.offset = np.minimum(lowers,
+                                     self.discretization + 1 - self.width)
+        else:
+            self.width = self.discretization + 1
+            self.offset = np.zeros(self.N + 1, dtype = int)
+        self.lower = lowers
+        self.upper = uppers
+
+        self.analytic = analytic
+        self.V = np.zeros(self.N + 1,
                           dtype = float)
-        self.S = np.zeros((self.N + 1, self.discretization + 1),
-                          dtype = np.int32)
-        self.mask = np.zeros((self.N + 1, self.discretization + 1),
-                             dtype = np.int32)
         self.theta_0 = np.zeros(self.N + 1,
                                 dtype = float)
         self.theta_1 = np.zeros(self.N + 1,
                                 dtype = float)
+        self.residuals = []
+        self._checkpoint = None
+        if self.analytic:
+            assert callable(getattr(dist, "payoff_maximizer", None)), \
+                   "The distribution does not implement `payoff_maximizer`"
+            assert not self.interpolate, \
+                   "The analytic solver only supports rounding down"
+            self.Q = self.R = self.S = self.W = self.mask = None
+            self._build_regions()
+            return
+
+        # `Q` is replaced in every iteration of `run`, so it is never
+        # memory-mapped. Files of tables that this solver doesn't keep (left
+        # over from other solvers) are removed from `table_dir`.
+        self.Q = np.zeros((self.N + 1, self.width), dtype = float)
+        self.R = self._new_table("R", float)
+        self.S = self._new_table("S", np.int32)
+        if self.interpolate:
+            self.W = self._new_table("W", float)
+        else:
+            self.W = None
+            self._remove_table("W")
+        self._remove_table("Q")
+        self.mask = self._new_table("mask", np.int32)
+
+        # Build the tables block by block of states, so that the temporaries
+        # of every block stay within `memory_budget`
+        columns = np.arange(self.width)
+        kernels = []
+        for block in self._blocks():
+            # Mark the allowed policies of every state
+            self.mask[block] = \
+                (columns >= (lowers - self.offset)[block, None]) & \
+                (columns <= (uppers - self.offset)[block, None])
+
+            # Compute all allowed state-policy pairs of the block at once
+            rows, cols, phi_0, thetas = self._allowed_pairs(block)
+
+            # Find payoffs (and the states after allocation) for all allowed
+            # policies
+            if callable(getattr(dist, "evaluate", None)):
+                self.R[rows, cols], phi_0_posts, _ = \
+                    dist.evaluate(theta_0 = thetas,
+                                  phi_0 = phi_0,
+                                  sigma = self.sigma,
+                                  tau = self.tau,
+                                  alpha = self.alpha)
+            else:
+                self.R[rows, cols] = dist.get_payoff(theta_0 = thetas,
+                                                     phi_0 = phi_0,
+                                                     sigma = self.sigma,
+                                                     tau = self.tau,
+                                                     alpha = self.alpha)
+                phi_0_posts = None
+
+            kernels.append(self._build_transitions(rows, cols, phi_0, thetas,
+                                                   phi_0_posts))
+        self._set_kernel(kernels)
+        if self.table_dir is not None:
+            for table in (self.R, self.S, self.W, self.mask):
+                if table is not None:
+                    table.flush()
+
+
+    @property
+    def options(self):
+        return dict(discretization = self.discretization,
+                    interpolate = self.interpolate,
+                    action_bounds = self.action_bounds,
+                    analytic = self.analytic,
+                    stochastic = self.stochastic,
+                    tolerance = self.tolerance,
+                    memory_budget = self.memory_budget,
+                    table_dir = self.table_dir)
+
+
+    def _new_table(self, name, dtype):
+        """
+        Returns a zeroed table of shape `(N + 1, width)`, memory-mapped to
+        `<table_dir>/<name>.npy` if `table_dir` is given.
+        """
+        if self.table_dir is None:
+            return np.zeros((self.N + 1, self.width), dtype = dtype)
+        return np.lib.format.open_memmap(
+                   os.path.join(self.table_dir, name + ".npy"),
+                   mode = "w+",
+                   dtype = dtype,
+                   shape = (self.N + 1, self.width))
+
+
+    # Removes the file of the table `name` from `table_dir`, if there is one
+    def _remove_table(self, name):
+        if self.table_dir is None:
+            return
+        try:
+            os.remove(os.path.join(self.table_dir, name + ".npy"))
+        except FileNotFoundError:
+            pass
+
+
+    def _blocks(self):
+        """
+        Returns the blocks of states (as slices) that the tables are built in.
+        Every block has as many states as fit into `memory_budget`, at
+        `BYTES_PER_PAIR` for every (allowed or not) state-policy pair. The
+        bands of `stochastic` transitions take about `sqrt(N)` times more.
+        """
+        per_state = BYTES_PER_PAIR * self.width
+        if self.stochastic:
+            per_state *= int(np.sqrt(self.N)) + 1
+        size = max(self.memory_budget // per_state, 1)
+        return [slice(start, min(start + size, self.N + 1))
+                for start in range(0, self.N + 1, size)]
+
 
-        for s in range(self.N + 1):
-            phi_0 = s / self.N
-            lower, upper = dist.allowed_actions(phi_0 = phi_0,
-                                                sigma = self.sigma,
-                                                alpha = self.alpha)
-            # Discretize allowed actions
-            lower = int(lower * self.discretization/ self.sigma)
-            upper = int(upper * self.discretization / self.sigma)
-
-            self.mask[s, lower : upper + 1] = 1
-            
-            # Find payoffs for all allowed policies
-            thetas = np.arange(lower, upper + 1) * \
-                     self.sigma / self.discretization
-            self.R[s, lower : upper + 1] = dist.get_payoff(theta_0 = thetas,
-                                                           phi_0 = phi_0,
-                                                           sigma = self.sigma,
-                                                           tau = self.tau,
-                                                           alpha = self.alpha)
-
-            # Find the new state for each policy
+    def _allowed_pairs(self, block = slice(None)):
+        """
+        Returns the rows and columns of the tables of all allowed state-policy
+        pairs of the states in `block` (all states by default), along with
+        their (non-discretized) states and policies.
+        """
+        rows, cols = np.nonzero(self.mask[block])
+        rows += block.start or 0
+        phi_0 = rows / self.N
+        thetas = (self.offset[rows] + cols) * self.sigma / self.discretization
+        # The largest policy can exceed `sigma` by a rounding error
+        thetas = np.minimum(thetas, self.sigma)
+        return rows, cols, phi_0, thetas
+
+
+    def _phi_0_new(self, phi_0, thetas, phi_0_posts = None):
+        """
+        Returns the (non-discretized) next states for the given states and
+        policies, after opportunity allocation and redistribution. The states
+        after allocation (`phi_0_post`) are computed unless given.
+        """
+        if phi_0_posts is None:
+            phi_0_posts = self.dist.phi_0_post(thetas, phi_0, self.sigma)
+        # NB: This is a general formula that applies to any distribution
+        return phi_0_posts * (1.0 - self.p_D) + \
+               (phi_0_posts ** 2) * self.p_D + \
+               (1 - phi_0_posts) * self.p_A * phi_0_posts
+
+
+    def _build_transitions(self, rows, cols, phi_0, thetas,
+                           phi_0_posts = None):
+        """
+        Fills `S` (and `W` with interpolation) for the given state-policy
+        pairs (see `_allowed_pairs`), whose states after allocation
+        (`phi_0_post`) can be given. With `stochastic`, returns the part of
+        the kernel for these pairs (see `_build_kernel`).
+        """
+        if phi_0_posts is None:
             phi_0_posts = self.dist.phi_0_post(thetas, phi_0, self.sigma)
-            # NB: This is a general formula that applies to any distribution
-            phi_0_news = phi_0_posts * (1.0 - self.p_D) + \
-                         (phi_0_posts ** 2) * self.p_D + \
-                         (1 - phi_0_posts) * self.p_A * phi_0_posts
+        phi_0_news = self._phi_0_new(phi_0, thetas, phi_0_posts)
+        if self.interpolate:
+            # Split the transition between the two neighbouring states.
+            # The lower neighbour is capped at `N - 1` so that the upper
+            # neighbour always exists (it then gets the full weight when
+            # `phi_0_new == 1`).
+            scaled = phi_0_news * self.N
+            s_news = np.minimum(scaled.astype(int), self.N - 1)
+            self.S[rows, cols] = s_news
+            self.W[rows, cols] = np.clip(scaled - s_news, 0, 1)
+        else:
             # Discretize new states and update `S`
-            s_news = (phi_0_news * self.N).astype(int)
-            self.S[s, lower : upper + 1] = s_news
+            self.S[rows, cols] = (phi_0_news * self.N).astype(int)
+        if self.stochastic:
+            return self._build_kernel(rows, cols, phi_0, thetas, phi_0_posts)
+        return None
+
+
+    def _build_kernel(self, rows, cols, phi_0, thetas, posts):
+        """
+        Returns the rows, columns and stochastic transitions (as rows of `P`)
+        of the given state-policy pairs (see `_allowed_pairs` and
+        `stochastic`), whose states after allocation are `posts`.
+
+        In state `i`, each of the `i` unprivileged agents succeeds with the
+        probability `q` that gives the mean-field `phi_0_post`, so the number
+        of unprivileged agents after allocation `m` is binomial. Then every
+        unprivileged agent leaves with probability `p_D * (1 - m / N)` and
+        every privileged agent joins with probability `p_A * m / N` (which
+        gives the mean-field redistribution on average). We approximate the
+        number of unprivileged agents in the next generation by a normal
+        distribution with the mean-field mean and the variance of this
+        process (by the delta method for the dependence on `m`), binned to the
+        states with a continuity correction. Bins whose probability is below
+        `tolerance` in the tails are cut off, and the rest is renormalized.
+        """
+        from scipy import sparse
+        from scipy.special import ndtr, ndtri
+
+        N = self.N
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            q = np.where(phi_0 > 0, 1 - posts / phi_0, 0)
+        q = np.clip(q, 0, 1)
+        mean = self._phi_0_new(phi_0, thetas, posts) * N
+        leave = self.p_D * (1 - posts)
+        join = self.p_A * posts
+        slope = 1 + (self.p_A - self.p_D) * (1 - 2 * posts)
+        var = slope ** 2 * rows * q * (1 - q) + \
+              N * (posts * leave * (1 - leave) + \
+                   (1 - posts) * join * (1 - join))
+        # Without any randomness, all the mass goes to the nearest state
+        sd = np.maximum(np.sqrt(var), 1e-12)
+
+        # The band of next states of every pair
+        z = ndtri(1 - self.tolerance / 2)
+        lo = np.clip(np.ceil(mean - z * sd - 0.5), 0, N).astype(int)
+        hi = np.clip(np.floor(mean + z * sd + 0.5), 0, N).astype(int)
+        hi = np.maximum(lo, hi)
+        widths = hi - lo + 1
+        pairs = np.repeat(np.arange(len(rows)), widths)
+        ks = np.arange(widths.sum()) - \
+             np.repeat(np.cumsum(widths) - widths - lo, widths)
+
+        # The outermost states also get the tails beyond them
+        upper = np.where(ks == N, np.inf, ks + 0.5)
+        lower = np.where(ks == 0, -np.inf, ks - 0.5)
+        probs = ndtr((upper - mean[pairs]) / sd[pairs]) - \
+                ndtr((lower - mean[pairs]) / sd[pairs])
+        probs /= np.bincount(pairs, weights = probs,
+                             minlength = len(rows))[pairs]
+        return rows, cols, sparse.csr_matrix((probs, (pairs, ks)),
+                                             shape = (len(rows), N + 1))
+
+
+    def _set_kernel(self, kernels):
+        """
+        Sets `P` and `P_pairs` from the parts of the kernel returned by
+        `_build_transitions` for all blocks of states, in order.
+        """
+        if not self.stochastic:
+            return
+        from scipy import sparse
+        self.P = sparse.vstack([P for _, _, P in kernels], format = "csr")
+        self.P_pairs = (np.concatenate([rows for rows, _, _ in kernels]),
+                        np.concatenate([cols for _, cols, _ in kernels]))
+
+
+    def _next_states(self, states, policies):
+        """
+        Returns the next states, rounded down to the grid, for the given
+        (discretized) states and policies. The result is the same as in `S`.
+        """
+        thetas = np.minimum(policies * self.sigma / self.discretization,
+                            self.sigma)
+        return (self._phi_0_new(states / self.N, thetas) * self.N).astype(int)
+
+
+    def _build_regions(self):
+        """
+        Builds the tables of the analytic solver (see `analytic`).
+
+        The next state (rounded down) never decreases with the policy, so the
+        allowed policies of every state split into intervals, or regions, that
+        all lead to the same next state. Within a region, only the payoff
+        depends on the policy, so the best policy of the region doesn't depend
+        on the state values. The payoff is concave in the policy, so this is
+        the maximizer of the payoff (`dist.payoff_maximizer`) clipped to the
+        region. Value iteration then only chooses between the regions of every
+        state.
+        """
+        states = np.arange(self.N + 1)
+        k_lo = self._next_states(states, self.lower)
+        k_hi = self._next_states(states, self.upper)
+
+        # For every state and every next state `k` it can reach besides the
+        # one of its lowest policy, binary search for the first policy that
+        # leads to `k` or beyond
+        counts = k_hi - k_lo
+        rows = np.repeat(states, counts)
+        ks = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                                 counts) + \
+             np.repeat(k_lo + 1, counts)
+        lo = self.lower[rows]
+        hi = self.upper[rows]
+        while np.any(hi - lo > 1):
+            mid = (lo + hi) // 2
+            reached = self._next_states(rows, mid) >= ks
+            lo = np.where(reached, lo, mid)
+            hi = np.where(reached, mid, hi)
+
+        # Regions start at the lowest policy and at every boundary, and end
+        # before the next start. Skipped next states give empty regions.
+        rows = np.concatenate((states, rows))
+        starts = np.concatenate((self.lower, hi))
+        order = np.lexsort((starts, rows))
+        rows, starts = rows[order], starts[order]
+        ends = np.append(starts[1:] - 1, 0)
+        last = np.append(rows[1:] != rows[:-1], True)
+        ends[last] = self.upper[rows[last]]
+        keep = starts <= ends
+        rows, starts, ends = rows[keep], starts[keep], ends[keep]
+
+        # The best policy of a region is the payoff maximizer clipped to the
+        # region, rounded either way. Of equal payoffs, we take the smallest
+        # policy, as `argmax` would.
+        phi_0 = rows / self.N
+        vertex = self.dist.payoff_maximizer(phi_0, self.sigma, self.tau,
+                                            self.alpha)
+        vertex = np.floor(np.clip(vertex * self.discretization / self.sigma,
+                                  starts, ends)).astype(int)
+        candidates = np.stack((starts,
+                               vertex,
+                               np.minimum(vertex + 1, ends),
+                               ends), axis = 1)
+        thetas = np.minimum(candidates * self.sigma / self.discretization,
+                            self.sigma)
+        payoffs = self.dist.get_payoff(theta_0 = thetas,
+                                       phi_0 = phi_0[:, None],
+                                       sigma = self.sigma,
+                                       tau = self.tau,
+                                       alpha = self.alpha)
+        best = payoffs.argmax(axis = 1)
+        regions = np.arange(len(rows))
+        self.region_offsets = np.flatnonzero(
+                                  np.append(True, rows[1:] != rows[:-1]))
+        self.region_policies = candidates[regions, best]
+        self.region_rewards = payoffs[regions, best]
+        self.region_states = self._next_states(rows, starts)
+
+
+    def _region_policies(self, values):
+        """
+        Returns the first best policy of every state, given the `values` of
+        all regions (see `_build_regions`).
+        """
+        lengths = np.diff(np.append(self.region_offsets, len(values)))
+        best = np.maximum.reduceat(values, self.region_offsets)
+        is_best = np.flatnonzero(values == np.repeat(best, lengths))
+        segments = np.repeat(np.arange(self.N + 1), lengths)[is_best]
+        first = is_best[np.unique(segments, return_index = True)[1]]
+        return self.region_policies[first]
+
+
+    def with_redistribution(self, p_A, p_D):
+        """
+        Returns a new solver that only differs from this one in the
+        redistribution probabilities `p_A` and `p_D`. These only affect the
+        transitions, so the new solver shares `R`, `mask` (and the other
+        tables that don't depend on them) with this one, and only `S` (and
+        `W`) are recomputed. This is much cheaper than constructing a new
+        solver from scratch. An `analytic` solver rebuilds its regions.
+        """
+        assert 0 <= p_A <= 1 and 0 <= p_D <= 1, \
+               "Transition probabilities have to be in [0, 1]"
+        solver = copy.copy(self)
+        solver.p_A = p_A
+        solver.p_D = p_D
+        solver.V = np.zeros_like(self.V)
+        solver.theta_0 = np.zeros_like(self.theta_0)
+        solver.theta_1 = np.zeros_like(self.theta_1)
+        if self.analytic:
+            solver._build_regions()
+            return solver
+        solver.S = np.zeros_like(self.S)
+        if self.W is not None:
+            solver.W = np.zeros_like(self.W)
+        solver.Q = np.zeros_like(self.Q)
+        solver._set_kernel([solver._build_transitions(
+                                *solver._allowed_pairs(block))
+                            for block in solver._blocks()])
+        return solver
 
                 
-    def run(self, epsilon = 1e-4):
+    def _next_values(self, V):
+        """
+        Returns the value of the next state for every state-policy pair, given
+        the state values `V`. With interpolation, the value is interpolated
+        linearly between the two neighbouring grid states.
+        """
+        if self.P is not None:
+            values = np.zeros((self.N + 1, self.width), dtype = float)
+            values[self.P_pairs] = self.P @ V
+            return values
+        if self.W is None:
+            return V[self.S]
+        # NB: `S` is at most `N - 1` with interpolation
+        return V[self.S] + self.W * np.diff(V)[self.S]
+
+
+    def _monotone_backup(self, V, decreasing):
+        """
+        Performs a value iteration update from the state values `V`, assuming
+        that the optimal policy is monotone in the state. Returns the new state
+        values and the corresponding policies, both of shape `(N + 1,)`.
+
+        We use divide-and-conquer: the optimal policy of the middle state of an
+        interval of states is found first, and it then bounds the search on
+        either side. All intervals on the same level of the recursion are
+        processed together, so every level only evaluates about
+        `N + discretization` state-policy pairs, instead of `N * discretization`
+        for the full search.
+        """
+        V_new = np.zeros(self.N + 1, dtype = float)
+        policies = np.zeros(self.N + 1, dtype = int)
+
+        # The state `phi_0 = 0` allows every policy, so it would not be bounded
+        # by its neighbours anyway. Search all of its policies.
+        next_values = V[self.S[0]]
+        if self.W is not None:
+            next_values += self.W[0] * (V[self.S[0] + 1] - next_values)
+        row = (self.R[0] + self.gamma * next_values) * self.mask[0]
+        policies[0] = self.offset[0] + row.argmax()
+        V_new[0] = row.max()
+
+        # Intervals of states [`left`, `right`] and their policy bounds
+        # [`bound_lo`, `bound_hi`]
+        left = np.array([1])
+        right = np.array([self.N])
+        bound_lo = np.array([0])
+        bound_hi = np.array([self.discretization])
+        while len(left) > 0:
+            mid = (left + right) // 2
+            lo = np.clip(bound_lo, self.lower[mid], self.upper[mid])
+            hi = np.clip(bound_hi, self.lower[mid], self.upper[mid])
+            hi = np.maximum(lo, hi)
+
+            # Evaluate all bounded policies of all middle states at once
+            lengths = hi - lo + 1
+            starts = np.cumsum(lengths) - lengths
+            rows = np.repeat(mid, lengths)
+            cols = np.arange(lengths.sum()) - np.repeat(starts - lo, lengths) - \
+                   self.offset[rows]
+            values = self.R[rows, cols] + self.gamma * V[self.S[rows, cols]]
+            if self.W is not None:
+                values += self.gamma * self.W[rows, cols] * \
+                          (V[self.S[rows, cols] + 1] - V[self.S[rows, cols]])
+
+            # Find the first maximum of every interval, which is what
+            # `argmax` would choose.
+            best = np.maximum.reduceat(values, starts)
+            is_best = np.flatnonzero(values == np.repeat(best, lengths))
+            segments = np.repeat(np.arange(len(mid)), lengths)[is_best]
+            first = is_best[np.unique(segments, return_index = True)[1]]
+            V_new[mid] = best
+            policies[mid] = self.offset[mid] + cols[first]
+
+            # Split every interval around its middle state. States on the left
+            # have smaller `phi_0`, so for a decreasing policy their policies
+            # are at least the middle one.
+            split = policies[mid]
+            if decreasing:
+                left_lo, left_hi = split, bound_hi
+                right_lo, right_hi = bound_lo, split
+            else:
+                left_lo, left_hi = bound_lo, split
+                right_lo, right_hi = split, bound_hi
+            has_left = left < mid
+            has_right = mid < right
+            left, right, bound_lo, bound_hi = (
+                np.concatenate((left[has_left], mid[has_right] + 1)),
+                np.concatenate((mid[has_left] - 1, right[has_right])),
+                np.concatenate((left_lo[has_left], right_lo[has_right])),
+                np.concatenate((left_hi[has_left], right_hi[has_right])))
+        return V_new, policies
+
+
+    def _run_analytic(self, epsilon, verbose, V):
+        """
+        Runs value iteration over the regions of an `analytic` solver (see
+        `_build_regions`). The values of the regions play the role of `Q`, so
+        the updates and the termination are the same as in `run`. Sets `V`
+        and returns the optimal (discretized) policies.
+        """
+        if V is None:
+            values = np.zeros(len(self.region_states), dtype = float)
+        else:
+            values = self.region_rewards + \
+                     self.gamma * V[self.region_states]
+        while True:
+            V = np.maximum.reduceat(values, self.region_offsets)
+            values_new = self.region_rewards + \
+                         self.gamma * V[self.region_states]
+            max_e = np.max(np.abs(values - values_new))
+            if verbose:
+                print("diff:", max_e)
+            self._record(max_e, lambda: np.maximum.reduceat(
+                                            values_new, self.region_offsets))
+            values = values_new
+            if max_e < epsilon:
+                break
+        self.V = np.maximum.reduceat(values, self.region_offsets)
+        return self._region_policies(values)
+
+
+    def _run_threaded(self, epsilon, verbose, n_threads):
+        """
+        Runs the full value iteration updates of `run` on a thread pool. In
+        every update, each row of `Q` only depends on the state values from
+        the previous update, so we split the states into `n_threads` chunks and
+        update them in parallel. NumPy releases the GIL in the gathers,
+        arithmetic and reductions that make up the update, so the threads
+        really do run at the same time. Each chunk has its own preallocated
+        buffer, and the updates are written in place, so no memory is
+        allocated per iteration.
+        """
+        bounds = np.linspace(0, self.N + 1, n_threads + 1).astype(int)
+        chunks = [slice(start, stop)
+                  for start, stop in zip(bounds[:-1], bounds[1:])
+                  if start < stop]
+        buffers = [np.empty((rows.stop - rows.start, self.width), dtype = float)
+                   for rows in chunks]
+        diffs = np.zeros(len(chunks), dtype = float)
+        # Gathering with native-size indices is about twice as fast
+        S = self.S.astype(np.intp)
+
+        def update(i, V, V_diff, Q, Q_new, V_new):
+            rows = chunks[i]
+            buffer = buffers[i]
+            out = Q_new[rows]
+            # Same as the update in `run`, but in place
+            np.take(V, S[rows], out = out)
+            if self.W is not None:
+                np.take(V_diff, S[rows], out = buffer)
+                buffer *= self.W[rows]
+                out += buffer
+            out *= self.gamma
+            out += self.R[rows]
+            out *= self.mask[rows]
+            np.subtract(Q[rows], out, out = buffer)
+            np.abs(buffer, out = buffer)
+            diffs[i] = buffer.max()
+            out.max(axis = 1, out = V_new[rows])
+
+        Q = self.Q
+        Q_new = np.empty_like(Q)
+        V = Q.max(axis = 1)
+        V_new = np.empty_like(V)
+        with ThreadPoolExecutor(max_workers = n_threads) as pool:
+            while True:
+                V_diff = np.diff(V)
+                futures = [pool.submit(update, i, V, V_diff, Q, Q_new, V_new)
+                           for i in range(len(chunks))]
+                for future in futures:
+                    future.result()
+                max_e = diffs.max()
+                if verbose:
+                    print("diff:", max_e)
+                self._record(max_e, lambda: V_new)
+                Q, Q_new = Q_new, Q
+                V, V_new = V_new, V
+                if max_e < epsilon:
+                    break
+        self.Q = Q
+
+
+    def run(self,
+            epsilon = 1e-4,
+            verbose = True,
+            V = None,
+            monotone = False,
+            backend = "numpy",
+            n_threads = 1,
+            checkpoint = None,
+            checkpoint_iterations = None,
+            checkpoint_seconds = 60.0):
         """
         Solves for optimal policies using infinite-horizon value iteration.
 
@@ -183,6 +921,56 @@ class mdp_solver:
             The threshold for terminating the value iteration. If the `Q` matrix
             is updated by less than `epsilon` in an iteration, we consider the
             algorithm to be converged.
+        verbose : bool (optional)
+            If `True` (the default), print the size of the update in every
+            iteration.
+        V : numpy.ndarray (optional)
+            A float array of shape `(N + 1,)` with initial state values. If
+            given, value iteration is warm-started from `V` instead of from 0.
+            A good initial guess (e.g. a solution on a coarser grid) can save
+            many iterations.
+        monotone : bool (optional)
+            If `True`, assume that the optimal policy is monotone in `phi_0`
+            and use this to restrict the search for the best policy of every
+            state to the range bounded by the best policies of its neighbours.
+            This takes about `(N + discretization) * log(N)` work per iteration
+            instead of `N * discretization`. The direction of monotonicity is
+            taken from the first iteration. After converging, we continue with
+            the full search, which normally stops after a single iteration. If
+            the assumption does not hold (the restricted updates stop
+            converging, or the full search finds better policies), the full
+            search keeps going until it converges to the true optimum.
+        backend : str (optional)
+            Either `"numpy"` (the default) or `"numba"`. The `"numba"` backend
+            runs a compiled update (see `aamodel.kernels`) that makes a single
+            pass over the allowed policies of each state, in parallel over the
+            states. As with `monotone`, the result is then verified by the full
+            NumPy update. If `numba` is not installed, we warn and fall back to
+            NumPy.
+        n_threads : int or None (optional)
+            The number of threads for the full update. The states are split
+            into `n_threads` chunks that are updated in parallel (see
+            `_run_threaded`). `None` uses all cores. The result is the same as
+            with a single thread (the default).
+        checkpoint : str or None (optional)
+            If given, the state values, the number of iterations and the
+            residual history (see `residuals`) are saved to this file during
+            value iteration, and once more when it converges. If the file
+            already exists, value iteration resumes from it instead (and `V`
+            is ignored), so a solve that was killed can be continued by
+            running it again. The file is replaced atomically, so it always
+            holds a complete checkpoint. A checkpoint of a different problem
+            raises `ValueError`.
+        checkpoint_iterations, checkpoint_seconds : int, float or None
+            (optional)
+            With `checkpoint`, a checkpoint is saved after this many
+            iterations or seconds since the last one, whichever comes first
+            (by default, every 60 seconds). `None` disables either.
+
+        For an `analytic` solver, `monotone`, `backend` and `n_threads` have
+        no effect, as value iteration runs over its regions instead of the
+        tables. For a `stochastic` solver, they have no effect either, as
+        every update is a sparse matrix-vector product with `P`.
 
         Returns
         -------
@@ -193,19 +981,156 @@ class mdp_solver:
             thresholds for the unprivileged population). `theta_1` contains the
             corresponding thresholds for the privileged population.
         """
-        while True:
-            # Perform an update, but multiply by `mask` to get rid of the
-            # entries for disallowed state-policy pairs.
-            Q_new = (self.R + self.gamma * self.Q.max(axis = 1)[self.S]) * \
-                    self.mask
-            max_e = np.max(np.abs(self.Q - Q_new))
-            print("diff:", max_e)
-            self.Q = Q_new
-            if max_e < epsilon:
-                break
-        
+        self.residuals = []
+        self._checkpoint = None
+        if checkpoint is not None:
+            self._checkpoint = _checkpoint(checkpoint,
+                                           self._checkpoint_key(),
+                                           iterations = checkpoint_iterations,
+                                           seconds = checkpoint_seconds)
+            resumed = self._checkpoint.load()
+            if resumed is not None:
+                V, self.residuals = resumed
+                if verbose:
+                    print("resuming from iteration", len(self.residuals))
+
+        if V is not None:
+            assert len(V) == self.N + 1, \
+                   "Initial values have to be given for every state"
+            if not self.analytic:
+                self.Q = (self.R + self.gamma * self._next_values(V)) * \
+                         self.mask
+
+        if self.analytic:
+            policies = self._run_analytic(epsilon, verbose, V)
+            self._save_checkpoint()
+            return self._set_policies(policies)
+        if self.stochastic:
+            monotone, backend, n_threads = False, "numpy", 1
+
+        if monotone:
+            # Do one full update to find the direction of monotonicity
+            self.Q = (self.R + \
+                      self.gamma * self._next_values(self.Q.max(axis = 1))) * \
+                     self.mask
+            policies = self.offset + self.Q.argmax(axis = 1)
+            decreasing = policies[-1] <= policies[1 if self.N > 1 else 0]
+
+            V = self.Q.max(axis = 1)
+            prev_e = np.inf
+            while True:
+                V_new, _ = self._monotone_backup(V, decreasing)
+                max_e = np.max(np.abs(V - V_new))
+                if verbose:
+                    print("diff:", max_e)
+                self._record(max_e, lambda: V_new)
+                V = V_new
+                if max_e < epsilon:
+                    break
+                # A full update shrinks the difference by at least `gamma`
+                # in every iteration. If the restricted update does not, the
+                # policy is not monotone, so we fall back to the full search.
+                if max_e > self.gamma * prev_e * (1 + 1e-9):
+                    if verbose:
+                        print("policy is not monotone, using full search")
+                    break
+                prev_e = max_e
+            # Continue with the full search, which verifies the result
+            self.Q = (self.R + self.gamma * self._next_values(V)) * self.mask
+
+        assert backend in ("numpy", "numba"), "Unknown backend"
+        if backend == "numba":
+            from aamodel import kernels
+            if not kernels.available:
+                warnings.warn("numba is not installed, using NumPy instead")
+            else:
+                V = self.Q.max(axis = 1)
+                V_new = np.empty(self.N + 1, dtype = float)
+                best = np.empty(self.N + 1, dtype = np.intp)
+                W = self.W if self.W is not None else np.zeros((0, 0))
+                while True:
+                    kernels.bellman_update(self.R, self.S, W, self.offset,
+                                           self.lower, self.upper, V,
+                                           self.gamma, V_new, best)
+                    max_e = np.max(np.abs(V - V_new))
+                    if verbose:
+                        print("diff:", max_e)
+                    self._record(max_e, lambda: V_new)
+                    V, V_new = V_new, V
+                    if max_e < epsilon:
+                        break
+                # Continue with the full update, which verifies the result
+                self.Q = (self.R + self.gamma * self._next_values(V)) * \
+                         self.mask
+
+        if n_threads is None:
+            n_threads = os.cpu_count()
+        if n_threads > 1:
+            self._run_threaded(epsilon, verbose, n_threads)
+        else:
+            while True:
+                # Perform an update, but multiply by `mask` to get rid of the
+                # entries for disallowed state-policy pairs.
+                Q_new = (self.R + \
+                         self.gamma * \
+                         self._next_values(self.Q.max(axis = 1))) * \
+                        self.mask
+                max_e = np.max(np.abs(self.Q - Q_new))
+                if verbose:
+                    print("diff:", max_e)
+                self._record(max_e, lambda: Q_new.max(axis = 1))
+                self.Q = Q_new
+                if max_e < epsilon:
+                    break
+        self.V = self.Q.max(axis = 1)
+        self._save_checkpoint()
+        return self._set_policies(self.offset + self.Q.argmax(axis = 1))
+
+
+    # Returns a fingerprint of the problem, which identifies its checkpoints
+    def _checkpoint_key(self):
+        problem = dict(dist = type(self.dist).__name__,
+                       dist_params = vars(self.dist),
+                       sigma = self.sigma,
+                       tau = self.tau,
+                       p_A = self.p_A,
+                       p_D = self.p_D,
+                       N = self.N,
+                       gamma = self.gamma,
+                       alpha = self.alpha,
+                       discretization = self.discretization,
+                       interpolate = self.interpolate,
+                       analytic = self.analytic,
+                       stochastic = self.stochastic,
+                       tolerance = self.tolerance)
+        digest = hashlib.sha256(json.dumps(problem, sort_keys = True,
+                                           default = str).encode())
+        digest.update(np.ascontiguousarray(self.lower, dtype = np.int64))
+        digest.update(np.ascontiguousarray(self.upper, dtype = np.int64))
+        return digest.hexdigest()
+
+
+    # Records the largest update `max_e` of an iteration of `run`, and saves
+    # a checkpoint if one is due (`values` returns the new state values)
+    def _record(self, max_e, values):
+        self.residuals.append(float(max_e))
+        if self._checkpoint is not None:
+            self._checkpoint.update(self.residuals, values)
+
+
+    # Saves the final checkpoint of `run`, once `V` is set
+    def _save_checkpoint(self):
+        if self._checkpoint is not None:
+            self._checkpoint.save(self.residuals, self.V)
+
+
+    def _set_policies(self, policies):
+        """
+        Sets `theta_0` and `theta_1` from the optimal (discretized) policies,
+        and returns them as in `run`.
+        """
         phi_0 = np.linspace(0, 1, self.N + 1)
-        self.theta_0 = self.Q.argmax(axis=1) * self.sigma / self.discretization
+        self.theta_0 = policies * self.sigma / self.discretization
         self.theta_1 = self.dist.theta_1_from_theta_0(self.theta_0,
                                                       phi_0,
                                                       self.sigma,
@@ -213,3 +1138,183 @@ class mdp_solver:
                                                       self.alpha)
         return phi_0, self.theta_0, self.theta_1
 
+
+
+    def run_finite_horizon(self, T, path = None):
+        """
+        Solves for optimal policies over a finite horizon of `T` generations
+        using backward induction. Unlike `run`, the optimal policy depends on
+        the generation: there is no reward after the last generation, so the
+        policies get more myopic towards the end.
+
+        Only the indices of the optimal policies are stored (as `int16` when
+        the discretization allows it), so the result takes `T * (N + 1)` small
+        integers. The tables `R`, `S` and `mask` are shared with `run`.
+
+        Parameters
+        ----------
+        T : int
+            The number of generations.
+        path : str (optional)
+            If given, the policies are streamed to a `.npy` file at `path`
+            generation by generation, instead of being kept in memory. The
+            returned array is then a memory map of that file, which can later
+            be opened with `numpy.load(path, mmap_mode = "r")`.
+
+        Returns
+        -------
+        phi_0, actions, V
+            `phi_0` is a float array of shape `(N + 1,)` with all
+            (non-discretized) states. `actions` is an integer array of shape
+            `(T, N + 1)`, where `actions[t, i]` is the optimal policy of state
+            `i` in generation `t` (counting from 0). The optimal threshold is
+            then `theta_0 = actions[t, i] * sigma / discretization`. `V` is a
+            float array of shape `(N + 1,)` with the optimal `T`-generation
+            reward of every state.
+        """
+        assert isinstance(T, int) and T > 0, \
+               "The horizon has to be a positive integer"
+        dtype = np.int16 if self.discretization <= np.iinfo(np.int16).max \
+                else np.int32
+        if path is None:
+            actions = np.zeros((T, self.N + 1), dtype = dtype)
+        else:
+            actions = np.lib.format.open_memmap(path,
+                                                mode = "w+",
+                                                dtype = dtype,
+                                                shape = (T, self.N + 1))
+
+        if self.analytic:
+            V = np.zeros(self.N + 1, dtype = float)
+            for t in range(T - 1, -1, -1):
+                values = self.region_rewards + \
+                         self.gamma * V[self.region_states]
+                actions[t] = self._region_policies(values)
+                V = np.maximum.reduceat(values, self.region_offsets)
+            if path is not None:
+                actions.flush()
+            return np.linspace(0, 1, self.N + 1), actions, V
+
+        # Reuse the same buffers for the update in every generation. Gathering
+        # with native-size indices is about twice as fast, so convert `S` once.
+        S = self.S.astype(np.intp)
+        Q = np.empty((self.N + 1, self.width), dtype = float)
+        if self.W is not None:
+            buffer = np.empty((self.N + 1, self.width), dtype = float)
+        V = np.zeros(self.N + 1, dtype = float)
+        for t in range(T - 1, -1, -1):
+            if self.P is not None:
+                Q[...] = self._next_values(V)
+            else:
+                # Same as `_next_values`, but without temporary arrays
+                np.take(V, S, out = Q)
+                if self.W is not None:
+                    np.take(np.diff(V), S, out = buffer)
+                    buffer *= self.W
+                    Q += buffer
+            Q *= self.gamma
+            Q += self.R
+            Q *= self.mask
+            best = Q.argmax(axis = 1)
+            actions[t] = self.offset + best
+            V = Q[np.arange(self.N + 1), best]
+
+        if path is not None:
+            actions.flush()
+        return np.linspace(0, 1, self.N + 1), actions, V
+
+
+def solve_multigrid(dist,
+                    sigma,
+                    tau,
+                    p_A,
+                    p_D,
+                    gamma,
+                    alpha,
+                    levels = (100, 400, 2000),
+                    discretization = 2000,
+                    margin = 0.01,
+                    interpolate = True,
+                    epsilon = 1e-4,
+                    verbose = False,
+                    **kwargs):
+    """
+    Solves for optimal policies coarse-to-fine. We first solve on the coarsest
+    grid of states, and then use each solution to warm-start the solve on the
+    next finer grid. On the finer grids, we also narrow the allowed policies of
+    each state to the coarse optimal policies around it (widened by `margin`),
+    so the tables of the finer grids are much smaller than the full ones.
+
+    Since most of the work of value iteration is propagating values through
+    the states, which a coarse grid does cheaply, this is much faster than
+    solving directly on the finest grid, especially for `gamma` close to 1.
+
+    Parameters
+    ----------
+    dist, sigma, tau, p_A, p_D, gamma, alpha
+        See `mdp_solver`.
+    levels : Sequence[int] (optional)
+        The numbers of agents `N` of the grids, from coarsest to finest.
+    discretization : int or Sequence[int] (optional)
+        Discretization of the policy space, either for all levels or for each
+        level separately.
+    margin : float (optional)
+        How far (in units of `theta_0`) the allowed policies reach beyond the
+        coarse optimal policies on finer grids.
+    interpolate : bool (optional)
+        Passed on to `mdp_solver`. By default, we interpolate transitions,
+        because rounding down biases the coarse solutions too much to narrow
+        the policies of finer grids around them.
+    epsilon : float (optional)
+        The termination threshold of value iteration on every level.
+    verbose : bool (optional)
+        Passed on to `mdp_solver.run`.
+    kwargs
+        Other arguments to `mdp_solver`.
+
+    Returns
+    -------
+    solver : mdp_solver
+        The solver for the finest grid, after calling `run`.
+    """
+    assert len(levels) > 0, "At least one level is required"
+    if isinstance(discretization, int):
+        discretization = [discretization] * len(levels)
+    assert len(discretization) == len(levels), \
+           "Discretization has to be given for every level"
+
+    solver = None
+    for N, D in zip(levels, discretization):
+        action_bounds = None
+        V = None
+        if solver is not None:
+            phi_0 = np.linspace(0, 1, N + 1)
+            # Prolong the coarse values to the finer grid
+            V = np.interp(phi_0, np.linspace(0, 1, solver.N + 1), solver.V)
+
+            # The policy of `phi_0 = 0` is arbitrary (there is nobody
+            # unprivileged), so don't let it widen the bounds of its neighbours.
+            theta_0 = solver.theta_0.copy()
+            theta_0[0] = theta_0[1]
+            # Bound each fine state by the coarse policies of the two coarse
+            # states around it.
+            coarse = np.minimum((phi_0 * solver.N).astype(int), solver.N - 1)
+            lower = np.minimum(theta_0[coarse], theta_0[coarse + 1]) - margin
+            upper = np.maximum(theta_0[coarse], theta_0[coarse + 1]) + margin
+            action_bounds = (np.floor(lower * D / sigma).astype(int),
+                             np.ceil(upper * D / sigma).astype(int))
+
+        solver = mdp_solver(dist = dist,
+                            sigma = sigma,
+                            tau = tau,
+                            p_A = p_A,
+                            p_D = p_D,
+                            N = N,
+                            gamma = gamma,
+                            alpha = alpha,
+                            discretization = D,
+                            interpolate = interpolate,
+                            action_bounds = action_bounds,
+                            **kwargs)
+        solver.run(epsilon = epsilon, verbose = verbose, V = V)
+    return solver
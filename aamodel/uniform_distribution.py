@@ -44,27 +44,34 @@ class uniform_distribution:
 
         Parameters (explained in class docstring)
         -----------------------------------------
-        phi_0 : float
+        phi_0 : numpy.ndarray or scalar
+            Here, we allow the possibility of batched computation over multiple
+            `phi_0`.
         sigma : float
         alpha : float
 
         Returns
         -------
-        [lower, upper] : Tuple[float, float]
-            Range of allowed actions. We guarantee that both `lower` and `upper`
-            are in [0, `sigma`], and that `lower <= upper`.
+        [lower, upper] : Tuple[numpy.ndarray, numpy.ndarray]
+            Range of allowed actions, element-wise for `phi_0` (floats if
+            `phi_0` is a scalar). We guarantee that both `lower` and `upper` are
+            in [0, `sigma`], and that `lower <= upper`.
         """
-        # Special case: `phi_0 == 0`, avoid division by 0.
+        phi_0 = np.asarray(phi_0, dtype = float)
+        # Cap [`lower`, `upper`] to [0, `sigma`].
+        # Suppress warnings if we divide by 0.
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            lower = np.maximum(sigma * (1.0 - alpha / phi_0), 0)
+            upper = np.minimum(sigma * (1.0 - alpha) / phi_0, sigma)
+        # Special case: `phi_0 == 0`, fix division by 0 above.
         # Any action is allowed in this case (it won't have any effect anyway,
         # because there is no unprivileged population).
-        if isclose(phi_0, 0.0):
-            lower = 0
-            upper = sigma
-        else:
-            # Cap [`lower`, `upper`] to [0, `sigma`].
-            lower = max(sigma * (1.0 - alpha / phi_0), 0)
-            upper = min(sigma * (1.0 - alpha) / phi_0, sigma)
-        assert 0 <= lower <= upper <= sigma
+        lower = np.where(phi_0 == 0, 0, lower)
+        upper = np.where(phi_0 == 0, sigma, upper)
+        assert np.all(0 <= lower) and np.all(lower <= upper) and \
+               np.all(upper <= sigma)
+        if phi_0.ndim == 0:
+            return float(lower), float(upper)
         return lower, upper
 
 
@@ -115,7 +122,9 @@ class uniform_distribution:
         Parameters (explained in class docstring)
         -----------------------------------------
         theta_0 : numpy.ndarray
-        phi_0 : float
+        phi_0 : numpy.ndarray or scalar
+            Here, we allow the possibility of batched computation over multiple
+            `phi_0`, element-wise with `theta_0`.
         sigma : float
         tau : float
         alpha : float
@@ -128,6 +137,32 @@ class uniform_distribution:
             [0, `alpha`]. Having a payoff greater than `alpha` would mean that
             more than `alpha` opportunities were allocated.
         """
+        return self.evaluate(theta_0, phi_0, sigma, tau, alpha)[0]
+
+
+    def evaluate(self, theta_0, phi_0, sigma, tau, alpha):
+        """
+        Computes the payoffs (as in `get_payoff`), the states after allocation
+        (as in `phi_0_post`) and the thresholds `theta_1` (as in
+        `theta_1_from_theta_0`) for given thresholds `theta_0` at once. They
+        share most of their computation, which is only done once here; the
+        results are the same as from the separate methods.
+
+        Parameters (explained in class docstring)
+        -----------------------------------------
+        theta_0 : numpy.ndarray
+        phi_0 : numpy.ndarray or scalar
+            Element-wise with `theta_0`, as in `get_payoff`.
+        sigma : float
+        tau : float
+        alpha : float
+
+        Returns
+        -------
+        payoffs, phi_0_post, theta_1 : Tuple[numpy.ndarray, numpy.ndarray,
+                                             numpy.ndarray]
+            Element-wise for `theta_0`.
+        """
         assert np.all(theta_0 <= sigma)
 
         theta_1 = self.theta_1_from_theta_0(theta_0, phi_0, sigma, tau, alpha)
@@ -142,12 +177,41 @@ class uniform_distribution:
         # (nobody from privileged population gets an opportunity).
         priv_payoffs = np.where(tau + sigma < theta_1, 0, possible_priv_payoffs)
 
-        # Compute payoffs for unprivileged population
-        unpriv_payoffs = (phi_0 / (2 * sigma)) * (sigma ** 2 - theta_0 ** 2)
+        # Compute payoffs for unprivileged population. The same fraction of
+        # the unprivileged population succeeds and becomes privileged.
+        successes = (phi_0 / (2 * sigma)) * (sigma ** 2 - theta_0 ** 2)
+        unpriv_payoffs = successes
 
         payoffs = unpriv_payoffs + priv_payoffs
         assert np.all(0 <= payoffs) and np.all(payoffs <= alpha)
-        return payoffs
+        return payoffs, phi_0 - successes, theta_1
+
+
+    def payoff_maximizer(self, phi_0, sigma, tau, alpha):
+        """
+        Finds the policy that maximizes the payoff of `get_payoff`, ignoring
+        the range of allowed actions. Within the allowed range, the payoff is
+        a concave quadratic in `theta_0` with its vertex where both groups get
+        the same threshold (`theta_0 == theta_1`), so its maximum over any
+        allowed interval is at this policy clipped to the interval.
+
+        NB: For `phi_0` in {0, 1}, the payoff doesn't depend on `theta_0` or
+        only one action is allowed, so any policy maximizes it.
+
+        Parameters (explained in class docstring)
+        -----------------------------------------
+        phi_0 : numpy.ndarray or scalar
+        sigma : float
+        tau : float
+        alpha : float
+
+        Returns
+        -------
+        theta_0 : numpy.ndarray or float
+            The maximizing policy, element-wise for `phi_0`. It can exceed the
+            allowed actions.
+        """
+        return sigma * (1.0 - alpha) + (1.0 - phi_0) * tau
 
 
     def phi_0_post(self, theta_0, phi_0, sigma):
@@ -159,7 +223,8 @@ class uniform_distribution:
         Parameters (explained in class docstring)
         -----------------------------------------
         theta_0 : numpy.ndarray
-        phi_0 : float
+        phi_0 : numpy.ndarray or scalar
+            Element-wise with `theta_0`, as in `get_payoff`.
         sigma : float
 
         Returns
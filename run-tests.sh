@@ -1,16 +1,11 @@
 #!/bin/bash
 
-for i in $(seq 1 1 100); do
-    echo "Running trial $i out of 100"
-    python3 -m unittest >tmp 2>&1
-    if [ $? -ne 0 ]; then
-        cat tmp
-        rm -f tmp
-        exit 1
-    fi
-done
-rm -f tmp
+# The random parts of the model are covered by statistical tests with a known
+# significance level (see `tests/test_statistics.py`), so one run is enough.
+python3 -m unittest
+if [ $? -ne 0 ]; then
+    exit 1
+fi
 
 echo ""
 echo "All tests passed!"
-
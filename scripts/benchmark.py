@@ -0,0 +1,206 @@
+# Benchmarks for `mdp_solver`.
+# Each benchmark prints the running time and, where it makes sense, the
+# accuracy of the computed policy against a fine-grid reference solve.
+# Run from the `scripts/` directory: `python benchmark.py [name ...]`.
+
+import sys
+sys.path.append("..")
+
+import os
+import subprocess
+import time
+import numpy as np
+
+from aamodel.solver import mdp_solver, solve_multigrid
+from aamodel.uniform_distribution import uniform_distribution
+from aamodel.normal_distribution import normal_distribution
+from aamodel import kernels
+
+
+# Parameters from Figure 3, used by all benchmarks unless stated otherwise
+PARAMS = dict(sigma = 0.4,
+              tau = 0.1,
+              p_A = 0,
+              p_D = 0,
+              gamma = 0.8,
+              alpha = 0.15)
+
+
+def timed_solve(dist, N, discretization, **kwargs):
+    start = time.perf_counter()
+    s = mdp_solver(dist = dist,
+                   N = N,
+                   discretization = discretization,
+                   **{**PARAMS, **kwargs})
+    states, theta_0, _ = s.run(verbose = False)
+    return states, theta_0, time.perf_counter() - start
+
+
+# Compares the error of the policy on a common `phi_0` grid.
+def policy_error(states, theta_0, ref_states, ref_theta_0):
+    grid = np.linspace(0, 1, 201)[1:]
+    return np.max(np.abs(np.interp(grid, states, theta_0) - \
+                         np.interp(grid, ref_states, ref_theta_0)))
+
+
+# Accuracy/time tradeoff of rounding down vs interpolating the next state.
+def bench_interpolation():
+    print("interpolation: N, discretization, interpolate, time [s], "
+          "max policy error")
+    for name, dist in [("uniform", uniform_distribution(0, 1)),
+                       ("normal", normal_distribution(0.5, 0.05))]:
+        print(name)
+        ref_states, ref_theta_0, _ = timed_solve(dist, 4000, 2000,
+                                                 interpolate = True)
+        for N, interpolate in [(2000, False), (200, False), (200, True)]:
+            states, theta_0, elapsed = timed_solve(dist, N, 2000,
+                                                   interpolate = interpolate)
+            error = policy_error(states, theta_0, ref_states, ref_theta_0)
+            print("  {:5d} {:5d} {:6} {:8.3f} {:.5f}".format(N, 2000,
+                                                             str(interpolate),
+                                                             elapsed, error))
+
+
+# Coarse-to-fine solve against a direct solve on the finest grid.
+def bench_multigrid():
+    print("multigrid: gamma, method, time [s], max policy error")
+    for gamma in [0.8, 0.99]:
+        params = {**PARAMS, "gamma": gamma}
+        start = time.perf_counter()
+        s_m = solve_multigrid(dist = uniform_distribution(0, 1),
+                              levels = (100, 400, 2000),
+                              discretization = 2000,
+                              **params)
+        elapsed_m = time.perf_counter() - start
+        states_d, theta_0_d, elapsed_d = timed_solve(uniform_distribution(0, 1),
+                                                     2000, 2000,
+                                                     gamma = gamma,
+                                                     interpolate = True)
+        error = policy_error(np.linspace(0, 1, s_m.N + 1), s_m.theta_0,
+                             states_d, theta_0_d)
+        print("  {:.2f} direct    {:8.3f}".format(gamma, elapsed_d))
+        print("  {:.2f} multigrid {:8.3f} {:.5f}".format(gamma, elapsed_m,
+                                                         error))
+
+
+# Monotone policy search against the full search.
+def bench_monotone():
+    print("monotone: interpolate, monotone, time [s], max policy error")
+    for interpolate in [True, False]:
+        ref_states, ref_theta_0, _ = timed_solve(uniform_distribution(0, 1),
+                                                 1000, 1000,
+                                                 gamma = 0.9,
+                                                 interpolate = interpolate)
+        for monotone in [False, True]:
+            start = time.perf_counter()
+            s = mdp_solver(dist = uniform_distribution(0, 1),
+                           N = 1000,
+                           discretization = 1000,
+                           interpolate = interpolate,
+                           **{**PARAMS, "gamma": 0.9})
+            states, theta_0, _ = s.run(verbose = False, monotone = monotone)
+            elapsed = time.perf_counter() - start
+            error = policy_error(states, theta_0, ref_states, ref_theta_0)
+            print("  {:6} {:6} {:8.3f} {:.5f}".format(str(interpolate),
+                                                      str(monotone),
+                                                      elapsed, error))
+
+
+# Value iteration backends. The first numba solve includes compilation.
+def bench_backends():
+    print("backends: interpolate, backend, time [s]")
+    backends = ["numpy", "numba"] if kernels.available else ["numpy"]
+    for interpolate in [True, False]:
+        for backend in backends:
+            s = mdp_solver(dist = uniform_distribution(0, 1),
+                           N = 2000,
+                           discretization = 2000,
+                           interpolate = interpolate,
+                           **PARAMS)
+            start = time.perf_counter()
+            s.run(verbose = False, backend = backend)
+            elapsed = time.perf_counter() - start
+            print("  {:6} {:6} {:8.3f}".format(str(interpolate), backend,
+                                               elapsed))
+
+
+# Analytic solver for the uniform distribution against the tables.
+def bench_analytic():
+    print("analytic: N, discretization, analytic, time [s], max policy error")
+    for N, discretization in [(200, 2000), (2000, 2000)]:
+        ref_states, ref_theta_0, _ = timed_solve(uniform_distribution(0, 1),
+                                                 N, discretization)
+        for analytic in [False, True]:
+            states, theta_0, elapsed = timed_solve(uniform_distribution(0, 1),
+                                                   N, discretization,
+                                                   analytic = analytic)
+            error = policy_error(states, theta_0, ref_states, ref_theta_0)
+            print("  {:5d} {:5d} {:6} {:8.3f} {:.5f}".format(
+                  N, discretization, str(analytic), elapsed, error))
+
+
+# Threaded full updates against a single thread.
+def bench_threads():
+    print("threads: n_threads, time [s]")
+    for n_threads in sorted({1, 2, 4, os.cpu_count()}):
+        s = mdp_solver(dist = uniform_distribution(0, 1),
+                       N = 2000,
+                       discretization = 2000,
+                       interpolate = True,
+                       **PARAMS)
+        start = time.perf_counter()
+        s.run(verbose = False, n_threads = n_threads)
+        elapsed = time.perf_counter() - start
+        print("  {:3d} {:8.3f}".format(n_threads, elapsed))
+
+
+# Time to import the package modules in a fresh interpreter (best of 5), and
+# which heavy dependencies the import pulls in. None of them should be needed
+# just to import the solver.
+IMPORT_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import {}
+elapsed = time.perf_counter() - start
+heavy = ["scipy", "matplotlib", "pandas", "numba"]
+print(elapsed, ",".join(m for m in heavy if m in sys.modules) or "-")
+"""
+
+
+def bench_import():
+    print("import: module, time [ms], heavy dependencies loaded")
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    for module in ["numpy", "aamodel.solver", "aamodel.normal_distribution",
+                   "aamodel.sensitivity", "aamodel.population"]:
+        times = []
+        for _ in range(5):
+            output = subprocess.run([sys.executable, "-c",
+                                     IMPORT_SCRIPT.format(module)],
+                                    cwd = root,
+                                    capture_output = True,
+                                    text = True,
+                                    check = True).stdout.split()
+            times.append(float(output[0]))
+        print("  {:28} {:8.1f} {}".format(module, 1000 * min(times),
+                                          output[1]))
+
+
+BENCHMARKS = {
+    "interpolation": bench_interpolation,
+    "multigrid": bench_multigrid,
+    "monotone": bench_monotone,
+    "backends": bench_backends,
+    "analytic": bench_analytic,
+    "threads": bench_threads,
+    "import": bench_import,
+}
+
+
+def main():
+    names = sys.argv[1:] if len(sys.argv) > 1 else list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main()
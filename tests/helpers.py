@@ -3,6 +3,19 @@ from aamodel.agent import privilege
 
 # Helper functions for testing
 class helpers:
+    # Significance level of every statistical check. Correct code fails a
+    # check with probability at most `SIGNIFICANCE`, so a run with `k` checks
+    # fails with probability at most `k * SIGNIFICANCE`.
+    SIGNIFICANCE = 1e-6
+
+    # Returns `[low, high]` such that a `Binomial(n, p)` count falls into it
+    # with probability at least `1 - significance`.
+    @staticmethod
+    def binomial_interval(n, p, significance = SIGNIFICANCE):
+        from scipy.stats import binom
+        low, high = binom.interval(1 - significance, n, p)
+        return int(low), int(high)
+
     @staticmethod
     def a_dist_uniform():
         return random.uniform(0, 1)
@@ -0,0 +1,146 @@
+import unittest
+
+from aamodel.solver import mdp_solver
+from aamodel.analysis import policy_analysis
+from aamodel.uniform_distribution import uniform_distribution
+from aamodel.normal_distribution import normal_distribution
+import numpy as np
+
+
+class analysis_test(unittest.TestCase):
+    def setUp(self):
+        self.solvers = []
+        for dist, interpolate in [(uniform_distribution(0, 1), False),
+                                  (normal_distribution(0.5, 0.05), True)]:
+            s = mdp_solver(dist = dist,
+                           sigma = 0.4,
+                           tau = 0.05,
+                           p_A = 0.062,
+                           p_D = 0.02,
+                           N = 150,
+                           gamma = 0.9,
+                           alpha = 0.05,
+                           discretization = 200,
+                           interpolate = interpolate)
+            s.run(verbose = False)
+            self.solvers.append(s)
+        s = mdp_solver(dist = uniform_distribution(0, 1),
+                       sigma = 0.4,
+                       tau = 0.05,
+                       p_A = 0.062,
+                       p_D = 0.02,
+                       N = 150,
+                       gamma = 0.9,
+                       alpha = 0.05,
+                       discretization = 200,
+                       analytic = True)
+        s.run(verbose = False)
+        self.solvers.append(s)
+
+
+    # Follows the trajectory of `state` for `T` generations, one at a time
+    @staticmethod
+    def trajectory(a, state, T):
+        states = [state]
+        for _ in range(T):
+            states.append(a.successors[states[-1]])
+        return states
+
+
+    def test_successors(self):
+        # The successors are the transitions of the optimal policies in the
+        # tables
+        for s in self.solvers[:2]:
+            a = policy_analysis(s)
+            states = np.arange(s.N + 1)
+            best = s.Q.argmax(axis = 1)
+            expected = s.S[states, best].astype(int)
+            if s.W is not None:
+                expected += (s.W[states, best] >= 0.5).astype(int)
+            np.testing.assert_array_equal(a.successors, expected)
+
+        # An analytic solver has no tables, but the same dynamics
+        np.testing.assert_array_equal(policy_analysis(self.solvers[2])
+                                          .successors,
+                                      policy_analysis(self.solvers[0])
+                                          .successors)
+
+
+    def test_stochastic(self):
+        s = mdp_solver(dist = uniform_distribution(0, 1),
+                       sigma = 0.4,
+                       tau = 0.05,
+                       p_A = 0.062,
+                       p_D = 0.02,
+                       N = 30,
+                       gamma = 0.9,
+                       alpha = 0.05,
+                       discretization = 40,
+                       stochastic = True)
+        s.run(verbose = False)
+        with self.assertRaises(ValueError):
+            policy_analysis(s)
+
+
+    def test_advance(self):
+        for s in self.solvers:
+            a = policy_analysis(s)
+            self.assertTrue(np.all((0 <= a.successors) &
+                                   (a.successors <= s.N)))
+            for T in [0, 1, 7, 64, 300]:
+                advanced = a.advance(T)
+                for state in range(0, s.N + 1, 10):
+                    self.assertEqual(advanced[state],
+                                     self.trajectory(a, state, T)[-1])
+
+
+    def test_limits(self):
+        for s in self.solvers:
+            a = policy_analysis(s)
+            representative, length = a.limits()
+            for state in range(s.N + 1):
+                # The cycle is whatever repeats after `N + 1` generations
+                states = self.trajectory(a, state, 2 * (s.N + 1))
+                cycle = set(states[s.N + 1:])
+                self.assertEqual(representative[state], min(cycle))
+                self.assertEqual(length[state], len(cycle))
+            fixed = a.fixed_points()
+            np.testing.assert_array_equal(a.successors[fixed], fixed)
+
+
+    def test_time_to_reach(self):
+        for s in self.solvers:
+            a = policy_analysis(s)
+            for threshold in [0.0, 0.3, 0.8]:
+                for T in [None, 5]:
+                    times = a.time_to_reach(threshold, T)
+                    horizon = s.N + 1 if T is None else T
+                    for state in range(s.N + 1):
+                        states = self.trajectory(a, state, horizon)
+                        hits = [t for t, x in enumerate(states)
+                                if x / s.N <= threshold]
+                        expected = hits[0] if hits else -1
+                        self.assertEqual(times[state], expected)
+
+
+    def test_discounted_sum(self):
+        for s in self.solvers:
+            a = policy_analysis(s)
+            values = np.random.uniform(0, 1, s.N + 1)
+            for T in [1, 6, 100]:
+                sums = a.discounted_sum(values, T)
+                for state in range(0, s.N + 1, 10):
+                    states = self.trajectory(a, state, T - 1)
+                    expected = sum(s.gamma ** t * values[x]
+                                   for t, x in enumerate(states))
+                    self.assertAlmostEqual(sums[state], expected)
+
+            # Mobility telescopes to the total drop in `phi_0` without
+            # discounting
+            mobility = a.discounted_mobility(50, gamma = 1.0)
+            np.testing.assert_allclose(mobility, a.phi_0 - a.phi_0[a.advance(50)],
+                                       atol = 1e-12)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import numpy as np
+import tempfile
+
+from aamodel.atlas import build_atlas, policy_atlas, THETA_SCALE
+from aamodel.experiments import normalize_point, solve
+
+
+TABLE = dict(dist = "normal", sd = [0.05, 0.1], sigma = [0.3, 0.4, 0.5],
+             tau = [0.1, 0.6], p_A = 0, p_D = 0, N = 30, discretization = 60,
+             gamma = 0.8, alpha = [0.1, 0.2])
+
+
+class atlas_test(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        build_atlas(cls.directory.name, TABLE, n_workers = 2,
+                    verbose = False)
+        cls.atlas = policy_atlas(cls.directory.name)
+
+
+    @classmethod
+    def tearDownClass(cls):
+        del cls.atlas
+        cls.directory.cleanup()
+
+
+    def test_grid_points(self):
+        self.assertEqual([key for key, _ in self.atlas.axes],
+                         ["sd", "sigma", "tau", "alpha"])
+        self.assertEqual(self.atlas.fixed["gamma"], 0.8)
+        for params in (dict(sd = 0.05, sigma = 0.4, tau = 0.1, alpha = 0.2),
+                       dict(sd = 0.1, sigma = 0.3, tau = 0.6, alpha = 0.1)):
+            theta_0, V = self.atlas.query(**params)
+            expected = solve(normalize_point({**TABLE, **params}))
+            np.testing.assert_allclose(theta_0, expected["theta_0"],
+                                       atol = 0.5 / THETA_SCALE)
+            np.testing.assert_allclose(V, expected["V"], rtol = 1e-6)
+
+
+    def test_interpolation(self):
+        low = self.atlas.query(sd = 0.05, sigma = 0.3, tau = 0.1, alpha = 0.1)
+        high = self.atlas.query(sd = 0.05, sigma = 0.4, tau = 0.1,
+                                alpha = 0.1)
+        mid = self.atlas.query(sd = 0.05, sigma = 0.375, tau = 0.1,
+                               alpha = 0.1)
+        for l, h, m in zip(low, high, mid):
+            np.testing.assert_allclose(m, 0.25 * l + 0.75 * h)
+
+        # `sigma = 0.5` and `tau = 0.6` are invalid together
+        theta_0, V = self.atlas.query(sd = 0.05, sigma = 0.45, tau = 0.3,
+                                      alpha = 0.1)
+        self.assertTrue(np.all(np.isnan(theta_0)) and np.all(np.isnan(V)))
+        theta_0, V = self.atlas.query(sd = 0.05, sigma = 0.35, tau = 0.3,
+                                      alpha = 0.1)
+        self.assertFalse(np.any(np.isnan(theta_0)) or np.any(np.isnan(V)))
+
+        for params in (dict(sd = 0.05, sigma = 0.6, tau = 0.1, alpha = 0.1),
+                       dict(sd = 0.05, sigma = 0.4, tau = 0.1),
+                       dict(sd = 0.05, sigma = 0.4, tau = 0.1, alpha = 0.1,
+                            gamma = 0.8)):
+            with self.assertRaises(ValueError):
+                self.atlas.query(**params)
@@ -0,0 +1,136 @@
+import unittest
+
+from aamodel.uniform_distribution import uniform_distribution
+from aamodel.normal_distribution import normal_distribution
+from aamodel.solver import mdp_solver
+from tests.helpers import helpers
+import numpy as np
+from scipy.stats import norm, uniform
+
+
+class distribution_test(unittest.TestCase):
+    def test_allowed_actions(self):
+        dists = [(uniform_distribution(0, 1), uniform(0, 1)),
+                 (normal_distribution(0.5, 0.05), norm(0.5, 0.05)),
+                 (normal_distribution(0.5, 0.15), norm(0.5, 0.15))]
+        phi_0 = np.concatenate(([0.0, 1.0],
+                                [helpers.phi_0_random() for _ in range(100)]))
+        for dist, reference in dists:
+            sigma, _ = helpers.sigma_tau_random()
+            sigma = max(sigma, 0.01)
+            alpha = np.random.uniform(0.01, 0.5)
+            lower, upper = dist.allowed_actions(phi_0, sigma, alpha)
+            self.assertEqual(lower.shape, phi_0.shape)
+            self.assertEqual(upper.shape, phi_0.shape)
+            self.assertTrue(np.all((0 <= lower) & (lower <= upper) &
+                                   (upper <= sigma)))
+
+            # At an uncapped `lower`, the unprivileged above the threshold
+            # take up all opportunities, and at an uncapped `upper`, they
+            # take up what all of the privileged leave
+            admitted = phi_0 * reference.sf(lower / sigma)
+            inner = (lower > 0) & (phi_0 > 0)
+            np.testing.assert_allclose(admitted[inner], alpha, rtol = 1e-9)
+            admitted = phi_0 * reference.sf(upper / sigma) + 1 - phi_0
+            inner = (upper < sigma) & (phi_0 > 0)
+            np.testing.assert_allclose(admitted[inner], alpha, rtol = 1e-9)
+
+            # Any action is allowed when there is nobody unprivileged
+            self.assertEqual(lower[0], 0)
+            self.assertEqual(upper[0], sigma)
+
+        # Results of the original, scalar implementation
+        points = [(0.0, 0.4, 0.15), (0.1, 0.4, 0.15), (0.3, 0.25, 0.2),
+                  (0.5, 0.4, 0.15), (0.9, 0.6, 0.05), (0.95, 0.4, 0.3),
+                  (0.8, 0.5, 0.35), (1.0, 0.4, 0.3)]
+        expected = [
+            [(0.0, 0.4), (0.0, 0.4), (0.08333333333333331, 0.25),
+             (0.27999999999999997, 0.4), (0.5666666666666667, 0.6),
+             (0.2736842105263158, 0.29473684210526313), (0.28125, 0.40625),
+             (0.27999999999999997, 0.27999999999999997)],
+            [(0.0, 0.4), (0.0, 0.4), (0.11961590875880677, 0.25),
+             (0.21048801025416083, 0.4), (0.34779656454069147, 0.6),
+             (0.209590113066619, 0.21267280001559402),
+             (0.25393276711525425, 0.2721786639754719),
+             (0.21048801025416083, 0.21048801025416083)],
+            [(0.0, 0.4), (0.0, 0.4), (0.10884772627642034, 0.25),
+             (0.23146403076248245, 0.4), (0.4433896936220745, 0.6),
+             (0.228770339199857, 0.2380184000467821),
+             (0.2617983013457628, 0.3165359919264157),
+             (0.23146403076248245, 0.23146403076248245)],
+        ]
+        for (dist, _), bounds in zip(dists, expected):
+            for (p, sigma, alpha), (l, u) in zip(points, bounds):
+                scalar = dist.allowed_actions(p, sigma, alpha)
+                self.assertIsInstance(scalar[0], float)
+                self.assertIsInstance(scalar[1], float)
+                # Batched, `p` is next to states with and without capping
+                batched = dist.allowed_actions(np.array([0.0, p, 1.0]),
+                                               sigma, alpha)
+                for lower, upper in (scalar, (batched[0][1], batched[1][1])):
+                    self.assertAlmostEqual(lower, l, places = 12)
+                    self.assertAlmostEqual(upper, u, places = 12)
+
+
+    def test_evaluate(self):
+        dists = [uniform_distribution(0, 1),
+                 normal_distribution(0.5, 0.05),
+                 normal_distribution(0.5, 0.15)]
+        for dist in dists:
+            sigma, tau = helpers.sigma_tau_random()
+            sigma = max(sigma, 0.01)
+            alpha = np.random.uniform(0.01, 0.5)
+            phi_0 = np.array([helpers.phi_0_random() for _ in range(100)])
+            lower, upper = dist.allowed_actions(phi_0, sigma, alpha)
+            theta_0 = np.random.uniform(lower, upper)
+
+            # `evaluate` gives exactly the results of the separate methods
+            payoffs, phi_0_post, theta_1 = dist.evaluate(theta_0, phi_0,
+                                                         sigma, tau, alpha)
+            self.assertTrue(np.array_equal(
+                payoffs, dist.get_payoff(theta_0, phi_0, sigma, tau, alpha)))
+            self.assertTrue(np.array_equal(
+                phi_0_post, dist.phi_0_post(theta_0, phi_0, sigma)))
+            self.assertTrue(np.array_equal(
+                theta_1, dist.theta_1_from_theta_0(theta_0, phi_0, sigma,
+                                                   tau, alpha)))
+
+        # The normal distribution evaluates its CDF twice, instead of five
+        # times for the separate methods
+        dist = normal_distribution(0.5, 0.1)
+        calls = []
+        CDF = dist.CDF
+        dist.CDF = lambda x: calls.append(x) or CDF(x)
+        dist.evaluate(theta_0, phi_0, sigma, tau, alpha)
+        self.assertEqual(len(calls), 2)
+
+        # The solver builds the same tables with and without `evaluate`
+        class separate:
+            def __init__(self, dist):
+                for name in ("allowed_actions", "theta_1_from_theta_0",
+                             "get_payoff", "phi_0_post"):
+                    setattr(self, name, getattr(dist, name))
+
+        params = dict(sigma = 0.6,
+                      tau = 0.3,
+                      p_A = 0.2,
+                      p_D = 0.3,
+                      N = 50,
+                      gamma = 0.9,
+                      alpha = 0.3,
+                      discretization = 100)
+        for interpolate in (False, True):
+            s_e = mdp_solver(dist = normal_distribution(0.5, 0.1),
+                             interpolate = interpolate,
+                             **params)
+            s_s = mdp_solver(dist = separate(normal_distribution(0.5, 0.1)),
+                             interpolate = interpolate,
+                             **params)
+            for name in ("R", "S", "W", "mask"):
+                a, b = getattr(s_e, name), getattr(s_s, name)
+                self.assertTrue(a is None and b is None or
+                                np.array_equal(a, b))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+import unittest
+import json
+import matplotlib
+import numpy as np
+import os
+import tempfile
+
+from aamodel.experiments import expand_solve, load_spec, plan, \
+                                render_plots, result_cache, run_experiments, \
+                                run_solves, solve
+
+
+SPEC = """
+[defaults]
+sigma = 0.4
+tau = 0.1
+p_A = 0
+p_D = 0
+N = 40
+discretization = 40
+gamma = 0.8
+alpha = 0.15
+
+[solves.uniform]
+dist = "uniform"
+
+[solves.normal]
+dist = "normal"
+sd = [0.05, 0.1]
+
+[[plots]]
+name = "theta_0"
+y = "theta_0"
+series = [{ solve = "uniform", label = "Uniform" },
+          { solve = "normal", label = "sd = {sd}" }]
+
+[[plots]]
+name = "policy_diff_{sd}"
+each = "normal"
+y = "policy_diff"
+series = [{ solve = "normal", label = "Normal" }]
+"""
+
+
+class experiments_test(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "spec.toml")
+        with open(self.path, "w") as f:
+            f.write(SPEC)
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def test_spec(self):
+        spec = load_spec(self.path)
+        self.assertEqual(spec["name"], "spec")
+        self.assertEqual(len(expand_solve(spec, "uniform")), 1)
+        normal = expand_solve(spec, "normal")
+        self.assertEqual([point["sd"] for point in normal], [0.05, 0.1])
+        self.assertEqual(normal[0]["p_A"], 0.0)
+        self.assertIsInstance(normal[0]["p_A"], float)
+
+        # The same solve written differently (as JSON, with `0.0` instead of
+        # `0`, and a default given explicitly) is only planned once
+        other = dict(defaults = dict(sigma = 0.4, tau = 0.1, p_A = 0.0,
+                                     p_D = 0.0, N = 40, discretization = 40,
+                                     gamma = 0.8, alpha = 0.15),
+                     solves = dict(u = dict(dist = "uniform", a = 0)))
+        other_path = os.path.join(self.directory.name, "other.json")
+        with open(other_path, "w") as f:
+            json.dump(other, f)
+        self.assertEqual(len(plan([spec, load_spec(other_path)])), 3)
+
+        # The run options that don't change the result share cache entries
+        point = expand_solve(spec, "uniform")[0]
+        fast = dict(point, backend = "numba", monotone = True)
+        self.assertEqual(result_cache.key(fast), result_cache.key(point))
+        self.assertNotEqual(result_cache.key(dict(point, epsilon = 1e-6)),
+                            result_cache.key(point))
+        cache = result_cache(os.path.join(self.directory.name, "data"))
+        # The numba solve runs in a worker, and the numpy solve is cached
+        self.assertEqual(run_solves({"fast": fast}, cache, n_workers = 2,
+                                    verbose = False), 1)
+        self.assertEqual(run_solves({"point": point}, cache,
+                                    verbose = False), 0)
+        # Both converge to within `epsilon / (1 - gamma)` of the true values
+        np.testing.assert_allclose(cache.load(point)["V"], solve(point)["V"],
+                                   rtol = 0,
+                                   atol = point["epsilon"] /
+                                          (1 - point["gamma"]))
+
+        # Invalid specs
+        for bad in ['[solves.u]\ndist = "uniform"\n',
+                    '[solves.u]\ndist = "triangular"\n',
+                    SPEC.replace('dist = "uniform"',
+                                 'dist = "uniform"\nbeta = 1')]:
+            with open(self.path, "w") as f:
+                f.write(bad)
+            with self.assertRaises(ValueError):
+                load_spec(self.path)
+
+        # Points outside the ranges of the solver are rejected up front, with
+        # the file and the solve in the message
+        with open(self.path, "w") as f:
+            f.write(SPEC.replace('sd = [0.05, 0.1]',
+                                 'sd = [0.05, 0.1]\ntau = [0.1, 0.7]'))
+        with self.assertRaisesRegex(ValueError,
+                                    "{}: solve 'normal': sigma \\+ tau"
+                                    .format(self.path)):
+            load_spec(self.path)
+
+
+    def test_run(self):
+        spec = load_spec(self.path)
+        data = os.path.join(self.directory.name, "data")
+        plots = os.path.join(self.directory.name, "plots")
+        paths = run_experiments([spec], data = data, plots = plots,
+                                n_workers = 1, usetex = False,
+                                verbose = False)
+        self.assertEqual(sorted(os.path.basename(path) for path in paths),
+                         ["spec_policy_diff_0.05.pdf",
+                          "spec_policy_diff_0.1.pdf", "spec_theta_0.pdf"])
+
+        # Cached results match a fresh solve
+        cache = result_cache(data)
+        for point in plan([spec]).values():
+            self.assertIn(point, cache)
+            expected = solve(point)
+            result = cache.load(point)
+            for name in expected:
+                self.assertTrue(np.array_equal(result[name], expected[name]))
+
+        # Nothing is solved or plotted again
+        mtime = os.path.getmtime(paths[0])
+        self.assertEqual(run_experiments([spec], data = data, plots = plots,
+                                         n_workers = 1, usetex = False,
+                                         verbose = False), [])
+        self.assertEqual(os.path.getmtime(paths[0]), mtime)
+
+        # Changing the style of a plot only renders that plot again, and
+        # plotting in the calling process leaves its backend alone
+        spec["plots"][0]["title"] = "New title"
+        backend = matplotlib.get_backend()
+        matplotlib.use("pdf")
+        try:
+            paths = render_plots([spec], cache, directory = plots,
+                                 usetex = False, n_workers = 1,
+                                 verbose = False)
+            self.assertEqual(matplotlib.get_backend(), "pdf")
+        finally:
+            matplotlib.use(backend)
+        self.assertEqual([os.path.basename(path) for path in paths],
+                         ["spec_theta_0.pdf"])
+
+        # Changing the data renders the plots of that data again
+        point = expand_solve(spec, "normal")[1]
+        result = cache.load(point)
+        result["theta_0"] = result["theta_0"] / 2
+        cache.store(point, result)
+        paths = render_plots([spec], cache, directory = plots,
+                             usetex = False, n_workers = 1, verbose = False)
+        self.assertEqual(sorted(os.path.basename(path) for path in paths),
+                         ["spec_policy_diff_0.1.pdf", "spec_theta_0.pdf"])
+
+        # Missing plots are rendered again, in a process pool
+        os.remove(os.path.join(plots, "spec_policy_diff_0.05.pdf"))
+        paths = render_plots([spec], cache, directory = plots,
+                             usetex = False, n_workers = 2, verbose = False)
+        self.assertEqual([os.path.basename(path) for path in paths],
+                         ["spec_policy_diff_0.05.pdf"])
+        self.assertTrue(os.path.exists(paths[0]))
+        self.assertEqual(render_plots([spec], cache, directory = plots,
+                                      usetex = False, verbose = False), [])
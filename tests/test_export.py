@@ -0,0 +1,68 @@
+import unittest
+import json
+import numpy as np
+import os
+import tempfile
+
+from aamodel.export import export_simulation, simulate, PRIVILEGED
+from aamodel.population import GIVEN, SUCCEEDED
+from aamodel.solver import mdp_solver
+from aamodel.uniform_distribution import uniform_distribution
+
+
+class export_test(unittest.TestCase):
+    def test_simulate(self):
+        s = mdp_solver(dist = uniform_distribution(0, 1),
+                       sigma = 0.4,
+                       tau = 0.1,
+                       p_A = 0.1,
+                       p_D = 0.05,
+                       N = 100,
+                       gamma = 0.8,
+                       alpha = 0.15,
+                       discretization = 100)
+        states, theta_0, theta_1 = s.run(verbose = False)
+        n_agents = 1000
+        T = 20
+        snapshots, generations = simulate(states, theta_0, theta_1, s.sigma,
+                                          s.tau, s.p_A, s.p_D, n_agents, T,
+                                          seed = 1)
+        self.assertEqual(snapshots.shape, (T + 1, n_agents))
+        self.assertEqual(len(generations), T + 1)
+
+        for t, generation in enumerate(generations):
+            flags = snapshots[t]
+            n_privileged = np.count_nonzero(flags & PRIVILEGED)
+            self.assertAlmostEqual(generation["phi_0"],
+                                   1 - n_privileged / n_agents)
+            # Successful agents were given opportunities
+            self.assertFalse(np.any((flags & SUCCEEDED > 0) &
+                                    (flags & GIVEN == 0)))
+            if t < T:
+                self.assertEqual(generation["n_successes"],
+                                 np.count_nonzero(flags & SUCCEEDED))
+                # The thresholds are those of the closest state
+                i = int(round(generation["phi_0"] * s.N))
+                self.assertEqual(generation["theta_0"], theta_0[i])
+            else:
+                self.assertFalse(np.any(flags & (GIVEN | SUCCEEDED)))
+
+        # The same seed gives the same simulation
+        again, _ = simulate(states, theta_0, theta_1, s.sigma, s.tau, s.p_A,
+                            s.p_D, n_agents, T, seed = 1)
+        self.assertTrue(np.array_equal(snapshots, again))
+
+        # The exported files hold the snapshots and the generations
+        with tempfile.TemporaryDirectory() as directory:
+            generations[0]["theta_1"] = np.inf
+            path = export_simulation(directory, snapshots, generations,
+                                     params = dict(N = s.N))
+            with open(path) as f:
+                index = json.load(f)
+            self.assertEqual(index["n_agents"], n_agents)
+            self.assertEqual(index["n_generations"], T + 1)
+            self.assertIsNone(index["generations"][0]["theta_1"])
+            data = np.fromfile(os.path.join(directory, index["data"]),
+                               dtype = index["dtype"])
+            self.assertTrue(np.array_equal(
+                data.reshape(T + 1, n_agents), snapshots))
@@ -226,3 +226,52 @@ class generation_test(unittest.TestCase):
                 self.assertFalse(a.is_privileged())
                 self.assertFalse(a.maybe_given)
 
+
+    def test_budget(self):
+        # `sigma = 1, a_i = 1` -- everyone given an opportunity succeeds
+        # `p_A = p_D = 0` -- children inherit status
+        # Exactly `budget` opportunities are given, regardless of thresholds
+        N = helpers.N_random()
+        g = generation(N = N,
+                       sigma = 1,
+                       tau = 0,
+                       n_privileged = 0,
+                       p_A = 0,
+                       p_D = 0,
+                       a_dist = helpers.a_dist_best)
+        budget = helpers.n_privileged_random(N)
+        n_successes = g.step(1, 1, budget = budget)
+        self.assertEqual(n_successes, budget)
+        self.assertEqual(g.n_privileged, budget)
+        for a in g.agents:
+            self.assertFalse(a.maybe_given)
+
+        # Uniform abilities, `tau = 0` -- the budget goes to the agents with
+        # the highest abilities, so the successes come from them
+        N = helpers.N_random()
+        g = generation(N = N,
+                       sigma = 1,
+                       tau = 0,
+                       n_privileged = 0,
+                       p_A = 0,
+                       p_D = 0,
+                       a_dist = helpers.a_dist_uniform)
+        budget = helpers.n_privileged_random(N)
+        n_successes = g.step(0, 0, budget = budget)
+        self.assertLessEqual(n_successes, budget)
+        self.assertEqual(g.n_privileged, n_successes)
+
+        # The allocation uses the current abilities: the first 3 agents have
+        # ability 1 in the first generation and 0 in the second, the others
+        # the other way around, so all 3 opportunities succeed in both
+        abilities = iter([1] * 3 + [0] * 7 + [0] * 3 + [1] * 7)
+        g = generation(N = 10,
+                       sigma = 1,
+                       tau = 0,
+                       n_privileged = 0,
+                       p_A = 0,
+                       p_D = 0,
+                       a_dist = lambda: next(abilities, 0))
+        self.assertEqual(g.step(0, 0, budget = 3), 3)
+        self.assertEqual(g.step(0, 0, budget = 3), 3)
+        self.assertEqual(g.n_privileged, 6)
@@ -0,0 +1,86 @@
+import unittest
+import numpy as np
+import os
+import subprocess
+import sys
+import tempfile
+
+from aamodel.normal_distribution import normal_distribution
+from aamodel.policy_table import policy_table, write_policy_table, MAX_CODE
+from aamodel.solver import mdp_solver
+
+
+class policy_table_test(unittest.TestCase):
+    def test_lookup(self):
+        s = mdp_solver(dist = normal_distribution(0.5, 0.1),
+                       sigma = 0.5,
+                       tau = 0.2,
+                       p_A = 0.1,
+                       p_D = 0.05,
+                       N = 100,
+                       gamma = 0.8,
+                       alpha = 0.3,
+                       discretization = 200)
+        states, theta_0, theta_1 = s.run(verbose = False)
+        # Some states give nobody privileged an opportunity
+        self.assertTrue(np.any(np.isinf(theta_1)))
+        params = dict(dist = "normal", sd = 0.1, sigma = 0.5)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "policy.bin")
+            write_policy_table(path, theta_0, theta_1, params)
+            self.assertLess(os.path.getsize(path), 4 * len(states) + 200)
+            table = policy_table.load(path)
+        self.assertEqual(table.N, 100)
+        self.assertEqual(table.params, params)
+
+        # Thresholds are within the quantization error, and infinite ones are
+        # exact
+        for expected, loaded in ((theta_0, table.theta_0),
+                                 (theta_1, table.theta_1)):
+            finite = expected[np.isfinite(expected)]
+            error = (finite.max() - finite.min()) / (2 * MAX_CODE)
+            np.testing.assert_allclose(loaded, expected, rtol = 0,
+                                       atol = error * 1.001)
+
+        # Lookup uses the nearest state, as the simulations do
+        for phi_0 in (0, 0.123, 0.4449, 0.5, 1):
+            i = int(round(phi_0 * 100))
+            self.assertEqual(table.lookup(phi_0),
+                             (table.theta_0[i], table.theta_1[i]))
+
+        # Interpolation between finite thresholds is linear
+        i = int(np.flatnonzero(np.isfinite(theta_1[:-1]) &
+                               np.isfinite(theta_1[1:]))[0])
+        t_0, t_1 = table.lookup((i + 0.25) / 100, interpolate = True)
+        self.assertAlmostEqual(t_0, 0.75 * table.theta_0[i] +
+                                    0.25 * table.theta_0[i + 1])
+        self.assertAlmostEqual(t_1, 0.75 * table.theta_1[i] +
+                                    0.25 * table.theta_1[i + 1])
+        self.assertEqual(table.lookup(1, interpolate = True),
+                         (table.theta_0[100], table.theta_1[100]))
+
+        # Next to an infinite threshold, the nearest state is used
+        i = int(np.flatnonzero(np.isinf(theta_1))[0])
+        j = i - 1 if i > 0 else i + 1
+        self.assertEqual(table.lookup((i + 0.4 * (j - i)) / 100,
+                                      interpolate = True)[1], theta_1[i])
+
+        for phi_0 in (-0.1, 1.1):
+            with self.assertRaises(ValueError):
+                table.lookup(phi_0)
+        with self.assertRaises(ValueError):
+            policy_table(b"NOTAPOLICY" + bytes(100))
+
+
+    def test_no_dependencies(self):
+        # Loading a policy table doesn't import NumPy
+        code = "import sys, aamodel.policy_table; " \
+               "assert 'numpy' not in sys.modules"
+        subprocess.run([sys.executable, "-c", code], check = True,
+                       cwd = os.path.dirname(os.path.dirname(
+                                 os.path.abspath(__file__))))
+
+
+if __name__ == "__main__":
+    unittest.main()
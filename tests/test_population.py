@@ -0,0 +1,146 @@
+import unittest
+import numpy as np
+
+from aamodel.population import population, sharded_population, \
+                               uniform_abilities, budget_allocation
+from tests.helpers import helpers
+from random import random
+
+
+# Abilities are all 1.0 (picklable, for `sharded_population`)
+def best_abilities(rng, size):
+    return np.ones(size)
+
+
+class population_test(unittest.TestCase):
+    def test_step(self):
+        # `sigma = 1, a_i = 1` -- everyone succeeds
+        # `p_A = p_D = 0` -- children inherit status
+        N = helpers.N_random()
+        p = population(N = N,
+                       sigma = 1,
+                       tau = 0,
+                       n_privileged = helpers.n_privileged_random(N),
+                       p_A = 0,
+                       p_D = 0,
+                       a_dist = best_abilities)
+        for _ in range(10):
+            self.assertEqual(p.step(random(), random()), N)
+            self.assertAlmostEqual(p.phi_0, 0.0)
+            self.assertTrue(np.all(p.privileged))
+
+        # `sigma = tau = 0` -- everyone fails
+        N = helpers.N_random()
+        p = population(N = N,
+                       sigma = 0,
+                       tau = 0,
+                       n_privileged = helpers.n_privileged_random(N),
+                       p_A = 0,
+                       p_D = 0,
+                       a_dist = uniform_abilities)
+        for _ in range(10):
+            old_phi_0 = p.phi_0
+            self.assertEqual(p.step(random(), random()), 0)
+            self.assertAlmostEqual(old_phi_0, p.phi_0)
+
+        # `p_A = p_D = 1, phi_0 = 1` -- all redistribution results in
+        # unprivileged children
+        sigma, tau = helpers.sigma_tau_random()
+        N = helpers.N_random()
+        p = population(N = N,
+                       sigma = sigma,
+                       tau = tau,
+                       n_privileged = 0,
+                       p_A = 1,
+                       p_D = 1,
+                       a_dist = uniform_abilities)
+        for _ in range(10):
+            p.step(random(), random())
+            self.assertAlmostEqual(p.phi_0, 1.0)
+            self.assertEqual(np.count_nonzero(p.privileged), p.n_privileged)
+
+
+    def test_budget(self):
+        # Agents come by success probability, then by margin over the
+        # threshold. Clearing the threshold doesn't come first: agent 0 gets
+        # an opportunity before agent 1 does, although only agent 1 clears
+        # its threshold.
+        success_prob = np.array([0.9, 0.5, 0.5, 0.3, 0.7, 0.1])
+        threshold = np.array([1.0, 0.4, 0.2, 0.3, 0.8, 0.0])
+        expected = [[], [0], [0, 4], [0, 4, 2], [0, 4, 2, 1],
+                    [0, 4, 2, 1, 3], [0, 4, 2, 1, 3, 5],
+                    [0, 4, 2, 1, 3, 5]]
+        for budget, chosen in enumerate(expected):
+            given = budget_allocation(success_prob, threshold, budget)
+            self.assertEqual(sorted(np.flatnonzero(given)), sorted(chosen))
+
+        # Exact budget on random populations, with the highest success
+        # probabilities
+        rng = np.random.default_rng()
+        for _ in range(10):
+            success_prob = rng.random(1000)
+            threshold = rng.random(1000) * 0.5
+            budget = int(rng.integers(0, 1000))
+            given = budget_allocation(success_prob, threshold, budget)
+            self.assertEqual(np.count_nonzero(given), budget)
+            if 0 < budget:
+                self.assertGreaterEqual(success_prob[given].min(),
+                                        success_prob[~given].max(initial = 0))
+
+        # `sigma = 1, a_i = 1` -- everyone given an opportunity succeeds
+        N = helpers.N_random()
+        budget = helpers.n_privileged_random(N)
+        p = population(N = N,
+                       sigma = 1,
+                       tau = 0,
+                       n_privileged = 0,
+                       p_A = 0,
+                       p_D = 0,
+                       a_dist = best_abilities)
+        self.assertEqual(p.step(random(), random(), budget = budget), budget)
+        self.assertEqual(p.n_privileged, budget)
+
+
+    def test_sharded(self):
+        params = dict(sigma = 0.4,
+                      tau = 0.1,
+                      n_privileged = 3000,
+                      p_A = 0.1,
+                      p_D = 0.1,
+                      N = 10000,
+                      a_dist = uniform_abilities)
+
+        # The same seed gives the same trajectory
+        trajectories = []
+        for _ in range(2):
+            with sharded_population(n_shards = 3, seed = 7, **params) as p:
+                trajectory = []
+                for _ in range(5):
+                    n_successes = p.step(0.2, 0.3)
+                    self.assertEqual(np.count_nonzero(p.privileged),
+                                     p.n_privileged)
+                    trajectory.append((n_successes, p.n_privileged))
+                trajectories.append(trajectory)
+        self.assertEqual(trajectories[0], trajectories[1])
+
+        # The dynamics match the unsharded population. `phi_0` changes by an
+        # expected `-0.0232` per generation here, with a standard deviation of
+        # about `0.005`.
+        p = population(seed = 7, **params)
+        with sharded_population(n_shards = 3, seed = 8, **params) as q:
+            for _ in range(5):
+                p.step(0.2, 0.3)
+                q.step(0.2, 0.3)
+                self.assertLess(abs(p.phi_0 - q.phi_0), 0.05)
+
+        # `sigma = 1, a_i = 1` -- everyone succeeds, in every shard
+        with sharded_population(sigma = 1,
+                                tau = 0,
+                                n_privileged = 10,
+                                p_A = 0,
+                                p_D = 0,
+                                N = 1000,
+                                a_dist = best_abilities,
+                                n_shards = 4) as p:
+            self.assertEqual(p.step(0.5, 0.5), 1000)
+            self.assertAlmostEqual(p.phi_0, 0.0)
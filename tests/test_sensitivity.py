@@ -0,0 +1,129 @@
+import unittest
+
+from aamodel.solver import mdp_solver
+from aamodel.sensitivity import sensitivity
+from aamodel.uniform_distribution import uniform_distribution
+from aamodel.normal_distribution import normal_distribution
+import numpy as np
+
+
+def make_solver(dist, **params):
+    params = {**dict(sigma = 0.4,
+                     tau = 0.05,
+                     p_A = 0.062,
+                     p_D = 0.02,
+                     N = 100,
+                     gamma = 0.8,
+                     alpha = 0.05,
+                     discretization = 200,
+                     interpolate = True), **params}
+    return mdp_solver(dist = dist, **params)
+
+
+class sensitivity_test(unittest.TestCase):
+    def test_with_redistribution(self):
+        s = make_solver(normal_distribution(0.5, 0.05))
+        s_r = s.with_redistribution(p_A = 0.1, p_D = 0.05)
+        s_f = make_solver(normal_distribution(0.5, 0.05), p_A = 0.1, p_D = 0.05)
+
+        # Rewards are shared, transitions are the same as from scratch
+        self.assertIs(s_r.R, s.R)
+        np.testing.assert_array_equal(s_r.S, s_f.S)
+        np.testing.assert_array_equal(s_r.W, s_f.W)
+        self.assertEqual((s.p_A, s.p_D), (0.062, 0.02))
+        s_r.run(verbose = False)
+        s_f.run(verbose = False)
+        np.testing.assert_array_equal(s_r.theta_0, s_f.theta_0)
+
+
+    def test_sensitivity(self):
+        s = make_solver(normal_distribution(0.5, 0.05))
+        epsilon = 1e-8
+        result = sensitivity(s, step = 0.02, n_workers = 1, epsilon = epsilon)
+        self.assertEqual(set(result), {"sigma", "tau", "alpha", "p_A", "p_D",
+                                       "sd"})
+        for parameter, r in result.items():
+            self.assertEqual(r["theta_0"].shape, (s.N + 1,))
+            self.assertEqual(r["V"].shape, (s.N + 1,))
+            # The same difference quotient from two solves from scratch,
+            # which are within `epsilon / (1 - gamma)` of the true values
+            values = []
+            for side in ("low", "high"):
+                if parameter == "sd":
+                    s_p = make_solver(normal_distribution(0.5, r[side]))
+                else:
+                    s_p = make_solver(normal_distribution(0.5, 0.05),
+                                      **{parameter: r[side]})
+                s_p.run(verbose = False, epsilon = epsilon)
+                values.append(s_p.V)
+            width = r["high"] - r["low"]
+            np.testing.assert_allclose(r["V"],
+                                       (values[1] - values[0]) / width,
+                                       rtol = 0,
+                                       atol = 4 * epsilon / (1 - s.gamma) /
+                                              width)
+
+        # `alpha = 0.05` can't be moved down by 0.05, so the difference is
+        # one-sided there
+        result = sensitivity(s, parameters = ["alpha"], step = 0.05,
+                             n_workers = 1)
+        self.assertEqual(result["alpha"]["low"], 0.05)
+        self.assertAlmostEqual(result["alpha"]["high"], 0.1)
+
+        # More opportunities means more successes
+        self.assertTrue(np.all(result["alpha"]["V"] >= 0))
+
+        # Initial values for `run` replace the warm start
+        cold = sensitivity(s, parameters = ["p_A"], n_workers = 1,
+                           V = np.zeros(s.N + 1))
+        warm = sensitivity(s, parameters = ["p_A"], n_workers = 1)
+        width = warm["p_A"]["high"] - warm["p_A"]["low"]
+        np.testing.assert_allclose(cold["p_A"]["V"], warm["p_A"]["V"],
+                                   rtol = 0,
+                                   atol = 4 * 1e-4 / (1 - s.gamma) / width)
+
+        # The uniform distribution has no standard deviation
+        result = sensitivity(make_solver(uniform_distribution(0, 1)),
+                             parameters = ["p_A", "sd"],
+                             n_workers = 1)
+        self.assertEqual(set(result), {"p_A"})
+
+
+    def test_sensitivity_options(self):
+        # All perturbed solves keep the options of the base solver, so both
+        # sides of every difference are stochastic here
+        kwargs = dict(dist = uniform_distribution(0, 1),
+                      sigma = 0.4,
+                      tau = 0.05,
+                      p_A = 0.062,
+                      p_D = 0.02,
+                      N = 40,
+                      gamma = 0.8,
+                      alpha = 0.1,
+                      discretization = 80,
+                      stochastic = True)
+        s = mdp_solver(**kwargs)
+        result = sensitivity(s, parameters = ["alpha", "p_A"], step = 0.02,
+                             n_workers = 1)
+        for parameter, r in result.items():
+            for side in ("low", "high"):
+                # Warm-started from the base solution, as in `sensitivity`
+                s_p = mdp_solver(**{**kwargs, parameter: r[side]})
+                s_p.run(verbose = False, V = s.V)
+                np.testing.assert_array_equal(r["V_" + side], s_p.V)
+
+
+    def test_sensitivity_parallel(self):
+        serial = sensitivity(make_solver(uniform_distribution(0, 1)),
+                             parameters = ["tau", "p_D"],
+                             n_workers = 1)
+        parallel = sensitivity(make_solver(uniform_distribution(0, 1)),
+                               parameters = ["tau", "p_D"],
+                               n_workers = 2)
+        for parameter in serial:
+            np.testing.assert_array_equal(serial[parameter]["V"],
+                                          parallel[parameter]["V"])
+
+
+if __name__ == "__main__":
+    unittest.main()
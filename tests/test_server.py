@@ -0,0 +1,102 @@
+import unittest
+import json
+import numpy as np
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from aamodel.experiments import result_cache
+from aamodel.export import PRIVILEGED
+from aamodel.server import make_server, solver_service
+
+
+PARAMS = dict(dist = "uniform", sigma = 0.4, tau = 0.1, p_A = 0.1, p_D = 0.05,
+              N = 40, discretization = 40, gamma = 0.8, alpha = 0.15)
+
+
+class server_test(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.service = solver_service(result_cache(self.directory.name),
+                                      n_workers = 2)
+        self.server = make_server(self.service, port = 0,
+                                  directory = self.directory.name,
+                                  quiet = True)
+        self.url = "http://127.0.0.1:{}/".format(self.server.server_port)
+        self.thread = threading.Thread(target = self.server.serve_forever)
+        self.thread.start()
+
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.service.close()
+        self.directory.cleanup()
+
+
+    def post(self, path, body):
+        request = urllib.request.Request(
+                      self.url + path,
+                      data = json.dumps(body).encode(),
+                      headers = {"Content-Type": "application/json"})
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)
+
+
+    def test_policy(self):
+        # Concurrent identical requests are solved once
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda _: self.post("api/policy", PARAMS),
+                                    range(8)))
+        self.assertEqual(self.service.n_solves, 1)
+        for result in results:
+            self.assertEqual(result, results[0])
+        self.assertEqual(len(results[0]["theta_0"]), 41)
+
+        # The same solve written differently is answered from the cache
+        self.assertEqual(self.post("api/policy", {**PARAMS, "p_A": "0.1"}),
+                         results[0])
+        self.assertEqual(self.service.n_solves, 1)
+
+        # Cached results are read without waiting for the lock of the service
+        with ThreadPoolExecutor(1) as pool:
+            with self.service._lock:
+                future = pool.submit(self.post, "api/policy", PARAMS)
+                self.assertEqual(future.result(timeout = 10), results[0])
+
+        with self.assertRaises(urllib.error.HTTPError) as e:
+            self.post("api/policy", {**PARAMS, "tau": 0.7})
+        self.assertEqual(e.exception.code, 400)
+
+
+    def test_simulate(self):
+        body = dict(params = PARAMS, agents = 300, generations = 10, seed = 1)
+        index = self.post("api/simulate", body)
+        self.assertEqual(index["n_generations"], 11)
+        self.assertEqual(len(index["generations"]), 11)
+        with urllib.request.urlopen(self.url + index["data"]) as response:
+            snapshots = np.frombuffer(response.read(), dtype = np.uint8)
+        self.assertEqual(len(snapshots), 300 * 11)
+
+        # Repeated simulations are served from memory
+        self.assertEqual(self.post("api/simulate", body), index)
+        self.assertEqual(self.service.n_simulations, 1)
+        self.assertEqual(self.service.n_solves, 1)
+
+        # A quarter of the agents start out privileged
+        index = self.post("api/simulate", {**body, "privileged": 0.25})
+        with urllib.request.urlopen(self.url + index["data"]) as response:
+            snapshots = np.frombuffer(response.read(), dtype = np.uint8)
+        self.assertEqual(np.count_nonzero(snapshots[:300] & PRIVILEGED), 75)
+
+        for bad in [dict(privileged = 1.5), dict(privileged = "half"),
+                    dict(seed = 1.5), dict(seed = "1"), dict(agents = 1.5),
+                    dict(agents = "300"), dict(agents = 0),
+                    dict(generations = True), dict(generations = -1)]:
+            with self.assertRaises(urllib.error.HTTPError) as e:
+                self.post("api/simulate", {**body, **bad})
+            self.assertEqual(e.exception.code, 400)
+        self.assertEqual(self.service.n_simulations, 2)
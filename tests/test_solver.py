@@ -1,10 +1,12 @@
 import unittest
 
-from aamodel.solver import mdp_solver
+from aamodel.solver import mdp_solver, solve_multigrid, _checkpoint
+from aamodel import kernels
 from aamodel.uniform_distribution import uniform_distribution
 from aamodel.normal_distribution import normal_distribution
-import matplotlib.pyplot as plt
 import numpy as np
+import os
+import tempfile
 
 
 class solver_test(unittest.TestCase):
@@ -17,7 +19,7 @@ class solver_test(unittest.TestCase):
                          N = 2000,
                          gamma = 0.8,
                          alpha = 0.15)
-        states_u, theta_0_u, theta_1_u = s_u.run()
+        states_u, theta_0_u, theta_1_u = s_u.run(verbose = False)
 
         s_n = mdp_solver(dist = normal_distribution(0.5, 0.05),
                          sigma = 0.4,
@@ -27,15 +29,433 @@ class solver_test(unittest.TestCase):
                          N = 2000,
                          gamma = 0.8,
                          alpha = 0.15)
-        states_n, theta_0_n, theta_1_n = s_n.run()
+        states_n, theta_0_n, theta_1_n = s_n.run(verbose = False)
 
-        plt.plot(states_u[1:], theta_0_u[1:])
-        plt.plot(states_n[1:], theta_0_n[1:])
-        plt.show()
+        # Optimal policies are allowed actions, and give affirmative action
+        # (up to the discretization of policies)
+        for s, theta_0, theta_1 in [(s_u, theta_0_u, theta_1_u),
+                                    (s_n, theta_0_n, theta_1_n)]:
+            actions = np.rint(theta_0 * s.discretization / s.sigma)
+            self.assertTrue(np.all((s.lower <= actions) &
+                                   (actions <= s.upper)))
+            policy_diff = np.minimum(theta_1 - theta_0, s.sigma - theta_0)
+            self.assertTrue(np.all(policy_diff[1:] >= -0.01))
 
+        # Plotting is optional, for looking at the policies by hand
+        if os.environ.get("AAMODEL_PLOT"):
+            import matplotlib.pyplot as plt
+            plt.plot(states_u[1:], theta_0_u[1:])
+            plt.plot(states_n[1:], theta_0_n[1:])
+            plt.show()
 
-        policy_diff_u = np.minimum(theta_1_u - theta_0_u, s_u.sigma - theta_0_u)
-        policy_diff_n = np.minimum(theta_1_n - theta_0_n, s_n.sigma - theta_0_n)
-        plt.plot(states_u[1:], policy_diff_u[1:])
-        plt.plot(states_n[1:], policy_diff_n[1:])
-        plt.show()
+            policy_diff_u = np.minimum(theta_1_u - theta_0_u,
+                                       s_u.sigma - theta_0_u)
+            policy_diff_n = np.minimum(theta_1_n - theta_0_n,
+                                       s_n.sigma - theta_0_n)
+            plt.plot(states_u[1:], policy_diff_u[1:])
+            plt.plot(states_n[1:], policy_diff_n[1:])
+            plt.show()
+
+
+    def test_interpolate(self):
+        s_c = mdp_solver(dist = uniform_distribution(0, 1),
+                         sigma = 0.4,
+                         tau = 0.1,
+                         p_A = 0,
+                         p_D = 0,
+                         N = 200,
+                         gamma = 0.8,
+                         alpha = 0.15,
+                         interpolate = True)
+        # The upper neighbour has to exist for every state-policy pair
+        self.assertTrue(np.all(s_c.S <= s_c.N - 1))
+        self.assertTrue(np.all((0 <= s_c.W) & (s_c.W <= 1)))
+        states_c, theta_0_c, _ = s_c.run(verbose = False)
+
+        s_f = mdp_solver(dist = uniform_distribution(0, 1),
+                         sigma = 0.4,
+                         tau = 0.1,
+                         p_A = 0,
+                         p_D = 0,
+                         N = 1000,
+                         gamma = 0.8,
+                         alpha = 0.15,
+                         interpolate = True)
+        states_f, theta_0_f, _ = s_f.run(verbose = False)
+
+        # A coarse interpolated grid agrees with a fine one
+        theta_0_f = np.interp(states_c, states_f, theta_0_f)
+        self.assertLess(np.max(np.abs(theta_0_c - theta_0_f)[1:]), 2e-3)
+        V_f = np.interp(states_c, states_f, s_f.V)
+        self.assertLess(np.max(np.abs(s_c.V - V_f)), 1e-4)
+
+
+    def test_multigrid(self):
+        s_d = mdp_solver(dist = uniform_distribution(0, 1),
+                         sigma = 0.4,
+                         tau = 0.1,
+                         p_A = 0,
+                         p_D = 0,
+                         N = 400,
+                         gamma = 0.95,
+                         alpha = 0.15,
+                         discretization = 400,
+                         interpolate = True)
+        s_d.run(verbose = False)
+
+        s_m = solve_multigrid(dist = uniform_distribution(0, 1),
+                              sigma = 0.4,
+                              tau = 0.1,
+                              p_A = 0,
+                              p_D = 0,
+                              gamma = 0.95,
+                              alpha = 0.15,
+                              levels = (50, 400),
+                              discretization = 400)
+        # The finer level only stores a narrow range of policies
+        self.assertEqual(s_m.N, 400)
+        self.assertLess(s_m.width, s_m.discretization // 4)
+
+        # ... and still agrees with the direct solve
+        self.assertLess(np.max(np.abs(s_m.theta_0 - s_d.theta_0)[1:]), 2e-3)
+        self.assertLess(np.max(np.abs(s_m.V - s_d.V)), 1e-3)
+
+
+    def test_monotone(self):
+        for interpolate in [True, False]:
+            s_f = mdp_solver(dist = uniform_distribution(0, 1),
+                             sigma = 0.4,
+                             tau = 0.1,
+                             p_A = 0.062,
+                             p_D = 0.02,
+                             N = 400,
+                             gamma = 0.9,
+                             alpha = 0.15,
+                             discretization = 400,
+                             interpolate = interpolate)
+            s_f.run(verbose = False)
+
+            # Without interpolation, the policy is not exactly monotone, so
+            # this also exercises the fallback to the full search.
+            s_m = mdp_solver(dist = uniform_distribution(0, 1),
+                             sigma = 0.4,
+                             tau = 0.1,
+                             p_A = 0.062,
+                             p_D = 0.02,
+                             N = 400,
+                             gamma = 0.9,
+                             alpha = 0.15,
+                             discretization = 400,
+                             interpolate = interpolate)
+            s_m.run(verbose = False, monotone = True)
+
+            self.assertLess(np.max(np.abs(s_m.V - s_f.V)), 1e-3)
+            if interpolate:
+                self.assertLess(np.max(np.abs(s_m.theta_0 - s_f.theta_0)[1:]),
+                                3 * s_f.sigma / s_f.discretization)
+
+
+    def test_finite_horizon(self):
+        s = mdp_solver(dist = normal_distribution(0.5, 0.05),
+                       sigma = 0.4,
+                       tau = 0.05,
+                       p_A = 0.062,
+                       p_D = 0.02,
+                       N = 200,
+                       gamma = 0.8,
+                       alpha = 0.05,
+                       discretization = 300,
+                       interpolate = True)
+
+        # With a single generation, the best policy is the myopic one
+        _, actions, V = s.run_finite_horizon(1)
+        self.assertEqual(actions.shape, (1, s.N + 1))
+        self.assertEqual(actions.dtype, np.int16)
+        np.testing.assert_array_equal(actions[0],
+                                      s.offset + (s.R * s.mask).argmax(axis = 1))
+        np.testing.assert_allclose(V, (s.R * s.mask).max(axis = 1))
+
+        # Over a long horizon, the first policies approach the
+        # infinite-horizon ones
+        _, actions, V = s.run_finite_horizon(100)
+        s.run(epsilon = 1e-8, verbose = False)
+        self.assertLess(np.max(np.abs(V - s.V)), 1e-6)
+        np.testing.assert_array_equal(actions[0] * s.sigma / s.discretization,
+                                      s.theta_0)
+
+        # Streaming to disk gives the same policies
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "actions.npy")
+            _, streamed, _ = s.run_finite_horizon(100, path = path)
+            del streamed
+            np.testing.assert_array_equal(np.load(path, mmap_mode = "r"),
+                                          actions)
+
+
+    def make_small_solver(self, interpolate):
+        return mdp_solver(dist = uniform_distribution(0, 1),
+                          sigma = 0.4,
+                          tau = 0.1,
+                          p_A = 0.062,
+                          p_D = 0.02,
+                          N = 300,
+                          gamma = 0.9,
+                          alpha = 0.15,
+                          discretization = 300,
+                          interpolate = interpolate)
+
+
+    @unittest.skipUnless(kernels.available, "numba is not installed")
+    def test_numba_backend(self):
+        for interpolate in [True, False]:
+            s_np = self.make_small_solver(interpolate)
+            s_np.run(verbose = False)
+            s_nb = self.make_small_solver(interpolate)
+            s_nb.run(verbose = False, backend = "numba")
+            self.assertLess(np.max(np.abs(s_nb.V - s_np.V)), 1e-3)
+
+
+    def test_numba_fallback(self):
+        available = kernels.available
+        kernels.available = False
+        try:
+            s = self.make_small_solver(True)
+            with self.assertWarns(UserWarning):
+                s.run(verbose = False, backend = "numba")
+        finally:
+            kernels.available = available
+        s_np = self.make_small_solver(True)
+        s_np.run(verbose = False)
+        np.testing.assert_array_equal(s.V, s_np.V)
+
+
+    def test_threads(self):
+        for interpolate in [True, False]:
+            s_1 = self.make_small_solver(interpolate)
+            s_1.run(verbose = False)
+            s_n = self.make_small_solver(interpolate)
+            s_n.run(verbose = False, n_threads = 3)
+            # Threads only split the work, so the results are identical
+            np.testing.assert_array_equal(s_n.Q, s_1.Q)
+            np.testing.assert_array_equal(s_n.theta_0, s_1.theta_0)
+
+
+    def test_analytic(self):
+        for p_A, p_D, gamma, bounds in [(0, 0, 0.8, False),
+                                        (0.3, 0.2, 0.95, False),
+                                        (0.1, 0.05, 0.9, True)]:
+            kwargs = dict(dist = uniform_distribution(0, 1),
+                          sigma = 0.9 if bounds else 0.4,
+                          tau = 0.05,
+                          p_A = p_A,
+                          p_D = p_D,
+                          N = 300,
+                          gamma = gamma,
+                          alpha = 0.1,
+                          discretization = 500)
+            if bounds:
+                kwargs["action_bounds"] = (np.full(301, 200),
+                                           np.full(301, 400))
+            s_t = mdp_solver(**kwargs)
+            s_t.run(verbose = False)
+            s_a = mdp_solver(analytic = True, **kwargs)
+            s_a.run(verbose = False)
+            self.assertIsNone(s_a.Q)
+            self.assertLess(len(s_a.region_states), s_t.mask.sum() / 5)
+
+            # The same values, and the policies are optimal in the tables
+            np.testing.assert_array_equal(s_a.V, s_t.V)
+            policies = np.rint(s_a.theta_0 * s_a.discretization /
+                               s_a.sigma).astype(int)
+            states = np.arange(s_t.N + 1)
+            np.testing.assert_array_equal(
+                s_t.Q[states, policies - s_t.offset], s_t.V)
+
+            _, _, V_t = s_t.run_finite_horizon(5)
+            _, _, V_a = s_a.run_finite_horizon(5)
+            np.testing.assert_array_equal(V_a, V_t)
+
+        # Redistribution only rebuilds the regions
+        s_r = s_a.with_redistribution(p_A = 0, p_D = 0)
+        s_r.run(verbose = False)
+        s_f = mdp_solver(**{**kwargs, "p_A": 0, "p_D": 0})
+        s_f.run(verbose = False)
+        np.testing.assert_array_equal(s_r.V, s_f.V)
+
+
+    def test_stochastic(self):
+        from scipy.stats import binom
+
+        kwargs = dict(dist = uniform_distribution(0, 1),
+                      sigma = 0.4,
+                      tau = 0.1,
+                      p_A = 0.3,
+                      p_D = 0.2,
+                      N = 40,
+                      gamma = 0.8,
+                      alpha = 0.15,
+                      discretization = 100)
+        s = mdp_solver(stochastic = True, **kwargs)
+        np.testing.assert_allclose(np.asarray(s.P.sum(axis = 1)).ravel(), 1)
+
+        # Against the exact distribution of the number of unprivileged agents
+        # in the next generation, for a state and policy
+        i, j = 20, 80
+        r = np.flatnonzero((s.P_pairs[0] == i) & (s.P_pairs[1] == j))[0]
+        kernel = s.P[r].toarray().ravel()
+        N = s.N
+        theta = j * s.sigma / s.discretization
+        q = 1 - s.dist.phi_0_post(theta, i / N, s.sigma) / (i / N)
+        exact = np.zeros(N + 1)
+        for m in range(i + 1):
+            leave = binom.pmf(np.arange(m + 1), m, s.p_D * (1 - m / N))
+            join = binom.pmf(np.arange(N - m + 1), N - m, s.p_A * m / N)
+            # `m - leave + join` unprivileged agents
+            exact[:N + 1] += binom.pmf(i - m, i, q) * \
+                             np.convolve(leave[::-1], join)[:N + 1]
+        states = np.arange(N + 1)
+        self.assertLess(0.5 * np.abs(kernel - exact).sum(), 0.05)
+        self.assertLess(abs(kernel @ states - exact @ states), 0.5)
+
+        # Fluctuations only change the values a little
+        s = mdp_solver(stochastic = True, **{**kwargs, "N": 100})
+        s.run(verbose = False)
+        s_m = mdp_solver(interpolate = True, **{**kwargs, "N": 100})
+        s_m.run(verbose = False)
+        self.assertLess(np.max(np.abs(s.V - s_m.V)), 1e-2)
+
+        # Redistribution rebuilds the kernel
+        s_r = s.with_redistribution(p_A = 0, p_D = 0)
+        s_f = mdp_solver(stochastic = True,
+                         **{**kwargs, "N": 100, "p_A": 0, "p_D": 0})
+        self.assertEqual((s_r.P != s_f.P).nnz, 0)
+        _, _, V = s_r.run_finite_horizon(200)
+        s_f.run(epsilon = 1e-8, verbose = False)
+        self.assertLess(np.max(np.abs(V - s_f.V)), 1e-6)
+
+
+    def test_memory_budget(self):
+        import tracemalloc
+
+        kwargs = dict(dist = normal_distribution(0.5, 0.1),
+                      sigma = 0.4,
+                      tau = 0.1,
+                      p_A = 0.062,
+                      p_D = 0.02,
+                      N = 400,
+                      gamma = 0.8,
+                      alpha = 0.15,
+                      discretization = 400)
+        for extra in [dict(interpolate = True), dict(stochastic = True)]:
+            s = mdp_solver(**kwargs, **extra)
+            # One state per block, written straight into memory-mapped tables
+            with tempfile.TemporaryDirectory() as tmp:
+                # Files of tables that aren't kept are removed
+                for name in ("Q", "W"):
+                    open(os.path.join(tmp, name + ".npy"), "wb").close()
+                s_b = mdp_solver(memory_budget = 1, table_dir = tmp,
+                                 **kwargs, **extra)
+                self.assertEqual(len(s_b._blocks()), s.N + 1)
+                self.assertIsInstance(s_b.R, np.memmap)
+                self.assertNotIsInstance(s_b.Q, np.memmap)
+                self.assertEqual(sorted(os.listdir(tmp)),
+                                 sorted(name + ".npy"
+                                        for name in ("R", "S", "W", "mask")
+                                        if getattr(s, name) is not None))
+                for name in ("R", "S", "W", "mask"):
+                    if getattr(s, name) is not None:
+                        np.testing.assert_array_equal(getattr(s_b, name),
+                                                      getattr(s, name))
+                        np.testing.assert_array_equal(
+                            np.load(os.path.join(tmp, name + ".npy")),
+                            getattr(s, name))
+                if s.P is not None:
+                    self.assertEqual((s_b.P != s.P).nnz, 0)
+                del s_b
+
+        # Temporaries stay small next to the tables
+        tracemalloc.start()
+        s = mdp_solver(memory_budget = 2 ** 16, **kwargs)
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.assertGreaterEqual(size, 3 * s.R.nbytes)
+        self.assertLess(peak - size, 2 ** 20)
+
+
+    def test_checkpoint(self):
+        kwargs = dict(dist = uniform_distribution(0, 1),
+                      sigma = 0.4,
+                      tau = 0.1,
+                      p_A = 0.062,
+                      p_D = 0.02,
+                      N = 100,
+                      gamma = 0.95,
+                      alpha = 0.15,
+                      discretization = 100)
+
+        class killed(Exception):
+            pass
+
+        # Makes `solver` get killed after 23 iterations of `run`
+        def kill_after_23(solver):
+            record = solver._record
+            def kill(max_e, values):
+                record(max_e, values)
+                if len(solver.residuals) == 23:
+                    raise killed()
+            solver._record = kill
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "checkpoint.npz")
+            for extra in [dict(), dict(analytic = True)]:
+                s = mdp_solver(**kwargs, **extra)
+                _, theta_0, _ = s.run(verbose = False)
+
+                s_k = mdp_solver(**kwargs, **extra)
+                kill_after_23(s_k)
+                with self.assertRaises(killed):
+                    s_k.run(verbose = False, checkpoint = path,
+                            checkpoint_iterations = 5)
+                self.assertEqual(os.listdir(tmp), ["checkpoint.npz"])
+                with np.load(path) as checkpoint:
+                    np.testing.assert_array_equal(checkpoint["residuals"],
+                                                  s.residuals[:20])
+
+                # Resuming continues from iteration 20
+                s_r = mdp_solver(**kwargs, **extra)
+                _, theta_0_r, _ = s_r.run(verbose = False, checkpoint = path,
+                                          checkpoint_iterations = 5)
+                self.assertEqual(s_r.residuals[:20], s.residuals[:20])
+                self.assertLess(abs(len(s_r.residuals) - len(s.residuals)), 3)
+                np.testing.assert_allclose(s_r.V, s.V, rtol = 0,
+                                           atol = 1e-4 / (1 - s.gamma))
+                np.testing.assert_array_equal(theta_0_r, theta_0)
+
+                # The final checkpoint is converged
+                s_f = mdp_solver(**kwargs, **extra)
+                s_f.run(verbose = False, checkpoint = path)
+                self.assertEqual(len(s_f.residuals), len(s_r.residuals) + 1)
+                os.remove(path)
+
+            # Checkpoints can be saved by time, here after every iteration
+            s_k = mdp_solver(**kwargs)
+            kill_after_23(s_k)
+            with self.assertRaises(killed):
+                s_k.run(verbose = False, checkpoint = path,
+                        checkpoint_seconds = 0)
+            with np.load(path) as checkpoint:
+                self.assertEqual(len(checkpoint["residuals"]), 23)
+
+            # A checkpoint isn't resumed by a different problem
+            with self.assertRaises(ValueError):
+                mdp_solver(**{**kwargs, "gamma": 0.9}).run(
+                    verbose = False, checkpoint = path)
+
+            # A failed save leaves the checkpoint and no temporary file
+            directory = os.path.join(tmp, "directory.npz")
+            os.mkdir(directory)
+            files = sorted(os.listdir(tmp))
+            V = np.zeros(kwargs["N"] + 1)
+            with self.assertRaises(OSError):
+                _checkpoint(directory, "key").save([1.0], V)
+            self.assertEqual(sorted(os.listdir(tmp)), files)
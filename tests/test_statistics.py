@@ -0,0 +1,190 @@
+import unittest
+import random
+import numpy as np
+
+from aamodel.agent import agent, privilege
+from aamodel.generation import generation
+from aamodel.population import population, uniform_abilities
+from tests.helpers import helpers
+
+# Statistical tests for the random parts of the model. Every check compares a
+# count against the exact binomial distribution that it must follow, at
+# significance level `helpers.SIGNIFICANCE`, and every test runs many seeded
+# replicas in one process.
+#
+# With `n` draws, a check at significance `1e-6` accepts a frequency within
+# about `5 * sqrt(p * (1 - p) / n)` of `p`. With the sample sizes below, this
+# is about 0.01 for the `agent` and `generation` checks, and less than 0.002
+# for the `population` checks, so incorrect probabilities are caught in a
+# single run.
+
+# Seed of the replicas. Change it to get new draws.
+SEED = 2023
+
+
+class statistics_test(unittest.TestCase):
+    def setUp(self):
+        random.seed(SEED)
+
+
+    # Checks that `count` is a plausible draw from `Binomial(n, p)`.
+    def assertBinomial(self, count, n, p):
+        low, high = helpers.binomial_interval(n, p)
+        self.assertTrue(low <= count <= high,
+                        "{} successes out of {} for p = {} (expected "
+                        "[{}, {}])".format(count, n, p, low, high))
+
+
+    # Success rates of single agents given an opportunity
+    def test_agent_success(self):
+        n = 50000
+        for sigma, tau, c in [(0.5, 0.2, privilege.PRIVILEGED),
+                              (0.5, 0.2, privilege.NOT_PRIVILEGED),
+                              (0.3, 0.0, privilege.NOT_PRIVILEGED)]:
+            count = 0
+            for _ in range(n):
+                a = agent(a_dist = helpers.a_dist_best,
+                          c = c,
+                          sigma = sigma,
+                          tau = tau,
+                          p_A = 0,
+                          p_D = 0)
+                count += int(a.maybe_give_opportunity(0, 0))
+            p = sigma + (tau if c == privilege.PRIVILEGED else 0)
+            self.assertBinomial(count, n, p)
+
+
+    # Redistribution rates of single agents: privileged agents become
+    # unprivileged with probability `p_A * phi_0`, and unprivileged agents
+    # become privileged with probability `p_D * (1 - phi_0)`
+    def test_agent_redistribution(self):
+        n = 50000
+        for p_A, p_D, phi_0 in [(0.3, 0.6, 0.4), (0.9, 0.1, 0.8)]:
+            moved = {privilege.PRIVILEGED: 0, privilege.NOT_PRIVILEGED: 0}
+            for c in moved:
+                for _ in range(n):
+                    a = agent(a_dist = helpers.a_dist_uniform,
+                              c = c,
+                              sigma = 0,
+                              tau = 0,
+                              p_A = p_A,
+                              p_D = p_D)
+                    a.maybe_give_opportunity(1, 1)
+                    a.produce_offspring(phi_0)
+                    moved[c] += int(a.c != c)
+            self.assertBinomial(moved[privilege.PRIVILEGED], n, p_A * phi_0)
+            self.assertBinomial(moved[privilege.NOT_PRIVILEGED], n,
+                                p_D * (1 - phi_0))
+
+
+    # Successes of a generation, where unprivileged agents with uniform
+    # abilities are given opportunities iff `sigma * a >= theta_0`, so that
+    # each one succeeds with probability `sigma / 2 * (1 - (theta_0 / sigma)^2)`
+    def test_generation_success(self):
+        N = 50000
+        for sigma, theta_0 in [(0.4, 0.0), (0.4, 0.2), (0.9, 0.6)]:
+            g = generation(N = N,
+                           sigma = sigma,
+                           tau = 0.1,
+                           n_privileged = 0,
+                           p_A = 0,
+                           p_D = 0,
+                           a_dist = helpers.a_dist_uniform)
+            count = g.step(theta_0, 1)
+            p = sigma / 2 * (1 - (theta_0 / sigma) ** 2)
+            self.assertBinomial(count, N, p)
+            self.assertEqual(g.n_privileged, count)
+
+
+    # Redistribution in a generation without successes
+    def test_generation_redistribution(self):
+        N = 50000
+        for n_privileged, p_A, p_D in [(15000, 0.5, 0), (15000, 0, 0.5)]:
+            g = generation(N = N,
+                           sigma = 0,
+                           tau = 0,
+                           n_privileged = n_privileged,
+                           p_A = p_A,
+                           p_D = p_D,
+                           a_dist = helpers.a_dist_uniform)
+            phi_0 = g.phi_0
+            g.step(1, 1)
+            if p_D == 0:
+                self.assertBinomial(g.n_privileged, n_privileged,
+                                    1 - p_A * phi_0)
+            else:
+                self.assertBinomial(g.n_privileged - n_privileged,
+                                    N - n_privileged, p_D * (1 - phi_0))
+
+
+    # Many generations of many replicas of the vectorized population. Given
+    # the previous generation, the privileged agents of the next generation
+    # are the sum of two binomial counts; we check each one separately by
+    # choosing parameters where the other one vanishes.
+    def test_population(self):
+        N = 200000
+        n_generations = 5
+        n_replicas = 10
+        seeds = np.random.SeedSequence(SEED).spawn(n_replicas)
+        for seed in seeds:
+            # Only successes: unprivileged agents are given opportunities iff
+            # `0.5 * a >= 0.1`, and privileged agents never (`theta_1 = 1`)
+            p = population(N = N,
+                           sigma = 0.5,
+                           tau = 0.2,
+                           n_privileged = 0,
+                           p_A = 0,
+                           p_D = 0,
+                           a_dist = uniform_abilities,
+                           seed = seed)
+            for _ in range(n_generations):
+                n_unprivileged = N - p.n_privileged
+                n_successes = p.step(0.1, 1)
+                self.assertBinomial(n_successes, n_unprivileged,
+                                    0.25 * (1 - 0.2 ** 2))
+                self.assertEqual(p.n_privileged, N - n_unprivileged +
+                                 n_successes)
+
+            # Only redistribution, down and up
+            for p_A, p_D in [(0.7, 0), (0, 0.7)]:
+                p = population(N = N,
+                               sigma = 0,
+                               tau = 0,
+                               n_privileged = N // 2,
+                               p_A = p_A,
+                               p_D = p_D,
+                               a_dist = uniform_abilities,
+                               seed = seed)
+                for _ in range(n_generations):
+                    phi_0 = p.phi_0
+                    n_privileged = p.n_privileged
+                    p.step(1, 1)
+                    if p_D == 0:
+                        self.assertBinomial(p.n_privileged, n_privileged,
+                                            1 - p_A * phi_0)
+                    else:
+                        self.assertBinomial(p.n_privileged - n_privileged,
+                                            N - n_privileged,
+                                            p_D * (1 - phi_0))
+
+
+    # With a budget, the successes are those of the `budget` agents with the
+    # highest abilities (for `tau = 0`): the top `budget / N` fraction of
+    # uniform abilities, on average `sigma * (1 - budget / (2 * N))`
+    def test_budget(self):
+        N = 200000
+        budget = 30000
+        p = population(N = N,
+                       sigma = 0.8,
+                       tau = 0,
+                       n_privileged = 0,
+                       p_A = 0,
+                       p_D = 0,
+                       a_dist = uniform_abilities,
+                       seed = SEED)
+        abilities = np.sort(p.a)[-budget:]
+        n_successes = p.step(0, 0, budget = budget)
+        # Given the abilities, successes are independent with these
+        # probabilities, so their sum is close to binomial with the average
+        # probability (with a smaller variance)
+        self.assertBinomial(n_successes, budget, np.mean(0.8 * abilities))
@@ -1,110 +1,228 @@
-
 /*
  * PopulationVis - Object constructor function
- * @param _data					
+ * @param _parentElement	selector of the element to draw in
+ * @param _index			index of the exported simulation (flags, sizes)
+ * @param _renderer			"canvas" (default) or "svg"
+ *
+ * Agents are laid out once, in two groups by their privilege in the first
+ * generation (privileged on the left, unprivileged on the right), so the
+ * animation shows how the groups mix over the generations. After that, a
+ * generation only changes the colors of the agents.
+ *
+ * The "svg" renderer draws one circle per agent and is meant for small
+ * populations. The "canvas" renderer draws every agent as a small square into
+ * a single pixel buffer, and per generation only rewrites the colors of the
+ * agents whose flags changed, so it animates 10^4 to 10^5 agents smoothly.
+ * Agents get at least one pixel each, so with more agents than fit into the
+ * window, the drawing area grows downwards and the page scrolls.
  */
 
+// Colors of privileged and unprivileged agents, and of agents that were given
+// an opportunity (lighter) or succeeded (white)
+const COLORS = {
+	privileged: '#EC7063',
+	unprivileged: '#a2dbc0',
+	privilegedGiven: '#f5b7b1',
+	unprivilegedGiven: '#d4efdf',
+	succeeded: '#ffffff'
+};
+
 class PopulationVis {
 
 
-	constructor(_data) {
-		this.data = _data;
+	constructor(_parentElement, _index, _renderer = "canvas") {
+		this.parentElement = _parentElement;
+		this.index = _index;
+		this.renderer = _renderer;
+		this.data = [];
 
 		this.initVis();
 	}
 
 
 	/*
-	 * Initialize visualization (static content, e.g. SVG area or axes)
+	 * Initialize visualization (static content, e.g. the drawing area)
 	 */
 
 	initVis() {
 		let vis = this;
-		console.log(vis.data)
 
 		vis.margin = { top: 40, right: 0, bottom: 60, left: 60 };
 
-		
-		vis.width = window.innerWidth - vis.margin.left - vis.margin.right;
-    	vis.height = window.innerHeight - vis.margin.top - vis.margin.bottom;
-
-		// SVG drawing area
-		vis.svg = d3.select("#population").append("svg")
-			.attr("width", vis.width + vis.margin.left + vis.margin.right)
-			.attr("height", vis.height + vis.margin.top + vis.margin.bottom)
-			.append("g")
-			.attr("transform", "translate(" + vis.margin.left + "," + vis.margin.top + ")");
-
-        vis.x = d3.scaleOrdinal()
-            .domain([1, 2, 3])
-            .range([50, 200, 340])
-
-		vis.node = vis.svg.append("g")
-		.selectAll("circle")
-		.data(vis.data)
-		.enter()
-		.append("circle")
-		.merge(vis.svg)
-		//.transition()
-		.attr("r", 29)
-		.attr("cx", vis.width / 2)
-		.attr("cy", vis.height / 2)
-		.style("fill", function(d){ 
-			if(d.advantage == 1){
-				return '#EC7063';
-			}     
-			else{
-				return '#a2dbc0';
+		vis.width = Math.floor(window.innerWidth - vis.margin.left - vis.margin.right);
+		vis.height = Math.floor(window.innerHeight - vis.margin.top - vis.margin.bottom);
+
+		vis.caption = d3.select(vis.parentElement).append("p")
+			.attr("class", "caption");
+
+		if (vis.renderer == "canvas") {
+			vis.canvas = d3.select(vis.parentElement).append("canvas")
+				.attr("width", vis.width)
+				.attr("height", vis.height)
+				.style("margin-left", vis.margin.left + "px")
+				.node();
+			vis.context = vis.canvas.getContext("2d");
+			vis.createImage();
+			vis.colors = {};
+			for (let name in COLORS) {
+				vis.colors[name] = vis.packColor(COLORS[name]);
 			}
+		}
+		else {
+			// SVG drawing area
+			vis.svg = d3.select(vis.parentElement).append("svg")
+				.attr("width", vis.width + vis.margin.left + vis.margin.right)
+				.attr("height", vis.height + vis.margin.top + vis.margin.bottom)
+				.append("g")
+				.attr("transform", "translate(" + vis.margin.left + "," + vis.margin.top + ")");
+		}
+	}
+
+
+	/*
+	 * Creates the pixel buffer for the size of the canvas
+	 */
+
+	createImage() {
+		let vis = this;
+		vis.image = vis.context.createImageData(vis.width, vis.height);
+		// One 32-bit color per pixel, written directly into the image
+		vis.pixels = new Uint32Array(vis.image.data.buffer);
+	}
+
+
+	/*
+	 * Makes the drawing area `height` pixels high
+	 */
+
+	resize(height) {
+		let vis = this;
+		vis.height = height;
+		if (vis.renderer == "canvas") {
+			d3.select(vis.canvas).attr("height", height);
+			vis.createImage();
+		}
+		else {
+			d3.select(vis.svg.node().parentNode)
+				.attr("height", height + vis.margin.top + vis.margin.bottom);
+		}
+	}
+
+
+	/*
+	 * Packs a "#rrggbb" color into an opaque 32-bit pixel (the byte order of
+	 * `ImageData` is RGBA in memory, so little-endian words are ABGR)
+	 */
+
+	packColor(hex) {
+		let rgb = parseInt(hex.slice(1), 16);
+		let r = (rgb >> 16) & 255, g = (rgb >> 8) & 255, b = rgb & 255;
+		let bytes = new Uint8Array([r, g, b, 255]);
+		return new Uint32Array(bytes.buffer)[0];
+	}
+
+
+	/*
+	 * Group-based layout, computed once in O(n): the agents of each group
+	 * fill a grid in their half of the drawing area
+	 * @param snapshot		Uint8Array with the flags of the first generation
+	 */
+
+	layout(snapshot) {
+		let vis = this;
+		let n = snapshot.length;
+		let flags = vis.index.flags;
+
+		let groups = [[], []];
+		for (let i = 0; i < n; i++) {
+			groups[(snapshot[i] & flags.privileged) ? 0 : 1].push(i);
+		}
+
+		// The largest square cell such that both groups fit side by side
+		let gap = 20;
+		let half = (vis.width - gap) / 2;
+		let largest = Math.max(groups[0].length, groups[1].length, 1);
+		let cell = Math.sqrt(half * vis.height / largest);
+		while (cell > 1 && Math.floor(half / cell) *
+		       Math.floor(vis.height / cell) < largest) {
+			cell -= 0.5;
+		}
+		cell = Math.max(cell, 1);
+		let columns = Math.max(Math.floor(half / cell), 1);
+		// With more agents than pixels, not even one pixel per agent fits into
+		// the window, so the drawing area grows downwards instead
+		let rows = Math.ceil(largest / columns);
+		if (rows * cell > vis.height) {
+			vis.resize(Math.ceil(rows * cell));
+		}
+
+		vis.cell = cell;
+		vis.data = new Array(n);
+		groups.forEach(function(group, g){
+			let left = g * (half + gap);
+			group.forEach(function(i, k){
+				vis.data[i] = {
+					x: left + (k % columns + 0.5) * cell,
+					y: (Math.floor(k / columns) + 0.5) * cell,
+					advantage: 0,
+					given: false,
+					succeeded: false
+				};
+			})
 		})
-		// .merge()
-		// .transition()
-		.style("fill-opacity", 0.85)
-		.attr("stroke", "black")
-		.style("stroke-width", 4)
-		console.log("yello")
-		console.log(vis.node)
-			
-	vis.simulation = d3.forceSimulation()
-	.force("x", d3.forceX().strength(0.5).x(d => vis.x(d.group)))
-	.force("y", d3.forceY().strength(0.1).y(vis.height/2 ))
-	.force("center", d3.forceCenter().x(vis.width / 2).y(vis.height / 2)) // Attraction to the center of the svg area
-	.force("charge", d3.forceManyBody().strength(1)) // Nodes are attracted one each other of value is > 0
-	.force("collide", d3.forceCollide().strength(.1).radius(32).iterations(1)) // Force that avoids circle overlapping
-			
-	// Apply these forces to the nodes and update their positions.
-	// Once the force algorithm is happy with positions ('alpha' value is low enough), simulations will stop.
-	vis.simulation
-		.nodes(vis.data)
-		.on("tick", function(d){
-			vis.node
+
+		if (vis.renderer == "canvas") {
+			// The pixels of every agent: a square of `size` pixels starting at
+			// pixel `start[i]`
+			vis.size = Math.max(Math.floor(cell) - (cell >= 3 ? 1 : 0), 1);
+			vis.start = new Int32Array(n);
+			for (let i = 0; i < n; i++) {
+				let x = Math.floor(vis.data[i].x - cell / 2);
+				let y = Math.floor(vis.data[i].y - cell / 2);
+				vis.start[i] = y * vis.width + x;
+			}
+			// The flags that every agent is drawn with (none yet)
+			vis.drawn = new Uint8Array(n).fill(255);
+			vis.palette = vis.createPalette();
+		}
+		else {
+			vis.node = vis.svg.append("g")
+				.selectAll("circle")
+				.data(vis.data)
+				.enter()
+				.append("circle")
+				.attr("r", cell * 0.4)
 				.attr("cx", d => d.x)
 				.attr("cy", d => d.y)
-		});
-		// (modify data)
-		vis.wrangleData(0);
+				.style("fill-opacity", 0.85);
+		}
 	}
 
 
 
 	/*
-	 * Data wrangling
+	 * Data wrangling: decodes the flags of one generation
+	 * @param snapshot		Uint8Array with the flags of every agent
+	 * @param generation	statistics of the generation from the index
+	 * @param t				the generation number
 	 */
 
-	wrangleData(selected) {
+	wrangleData(snapshot, generation, t) {
 		let vis = this;
 
+		if (vis.data.length == 0) {
+			vis.layout(snapshot);
+		}
+		vis.snapshot = snapshot;
+		vis.generation = generation;
+		vis.t = t;
 
-		// Update the data
-		if(selected == 1){
-			vis.data.forEach(function(d){
-				let rand = Math.random();
-				if(rand < 0.5){
-					d.advantage = 1
-				}
-				else{
-					d.advantage = 0
-				}
+		if (vis.renderer == "svg") {
+			let flags = vis.index.flags;
+			vis.data.forEach(function(d, i){
+				d.advantage = (snapshot[i] & flags.privileged) ? 1 : 0;
+				d.given = (snapshot[i] & flags.given) != 0;
+				d.succeeded = (snapshot[i] & flags.succeeded) != 0;
 			})
 		}
 
@@ -115,28 +233,92 @@ class PopulationVis {
 
 
 	/*
-	 * The drawing function - should use the D3 update sequence (enter, update, exit)
-	 * Function parameters only needed if different kinds of updates are needed
+	 * The drawing function: privileged agents are red, unprivileged agents
+	 * are green, agents given an opportunity are lighter, and agents that
+	 * succeeded are white
 	 */
 
 	updateVis() {
 		let vis = this;
-		
-		vis.svg.selectAll('circle')
-		.data(vis.data)
-		.style("fill", function(d){ 
-			if(d.advantage == 1){
-				return '#EC7063';
-			}     
-			else{
-				return '#a2dbc0';
-			}
-		})
 
+		if (vis.renderer == "canvas") {
+			vis.drawCanvas();
+		}
+		else {
+			vis.node
+				.style("fill", function(d){
+					if (d.succeeded) {
+						return COLORS.succeeded;
+					}
+					if(d.advantage == 1){
+						return d.given ? COLORS.privilegedGiven : COLORS.privileged;
+					}
+					else{
+						return d.given ? COLORS.unprivilegedGiven : COLORS.unprivileged;
+					}
+				});
+		}
+
+		let text = "Generation " + vis.t + ": unprivileged fraction " +
+			vis.generation.phi_0.toFixed(3);
+		if (vis.generation.theta_0 !== undefined) {
+			text += ", thresholds " + vis.generation.theta_0.toFixed(3) +
+				" / " + (vis.generation.theta_1 === null ? "none" :
+				         vis.generation.theta_1.toFixed(3)) +
+				", " + vis.generation.n_successes + " successes";
+		}
+		vis.caption.text(text);
+	}
+
+
+	/*
+	 * Returns the color of every combination of flags
+	 */
+
+	createPalette() {
+		let vis = this;
+		let flags = vis.index.flags;
+		let colors = vis.colors;
+		let palette = new Uint32Array(8);
+		for (let f = 0; f < 8; f++) {
+			let privileged = (f & flags.privileged) != 0;
+			let given = (f & flags.given) != 0;
+			if (f & flags.succeeded) {
+				palette[f] = colors.succeeded;
+			}
+			else if (privileged) {
+				palette[f] = given ? colors.privilegedGiven : colors.privileged;
+			}
+			else {
+				palette[f] = given ? colors.unprivilegedGiven : colors.unprivileged;
+			}
+		}
+		return palette;
+	}
 
-		vis.svg.exit().remove();
 
-		
+	/*
+	 * Rewrites the colors of the agents whose flags changed since they were
+	 * last drawn, and copies the buffer to the canvas in one call
+	 */
 
+	drawCanvas() {
+		let vis = this;
+		let pixels = vis.pixels, start = vis.start, size = vis.size;
+		let width = vis.width, snapshot = vis.snapshot;
+		let palette = vis.palette, drawn = vis.drawn;
+		for (let i = 0; i < snapshot.length; i++) {
+			let f = snapshot[i] & 7;
+			if (f == drawn[i]) {
+				continue;
+			}
+			drawn[i] = f;
+			let color = palette[f];
+			let p = start[i];
+			for (let dy = 0; dy < size; dy++, p += width) {
+				pixels.fill(color, p, p + size);
+			}
+		}
+		vis.context.putImageData(vis.image, 0, 0);
 	}
-}
\ No newline at end of file
+}
@@ -1,22 +1,164 @@
-selected = 0
-// randomly generate data
-all_data = []
-for (let i = 0; i < 20; i++){
-    let rand = Math.random();
-    let entry = {
-        advantage: 1,
+// The visualization animates a simulation of the model: an index (JSON) and
+// the snapshots (one byte of flags per agent, generation after generation).
+// When the page is served by `python -m aamodel.server`, "Simulate" asks the
+// local solver service for a simulation with the parameters of the controls.
+// Otherwise, it animates the simulation precomputed by `python -m
+// aamodel.export` into `data/`. Nothing is simulated in the browser.
+const DATA_DIR = "data/"
+const STEP_MS = 500
+// Populations larger than this are drawn on a canvas instead of with SVG
+// circles (`?renderer=svg` or `?renderer=canvas` in the URL overrides it)
+const SVG_MAX_AGENTS = 2000
+// Solves requested from the service are small, so that they take a moment
+const SERVICE_SOLVE = { N: 200, discretization: 400, gamma: 0.8, sigma: 0.4 }
+const SERVICE_AGENTS = 2000
+const SERVICE_GENERATIONS = 50
+
+let index = null
+let snapshots = null
+let loaded = 0
+let selected = 0
+let timer = null
+let population = null
+// Bumped by every load, so that a superseded load stops streaming
+let loading = 0
+
+// Number of generations whose snapshots have been fully loaded
+function available() {
+    return Math.floor(loaded / index.n_agents)
+}
+
+function show(t) {
+    let n = index.n_agents
+    selected = t
+    population.wrangleData(snapshots.subarray(t * n, (t + 1) * n),
+                           index.generations[t], t)
+}
+
+// Loads a simulation from its index, streaming the snapshots from `baseUrl` +
+// `index.data` and showing the first generation as soon as it arrives
+async function loadSimulation(simulation, baseUrl) {
+    let current = ++loading
+    clearInterval(timer)
+    index = simulation
+    loaded = 0
+    let renderer = new URLSearchParams(window.location.search).get("renderer")
+    if (renderer == null) {
+        renderer = index.n_agents > SVG_MAX_AGENTS ? "canvas" : "svg"
+    }
+    d3.select("#population").selectAll("*").remove()
+    population = new PopulationVis("#population", index, renderer)
+    snapshots = new Uint8Array(index.n_agents * index.n_generations)
+
+    let response = await fetch(baseUrl + index.data)
+    let reader = response.body.getReader()
+    while (true) {
+        let { done, value } = await reader.read()
+        if (done || current != loading) {
+            break
+        }
+        let before = available()
+        snapshots.set(value, loaded)
+        loaded += value.length
+        if (before == 0 && available() > 0) {
+            show(0)
+        }
+    }
+}
+
+// Loads the precomputed simulation
+async function load() {
+    let simulation = await (await fetch(DATA_DIR + "simulation.json")).json()
+    await loadSimulation(simulation, DATA_DIR)
+}
+
+// The parameters of the controls
+function parameters() {
+    let params = Object.assign({}, SERVICE_SOLVE)
+    document.querySelectorAll("#controls input").forEach(function(input) {
+        params[input.name] = parseFloat(input.value)
+    })
+    params.dist = document.querySelector("#controls select").value
+    if (params.dist == "normal") {
+        params.sd = 0.1
     }
-    if(rand > 0.5){
-        entry.advantage = 0
+    return params
+}
+
+// Asks the service for a simulation with the parameters of the controls.
+// Returns false if there is no service (e.g. the page is served statically).
+async function simulate() {
+    let response
+    try {
+        response = await fetch("api/simulate", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ params: parameters(),
+                                   agents: SERVICE_AGENTS,
+                                   generations: SERVICE_GENERATIONS })
+        })
+    } catch (error) {
+        return false
+    }
+    if (response.status == 404 || response.status == 405 ||
+        response.status == 501) {
+        return false
+    }
+    let body = await response.json()
+    if (!response.ok) {
+        document.querySelector("#status").textContent = body.error
+        return true
+    }
+    document.querySelector("#status").textContent = ""
+    loadSimulation(body, "")
+    await waitFor(() => index == body && available() > 0)
+    return true
+}
+
+function waitFor(condition) {
+    return new Promise(function(resolve) {
+        let check = setInterval(function() {
+            if (condition()) {
+                clearInterval(check)
+                resolve()
+            }
+        }, 20)
+    })
+}
+
+// Animates the simulation from the first generation (waits for generations
+// that are still loading)
+function animate() {
+    if (index == null || available() == 0) {
+        return
+    }
+    clearInterval(timer)
+    show(0)
+    timer = setInterval(function() {
+        if (selected + 1 >= index.n_generations) {
+            clearInterval(timer)
+        } else if (selected + 1 < available()) {
+            show(selected + 1)
+        }
+    }, STEP_MS)
+}
+
+// Simulates with the current parameters if the service is available, and
+// animates the precomputed simulation otherwise
+async function update() {
+    let served = await simulate()
+    if (!served) {
+        document.querySelector("#status").textContent =
+            "No solver service: showing the precomputed simulation"
     }
-    all_data.push(entry)
+    animate()
 }
 
-var population = new PopulationVis(all_data)
-//var lineGraph = new LineVis(all_data)
+// Shows the value of every slider next to it
+document.querySelectorAll("#controls input").forEach(function(input) {
+    let value = input.parentElement.querySelector(".value")
+    input.addEventListener("input", () => value.textContent = input.value)
+    value.textContent = input.value
+})
 
-function update(){
-    console.log("a")
-    selected = 1
-    population.wrangleData(selected);
-}
\ No newline at end of file
+load()